@@ -0,0 +1,110 @@
+"""
+Measures the cold start of the Lambda: every run is a fresh interpreter timing `import app`, `import handler` and
+the first and second DynamoStore construction, followed by the heaviest imports reported by -X importtime.
+No AWS call is made, boto3 resources only connect on their first request.
+
+    python benchmarks/bench_cold_start.py [--runs 10] [--mercury-path <other checkout>/lambdas/mercury]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from common import MERCURY_PATH
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+app_imported = time.perf_counter()
+import handler
+handler_imported = time.perf_counter()
+from persistence.DynamoStore import DynamoStore
+DynamoStore(app.AWS_TABLE_NAME)
+first_store = time.perf_counter()
+DynamoStore(app.AWS_TABLE_NAME)
+second_store = time.perf_counter()
+print(json.dumps({
+    "import app": app_imported - started,
+    "import handler": handler_imported - app_imported,
+    "first DynamoStore()": first_store - handler_imported,
+    "second DynamoStore()": second_store - first_store,
+}))
+"""
+
+
+def _environment(mercury_path: str) -> dict:
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = mercury_path
+    environment.setdefault('AWS_TABLE_NAME', 'benchmark')
+    environment.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    # boto3 must not look for credentials on the network
+    environment.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    environment.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+    environment['PYTHONDONTWRITEBYTECODE'] = '1'
+    return environment
+
+
+def measure(mercury_path: str, runs: int) -> dict:
+    """
+    :return: stage -> median seconds over the runs
+    """
+    timings = {}
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE], env=_environment(mercury_path), cwd=mercury_path,
+                                check=True, capture_output=True, text=True).stdout
+        for stage, seconds in json.loads(output.splitlines()[-1]).items():
+            timings.setdefault(stage, []).append(seconds)
+    return {stage: statistics.median(values) for stage, values in timings.items()}
+
+
+def heaviest_imports(mercury_path: str, top: int) -> list:
+    """
+    :return: (cumulative microseconds, module) of the modules imported by handler, heaviest first
+    """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import handler'],
+                            env=_environment(mercury_path), cwd=mercury_path, check=True,
+                            capture_output=True, text=True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        # the modules handler imports itself, every nesting level is indented by two more spaces
+        if cumulative.strip().isdigit() and len(module) - len(module.lstrip()) == 3:
+            imports.append((int(cumulative), module.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def report(title: str, mercury_path: str, runs: int, top: int) -> dict:
+    timings = measure(mercury_path, runs)
+    print(f'{title} ({mercury_path}), median of {runs} fresh interpreters')
+    for stage, seconds in timings.items():
+        print(f'  {stage:22s} {seconds * 1000:8.1f} ms')
+    print('  heaviest imports:')
+    for cumulative, module in heaviest_imports(mercury_path, top):
+        print(f'    {module:38s} {cumulative / 1000:8.1f} ms')
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=8)
+    parser.add_argument('--mercury-path', help='lambdas/mercury of another checkout to compare with')
+    args = parser.parse_args()
+
+    current = report('current', MERCURY_PATH, args.runs, args.top)
+    if args.mercury_path:
+        other = report('other', os.path.abspath(args.mercury_path), args.runs, args.top)
+        print('other / current')
+        for stage in current:
+            if stage in other and current[stage] > 0:
+                print(f'  {stage:22s} {other[stage] / current[stage]:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Compares DictUtils.clean_documents with the recursive cleaner it replaced, on IEX-like symbol documents.
+
+    python benchmarks/bench_document_cleaner.py [--documents 1000]
+"""
+
+import argparse
+import copy
+import random
+from decimal import Decimal
+
+from common import best_of, setup_path
+
+setup_path()
+
+from app.util.DictUtils import DictUtils  # noqa: E402
+
+
+def legacy_clean(dict_to_process: dict) -> dict:
+    """
+    The former DynamoStore.remove_empty_strings walk, without its Results wrapping
+    """
+    for key in list(dict_to_process.keys()):
+        value = dict_to_process[key]
+        if isinstance(value, (str, dict, list, tuple, type(None))) and not value:
+            del dict_to_process[key]
+        elif type(value) is dict:
+            processed_dict = legacy_clean(value)
+            if processed_dict:
+                dict_to_process[key] = processed_dict
+            else:
+                del dict_to_process[key]
+        elif isinstance(value, (float, list, tuple)):
+            dict_to_process[key] = legacy_to_dynamo_numbers(value)
+    return dict_to_process
+
+
+def legacy_to_dynamo_numbers(value):
+    if type(value) is float:
+        return Decimal(str(value))
+    if isinstance(value, (list, tuple)):
+        return [legacy_to_dynamo_numbers(item) for item in value]
+    if type(value) is dict:
+        return {key: legacy_to_dynamo_numbers(item) for key, item in value.items()}
+    return value
+
+
+def legacy_cleanup(documents: list) -> list:
+    """
+    The former DynamoStore.cleanup_symbol_documents: clean, then filter in a second pass
+    """
+    cleaned = [legacy_clean(document) for document in documents]
+    return [document for document in cleaned if 'symbol' in document and 'date' in document]
+
+
+def make_document(index: int) -> dict:
+    rnd = random.Random(index)
+    return {
+        'symbol': f'S{index:04d}',
+        'date': '2020-06-01',
+        'company': {'companyName': f'Company {index}', 'description': '', 'tags': ['', 'Technology'],
+                    'employees': rnd.randint(1, 10 ** 5), 'website': None},
+        'quote': {field: rnd.random() * 1000 for field in ('latestPrice', 'open', 'close', 'high', 'low', 'peRatio')},
+        'financials': {'symbol': f'S{index:04d}', 'financials': [
+            {'reportDate': '2020-03-31', 'totalRevenue': rnd.random() * 1e9, 'grossProfit': rnd.random() * 1e8,
+             'researchAndDevelopment': None, 'operatingGainsLosses': '', 'notes': {'text': ''}}
+            for _ in range(4)]},
+        'book': {'bids': [], 'asks': [], 'trades': [{'price': rnd.random() * 100, 'size': rnd.randint(1, 500)}
+                                                    for _ in range(20)]},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--documents', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    documents = [make_document(index) for index in range(args.documents)]
+    # every run cleans fresh copies, the cleaners work in place
+    copies = [copy.deepcopy(documents) for _ in range(2 * args.repeat)]
+
+    legacy = best_of(lambda: legacy_cleanup(copies.pop()), args.repeat)
+    current = best_of(lambda: DictUtils.clean_documents(copies.pop(), required_keys=('symbol', 'date')), args.repeat)
+
+    print(f'{args.documents} documents, best of {args.repeat}')
+    print(f'  recursive cleanup:         {legacy * 1000:8.1f} ms')
+    print(f'  DictUtils.clean_documents: {current * 1000:8.1f} ms  ({legacy / current:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
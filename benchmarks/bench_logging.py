@@ -0,0 +1,129 @@
+"""
+Per-call logging overhead of an IEX fetch with 16 concurrent workers: the former synchronous setup (root handlers
+cleared and a formatter built by every get_logger call, records formatted and written on the worker threads)
+against the queue-based setup, with every record kept, with sampling and with INFO disabled.
+The fetch itself does nothing, what is timed is the logging around it; records go to a temporary file.
+
+    python benchmarks/bench_logging.py [--calls 2000] [--workers 16]
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from common import setup_path
+
+setup_path()
+
+import app  # noqa: E402
+from datawell.decorators import log_execution_time  # noqa: E402
+
+
+def legacy_get_logger(module_name: str, stream) -> logging.Logger:
+    """
+    The former app.get_logger, writing to stream instead of stderr
+    """
+    log_format = '%(asctime)s - %(name)s - %(process)d - [%(levelname)s] - %(message)s'
+    formatter = logging.Formatter(log_format, datefmt='%d-%b-%y %H:%M:%S')
+    app.clear_handlers(logging.getLogger())
+    logger = logging.getLogger(module_name)
+    logger.setLevel(logging.DEBUG)
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    return logger
+
+
+def legacy_log_execution_time(logger: logging.Logger):
+    """
+    The former log_execution_time: the record is always built
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            result = func(*args, **kwargs)
+            execution_time = int(round((time.perf_counter() - start_time) * 1000))
+            message_info = {"Type": "execution_time", "Execution_time": execution_time,
+                            "Function": {"Name": func.__name__, "Module": func.__module__}}
+            logger.info(f"{func.__name__}: Execution_time: {execution_time} ms, Category: ",
+                        extra={"message_info": message_info})
+            return result
+        return wrapper
+    return decorator
+
+
+def legacy_fetcher(stream):
+    def fetch(uri: str):
+        # every Iex and retry decorator used to set logging up again
+        logger = legacy_get_logger('bench.legacy', stream)
+        logger.info(f"Now retrieving from {app.BASE_API_URL}{uri}")
+        return uri
+    return legacy_log_execution_time(legacy_get_logger('bench.legacy', stream))(fetch)
+
+
+def current_fetcher():
+    logger = app.get_logger('bench.current')
+
+    @log_execution_time(logger, sampled=True)
+    def fetch(uri: str):
+        if app.should_log(logger, logging.INFO, sampled=True):
+            logger.info(f"Now retrieving from {app.BASE_API_URL}{uri}")
+        return uri
+    return fetch
+
+
+def run(fetch, calls: int, workers: int, flush=None) -> tuple:
+    """
+    :return: microseconds per call until the workers are done, and until what they queued is written as well
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(fetch, (f'stock/market/batch?page={page}' for page in range(calls))))
+    fetched = time.perf_counter()
+    if flush is not None:
+        flush()
+    finished = time.perf_counter()
+    return (fetched - started) / calls * 1e6, (finished - started) / calls * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--sample-rate', type=float, default=0.1)
+    args = parser.parse_args()
+
+    # the thread pool itself, subtracted from every measurement
+    bare = min(run(lambda uri: uri, args.calls, args.workers)[0] for _ in range(3))
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, 'legacy.log'), 'w') as legacy_stream, \
+                open(os.path.join(directory, 'current.log'), 'w') as current_stream:
+            legacy = run(legacy_fetcher(legacy_stream), args.calls, args.workers)
+
+            app.LOG_ASYNC = True
+            app.configure_logging(current_stream)
+            current = run(current_fetcher(), args.calls, args.workers, app.flush_logs)
+            app.LOG_SAMPLE_RATE = args.sample_rate
+            sampled = run(current_fetcher(), args.calls, args.workers, app.flush_logs)
+            app.LOG_LEVEL = 'WARNING'
+            disabled = run(current_fetcher(), args.calls, args.workers, app.flush_logs)
+
+    print(f'{args.calls} fetches on {args.workers} workers, logging overhead per fetch in us')
+    print(f'  {"":34s}  {"workers":>16s}  {"until written":>16s}')
+    overheads = [(title, [max(value - bare, 0.1) for value in values]) for title, values in (
+        ('synchronous, reconfigured per call', legacy), ('queued, every record', current),
+        (f'queued, {args.sample_rate:.0%} sampled', sampled), ('queued, INFO disabled', disabled))]
+    legacy = overheads[0][1]
+    for title, values in overheads:
+        columns = '  '.join(f'{value:8.1f} ({base / value:4.1f}x)' for value, base in zip(values, legacy))
+        print(f'  {title:34s}  {columns}')
+
+
+if __name__ == '__main__':
+    main()
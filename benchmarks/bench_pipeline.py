@@ -0,0 +1,259 @@
+"""
+Offline benchmark suite: Mercury runs against local stand-ins of IEX (fake_iex.py) and DynamoDB (fake_dynamo.py), no
+IEX token nor AWS account needed. Every stage is timed on its own and the Lambda handler end to end, results are
+printed and written as JSON, compare two of them with compare_results.py.
+
+    python benchmarks/bench_pipeline.py [--symbols 1000] [--iex-latency 0.05] [--iex-throttle-rate 0.02]
+        [--dynamo-write-capacity 5000] [--stages iex,clean,write] [--output results.json]
+
+Stages: iex (Iex loading every datapoint), clean (DictUtils.clean_documents), write (DynamoBatchWriter), query_date,
+query_symbol and scan (SymbolFilterCriteria), end_to_end and end_to_end_stream (lambda_handler, loading then storing
+or streaming batches into the store). Stages needing data (clean, write, queries) prepare it untimed when the stages
+producing it are not selected. Counters come from app.tracing and from the stand-ins; the handler logs and resets
+its own trace summary, so the end to end stages only report the stand-ins' counters.
+Throttled runs include Mercury's real backoff: IEX retries after --iex-retry-delay seconds (doubling), Dynamo writes
+after 1 s (doubling up to 60 s) while the write rate controller halves its rate, so keep throttled runs small.
+"""
+
+import argparse
+import copy
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date
+
+from common import MERCURY_PATH, setup_path
+from fake_dynamo import FakeDynamo
+from fake_iex import FakeIex
+
+STAGES = ['iex', 'clean', 'write', 'query_date', 'query_symbol', 'scan', 'end_to_end', 'end_to_end_stream']
+TABLE_NAME = 'benchmark'
+
+
+class Pipeline(object):
+    """
+    Runs the stages, sharing what they produce: loaded symbols, cleaned documents, a filled table
+    """
+    def __init__(self, args, iex: FakeIex, dynamo: FakeDynamo):
+        self.args = args
+        self.fakes = {'iex': iex, 'dynamo': dynamo}
+        self._symbols = None
+        self._documents = None
+        self._table = None
+
+    def run(self, stage: str) -> dict:
+        """
+        :return: timings of every repetition, units processed and counters of the last repetition
+        """
+        import app
+        from app import tracing
+
+        prepare, measure = getattr(self, f'_prepare_{stage}', None), getattr(self, f'_{stage}')
+        seconds = []
+        for _ in range(self.args.repeat):
+            state = prepare() if prepare else None
+            for fake in self.fakes.values():
+                fake.reset_stats()
+            tracing.get_tracer().summary(reset=True)
+            started = time.perf_counter()
+            units, unit = measure(state)
+            seconds.append(time.perf_counter() - started)
+            app.flush_logs()
+        median = statistics.median(seconds)
+        return {
+            'seconds': seconds,
+            'median_seconds': median,
+            'best_seconds': min(seconds),
+            'units': units,
+            'unit': unit,
+            'throughput': units / median if median else None,
+            'counters': tracing.get_tracer().summary(reset=True)['counters'],
+            'fakes': {name: fake.reset_stats() for name, fake in self.fakes.items()},
+        }
+
+    def symbols(self) -> list:
+        if self._symbols is None:
+            self._iex(None)
+        return self._symbols
+
+    def documents(self) -> list:
+        if self._documents is None:
+            self._clean(copy.deepcopy(self.symbols()))
+        return self._documents
+
+    def table(self):
+        if self._table is None:
+            self._write(self._items())
+        return self._table
+
+    def _iex(self, state) -> tuple:
+        from datawell.iex import Iex
+        from handler import DATAPOINTS
+
+        self._symbols = Iex(DATAPOINTS).Symbols
+        return len(self._symbols), 'symbols'
+
+    def _prepare_clean(self) -> list:
+        return copy.deepcopy(self.symbols())
+
+    def _clean(self, symbols: list) -> tuple:
+        from app.util.DictUtils import DictUtils
+
+        self._documents = DictUtils.clean_documents(symbols, required_keys=('symbol', 'date'))
+        return len(self._documents), 'documents'
+
+    def _items(self) -> list:
+        return [{'symbol': document['symbol'], 'date': document['date'], 'document': document}
+                for document in self.documents()]
+
+    def _prepare_write(self) -> list:
+        self._store()
+        return self._items()
+
+    @staticmethod
+    def _store():
+        from persistence.DynamoStore import DynamoStore
+
+        store = DynamoStore(TABLE_NAME)
+        store._ensure_table()
+        return store
+
+    def _write(self, items: list) -> tuple:
+        import app
+        from persistence.DynamoBatchWriter import DynamoBatchWriter, RetryConfig, WriteRateController
+
+        # configured as DynamoStore.store_document_batches configures it
+        store = self._store()
+        with DynamoBatchWriter(table=TABLE_NAME, dynamo_client=store.dynamoDb.meta.client, retries=RetryConfig(10),
+                               max_workers=app.MAX_PERSISTENCE_THREADS,
+                               rate_controller=WriteRateController(app.DYNAMO_WRITE_CAPACITY_UNITS)) as batch:
+            for item in items:
+                batch.put_item(Item=item)
+        self._table = store.table
+        return len(items), 'items'
+
+    def _query_date(self, state) -> tuple:
+        from persistence.DynamoStore import SymbolFilterCriteria
+
+        table = self.table()
+        return len(SymbolFilterCriteria(target_date=date.fromisoformat(self.args.date)).query(table)), 'items'
+
+    def _query_symbol(self, state) -> tuple:
+        from persistence.DynamoStore import SymbolFilterCriteria
+
+        table = self.table()
+        symbols = [symbol['symbol'] for symbol in self.symbols()[:self.args.symbol_queries]]
+        for symbol in symbols:
+            SymbolFilterCriteria(symbol_to_find=symbol).query(table)
+        return len(symbols), 'queries'
+
+    def _scan(self, state) -> tuple:
+        from persistence.DynamoStore import SymbolFilterCriteria
+
+        return len(SymbolFilterCriteria().query(self.table())), 'items'
+
+    def _end_to_end(self, state, stream_pipeline: bool = False) -> tuple:
+        import app
+        import handler
+
+        app.STREAM_PIPELINE = stream_pipeline
+        # a failing run exits the process, as it does in the Lambda
+        handler.lambda_handler()
+        return len(self.fakes['iex'].symbols), 'symbols'
+
+    def _end_to_end_stream(self, state) -> tuple:
+        return self._end_to_end(state, stream_pipeline=True)
+
+
+def _git_commit(path: str) -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=path, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _configure_environment(args, iex: FakeIex, dynamo: FakeDynamo) -> None:
+    """
+    Points Mercury at the stand-ins, app reads the environment when it is imported
+    """
+    os.environ.update({
+        'IEX_BASE_URL': iex.url,
+        'API_TOKEN': 'benchmark',
+        'AWS_DYNAMODB_ENDPOINT': dynamo.url,
+        'AWS_ACCESS_KEY_ID': 'benchmark',
+        'AWS_SECRET_ACCESS_KEY': 'benchmark',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_TABLE_NAME': TABLE_NAME,
+        'IEX_REQUESTS_PER_SECOND': str(args.iex_requests_per_second),
+        'IEX_RETRY_DELAY_SECONDS': str(args.iex_retry_delay),
+        'IEX_RETRY_MAX_DELAY_SECONDS': str(args.iex_retry_delay * 6),
+        'DYNAMO_WRITE_CAPACITY_UNITS': str(int(args.dynamo_write_capacity or 10 ** 6)),
+        'LOG_LEVEL': args.log_level,
+        'METRICS_SINK': 'none',
+        # every run loads and writes everything: no datapoint cache, no manifest
+        'DATAPOINT_CACHE_PATH': '',
+        'DOCUMENT_MANIFEST_PATH': '',
+    })
+    os.environ.pop('TEST_ENVIRONMENT', None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--stages', default=','.join(STAGES), help='comma separated, all by default')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--symbols', type=int, default=1000)
+    parser.add_argument('--payload-bytes', type=int, default=2048, help='JSON size of a datapoint of a symbol')
+    parser.add_argument('--date', default=str(date.today()), help='trading date of the listed symbols')
+    parser.add_argument('--iex-latency', type=float, default=0.05)
+    parser.add_argument('--iex-throttle-rate', type=float, default=0.0)
+    parser.add_argument('--iex-requests-per-second', type=float, default=100)
+    parser.add_argument('--iex-retry-delay', type=float, default=0.05, help='first IEX backoff in seconds')
+    parser.add_argument('--dynamo-latency', type=float, default=0.0)
+    parser.add_argument('--dynamo-write-capacity', type=float, help='WCU/s of the table, unlimited by default')
+    parser.add_argument('--dynamo-throttle-rate', type=float, default=0.0)
+    parser.add_argument('--symbol-queries', type=int, default=100)
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--mercury-path', default=MERCURY_PATH, help='lambdas/mercury of the checkout to benchmark')
+    parser.add_argument('--output', help='JSON file the results are written to')
+    args = parser.parse_args()
+    stages = [stage for stage in args.stages.split(',') if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f'unknown stages: {", ".join(sorted(unknown))}')
+
+    with FakeIex(args.symbols, args.payload_bytes, args.iex_latency, throttle_rate=args.iex_throttle_rate,
+                 trading_date=args.date) as iex, \
+            FakeDynamo(args.dynamo_write_capacity, args.dynamo_throttle_rate, args.dynamo_latency) as dynamo:
+        _configure_environment(args, iex, dynamo)
+        setup_path(os.path.abspath(args.mercury_path))
+        # imported upfront, so the first stage does not pay for the imports
+        import handler  # noqa: F401
+        pipeline = Pipeline(args, iex, dynamo)
+        results = {}
+        for stage in stages:
+            results[stage] = pipeline.run(stage)
+            result = results[stage]
+            print(f'{stage:18s} {result["median_seconds"]:8.3f} s  {result["throughput"] or 0:10.1f} '
+                  f'{result["unit"]}/s  {result["counters"]}', flush=True)
+
+    report = {
+        'commit': _git_commit(args.mercury_path),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'mercury_path')},
+        'stages': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,35 @@
+"""
+Shared helpers of the offline benchmarks: they import the Lambda code from lambdas/mercury, as the Lambda runtime does
+"""
+
+import os
+import sys
+import time
+from typing import Callable
+
+MERCURY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambdas', 'mercury')
+
+
+def setup_path(mercury_path: str = MERCURY_PATH) -> None:
+    """
+    Makes the Lambda packages (app, datawell, persistence) importable and sets the environment app expects
+    :param mercury_path: lambdas/mercury of the checkout to benchmark
+    """
+    if mercury_path not in sys.path:
+        sys.path.insert(0, mercury_path)
+    os.environ.setdefault('AWS_TABLE_NAME', 'benchmark')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+
+def best_of(func: Callable[[], object], repeat: int = 5) -> float:
+    """
+    :param func: code to time
+    :param repeat: number of runs
+    :return: fastest run in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
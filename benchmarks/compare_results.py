@@ -0,0 +1,55 @@
+"""
+Compares two bench_pipeline.py result files, e.g. of the base commit and of a change, stage by stage. Exits with 1
+when a stage got slower than the threshold allows, so it can gate a build.
+
+    python benchmarks/compare_results.py base.json change.json [--threshold 0.1]
+"""
+
+import argparse
+import json
+import sys
+
+
+def compare(base: dict, change: dict, threshold: float) -> list:
+    """
+    :return: stages which got slower by more than threshold (a share of the base median)
+    """
+    regressions = []
+    print(f'base   {base.get("commit") or "?"}\nchange {change.get("commit") or "?"}')
+    differing = {key: (value, change['config'].get(key)) for key, value in base['config'].items()
+                 if change['config'].get(key) != value and key != 'stages'}
+    if differing:
+        print(f'warning, configurations differ: {differing}')
+    print(f'{"stage":18s} {"base s":>9s} {"change s":>9s} {"change":>8s}  throughput')
+    for stage, result in change['stages'].items():
+        base_result = base['stages'].get(stage)
+        if base_result is None:
+            print(f'{stage:18s} {"-":>9s} {result["median_seconds"]:9.3f}')
+            continue
+        ratio = result['median_seconds'] / base_result['median_seconds'] - 1 if base_result['median_seconds'] else 0
+        flag = ''
+        if ratio > threshold:
+            regressions.append(stage)
+            flag = '  REGRESSION'
+        print(f'{stage:18s} {base_result["median_seconds"]:9.3f} {result["median_seconds"]:9.3f} {ratio:+8.1%}  '
+              f'{base_result["throughput"] or 0:.1f} -> {result["throughput"] or 0:.1f} {result["unit"]}/s{flag}')
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('base')
+    parser.add_argument('change')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed slowdown, 0.1 for 10%%')
+    args = parser.parse_args()
+
+    with open(args.base) as base, open(args.change) as change:
+        regressions = compare(json.load(base), json.load(change), args.threshold)
+    if regressions:
+        print(f'{len(regressions)} stages regressed by more than {args.threshold:.0%}: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
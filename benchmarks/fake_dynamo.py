@@ -0,0 +1,373 @@
+"""
+Local stand-in of the DynamoDB API Mercury uses, served over HTTP so boto3 talks to it as it talks to AWS: CreateTable,
+DescribeTable, BatchWriteItem, PutItem, BatchGetItem, Query and Scan with the key conditions, filters and projections
+DynamoStore builds. Writes can be throttled by a write capacity (items over it come back unprocessed) and any request
+by a share of ProvisionedThroughputExceededException answers. Point Mercury at it with AWS_DYNAMODB_ENDPOINT=<url>.
+
+    python benchmarks/fake_dynamo.py [--port 8901] [--write-capacity 1000] [--throttle-rate 0.01]
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+# Dynamo returns at most 1 MB per Query or Scan page
+PAGE_BYTES = 1024 * 1024
+CONDITION = re.compile(r'(#\w+) = (:\w+)|(#\w+) BETWEEN (:\w+) AND (:\w+)|begins_with\((#\w+), (:\w+)\)')
+
+
+class DynamoError(Exception):
+    def __init__(self, error_type: str, message: str = ''):
+        super().__init__(message)
+        self.error_type = error_type
+        self.message = message
+
+
+class FakeTable(object):
+    def __init__(self, definition: dict):
+        self.definition = definition
+        self.hash_key, self.range_key = self._key_schema(definition['KeySchema'])
+        self.indexes = {index['IndexName']: self._key_schema(index['KeySchema'])
+                        for index in definition.get('GlobalSecondaryIndexes', [])}
+        # (hash, range) -> (item, size); hash -> range -> key for the table and for every index
+        self.items: Dict[tuple, tuple] = {}
+        self.partitions: Dict[str, Dict[str, Dict[str, tuple]]] = {None: {}, **{name: {} for name in self.indexes}}
+
+    @staticmethod
+    def _key_schema(key_schema: List[dict]) -> tuple:
+        keys = {key['KeyType']: key['AttributeName'] for key in key_schema}
+        return keys['HASH'], keys.get('RANGE')
+
+    def key_of(self, item: dict, index: str = None) -> tuple:
+        hash_key, range_key = self.indexes[index] if index else (self.hash_key, self.range_key)
+        return _scalar(item.get(hash_key)), _scalar(item.get(range_key)) if range_key else None
+
+    def put(self, item: dict, size: int) -> None:
+        key = self.key_of(item)
+        previous = self.items.get(key)
+        if previous is not None:
+            self._unindex(previous[0], key)
+        self.items[key] = (item, size)
+        for index in self.partitions:
+            index_key = self.key_of(item, index)
+            if index_key[0] is not None:
+                self.partitions[index].setdefault(index_key[0], {})[index_key[1]] = key
+
+    def _unindex(self, item: dict, key: tuple) -> None:
+        for index in self.partitions:
+            index_key = self.key_of(item, index)
+            self.partitions[index].get(index_key[0], {}).pop(index_key[1], None)
+
+    def describe(self, status: str = 'ACTIVE') -> dict:
+        return {**self.definition, 'TableStatus': status, 'ItemCount': len(self.items),
+                'CreationDateTime': self.definition['CreationDateTime']}
+
+
+class FakeDynamo(object):
+    def __init__(self, write_capacity: float = None, throttle_rate: float = 0.0, latency: float = 0.0,
+                 host: str = '127.0.0.1', port: int = 0, seed: int = 0):
+        """
+        :param write_capacity: write capacity units per second of every table, unlimited if None
+        :param throttle_rate: share of requests answered with ProvisionedThroughputExceededException
+        :param latency: seconds every request waits before it is answered
+        :param port: 0 picks a free port
+        """
+        self.write_capacity = write_capacity
+        self.throttle_rate = throttle_rate
+        self.latency = latency
+        self.tables: Dict[str, FakeTable] = {}
+        self.stats = {'requests': 0, 'throttled': 0, 'unprocessed': 0, 'written': 0, 'read': 0}
+        self._random = random.Random(seed)
+        self._capacity = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeDynamo':
+        threading.Thread(target=self._server.serve_forever, name='fake-dynamo', daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'FakeDynamo':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def reset_stats(self) -> dict:
+        with self._lock:
+            stats, self.stats = self.stats, {key: 0 for key in self.stats}
+        return stats
+
+    def handle(self, operation: str, request: dict) -> dict:
+        with self._lock:
+            self.stats['requests'] += 1
+            throttled = self._random.random() < self.throttle_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled and operation not in ('CreateTable', 'DescribeTable'):
+            self._count('throttled')
+            raise DynamoError('ProvisionedThroughputExceededException', 'Throughput exceeds the provisioned capacity')
+        handler = getattr(self, f'_{operation}', None)
+        if handler is None:
+            raise DynamoError('UnknownOperationException', operation)
+        with self._lock:
+            return handler(request)
+
+    def _count(self, stat: str, value: int = 1) -> None:
+        with self._lock:
+            self.stats[stat] += value
+
+    def _table(self, name: str) -> FakeTable:
+        table = self.tables.get(name)
+        if table is None:
+            raise DynamoError('ResourceNotFoundException', f'Requested resource not found: Table: {name} not found')
+        return table
+
+    def _CreateTable(self, request: dict) -> dict:
+        if request['TableName'] in self.tables:
+            raise DynamoError('ResourceInUseException', f'Table already exists: {request["TableName"]}')
+        table = self.tables[request['TableName']] = FakeTable({**request, 'CreationDateTime': time.time()})
+        return {'TableDescription': table.describe('CREATING')}
+
+    def _DescribeTable(self, request: dict) -> dict:
+        return {'Table': self._table(request['TableName']).describe()}
+
+    def _PutItem(self, request: dict) -> dict:
+        item = request['Item']
+        self._table(request['TableName']).put(item, _item_size(item))
+        self.stats['written'] += 1
+        return {}
+
+    def _BatchWriteItem(self, request: dict) -> dict:
+        unprocessed = {}
+        consumed = []
+        for table_name, requests in request['RequestItems'].items():
+            table = self._table(table_name)
+            units = 0
+            for position, write_request in enumerate(requests):
+                item = write_request['PutRequest']['Item']
+                size = _item_size(item)
+                item_units = math.ceil(size / 1024)
+                if not self._take_capacity(table_name, item_units):
+                    unprocessed[table_name] = requests[position:]
+                    break
+                table.put(item, size)
+                units += item_units
+                self.stats['written'] += 1
+            capacity = {'TableName': table_name, 'CapacityUnits': units}
+            if request.get('ReturnConsumedCapacity') == 'INDEXES':
+                # the fake keeps no indexes, the whole consumption is the table's own
+                capacity['Table'] = {'CapacityUnits': units}
+            consumed.append(capacity)
+        unprocessed_count = sum(len(requests) for requests in unprocessed.values())
+        requested_count = sum(len(requests) for requests in request['RequestItems'].values())
+        if unprocessed_count and unprocessed_count == requested_count:
+            self.stats['throttled'] += 1
+            raise DynamoError('ProvisionedThroughputExceededException', 'Throughput exceeds the provisioned capacity')
+        self.stats['unprocessed'] += unprocessed_count
+        response = {'UnprocessedItems': unprocessed}
+        if request.get('ReturnConsumedCapacity', 'NONE') != 'NONE':
+            response['ConsumedCapacity'] = consumed
+        return response
+
+    def _take_capacity(self, table_name: str, units: int) -> bool:
+        """
+        Token bucket of the table, a second of capacity at most is kept
+        """
+        if self.write_capacity is None:
+            return True
+        now = time.monotonic()
+        tokens, updated = self._capacity.get(table_name, (self.write_capacity, now))
+        tokens = min(self.write_capacity, tokens + (now - updated) * self.write_capacity)
+        if tokens < units:
+            self._capacity[table_name] = (tokens, now)
+            return False
+        self._capacity[table_name] = (tokens - units, now)
+        return True
+
+    def _BatchGetItem(self, request: dict) -> dict:
+        responses = {}
+        for table_name, keys_and_attributes in request['RequestItems'].items():
+            table = self._table(table_name)
+            found = [table.items.get(table.key_of(key)) for key in keys_and_attributes['Keys']]
+            responses[table_name] = [_project(item, keys_and_attributes) for item, _ in filter(None, found)]
+            self.stats['read'] += len(responses[table_name])
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def _Query(self, request: dict) -> dict:
+        table = self._table(request['TableName'])
+        index = request.get('IndexName')
+        conditions = _conditions(request['KeyConditionExpression'], request)
+        hash_name, range_name = table.indexes[index] if index else (table.hash_key, table.range_key)
+        hash_value = next(value for name, operator, value in conditions if name == hash_name and operator == '=')
+        partition = table.partitions[index].get(hash_value, {})
+        range_conditions = [condition for condition in conditions if condition[0] == range_name]
+        keys = [partition[range_value] for range_value in sorted(partition)
+                if _matches(range_value, range_conditions)]
+        return self._page(table, keys, request, index)
+
+    def _Scan(self, request: dict) -> dict:
+        table = self._table(request['TableName'])
+        keys = list(table.items)
+        if 'TotalSegments' in request:
+            segment, segments = request['Segment'], request['TotalSegments']
+            keys = [key for key in keys if zlib.crc32(str(key[0]).encode()) % segments == segment]
+        return self._page(table, keys, request)
+
+    def _page(self, table: FakeTable, keys: List[tuple], request: dict, index: str = None) -> dict:
+        """
+        Answers a page of the given item keys, after ExclusiveStartKey and up to Limit items or PAGE_BYTES
+        """
+        start = request.get('ExclusiveStartKey')
+        if start:
+            start_key = table.key_of(start)
+            keys = keys[next((position + 1 for position, key in enumerate(keys) if key == start_key), len(keys)):]
+        filters = _conditions(request['FilterExpression'], request) if 'FilterExpression' in request else []
+        limit = request.get('Limit')
+        items, scanned, page_bytes, last_key = [], 0, 0, None
+        for position, key in enumerate(keys):
+            item, size = table.items[key]
+            scanned += 1
+            page_bytes += size
+            if all(_matches(_scalar(item.get(name)), [(name, operator, value)]) for name, operator, value in filters):
+                items.append(_project(item, request))
+            if scanned == limit or page_bytes >= PAGE_BYTES:
+                if position < len(keys) - 1:
+                    last_key = key
+                break
+        self.stats['read'] += len(items)
+        response = {'Items': items, 'Count': len(items), 'ScannedCount': scanned}
+        if last_key is not None:
+            item = table.items[last_key][0]
+            names = {table.hash_key, table.range_key, *table.indexes.get(index, ())} - {None}
+            response['LastEvaluatedKey'] = {name: item[name] for name in names if name in item}
+        return response
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are sent apart, Nagle would hold the body back for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                operation = self.headers.get('X-Amz-Target', '').split('.')[-1]
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                try:
+                    status, response = 200, fake.handle(operation, request)
+                except DynamoError as e:
+                    status = 400
+                    response = {'__type': f'com.amazonaws.dynamodb.v20120810#{e.error_type}', 'message': e.message}
+                body = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/x-amz-json-1.0')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _scalar(value: dict):
+    """
+    :return: the value of a wire format scalar attribute, e.g. {"S": "AAPL"} -> AAPL
+    """
+    return next(iter(value.values())) if value else None
+
+
+def _item_size(item: dict) -> int:
+    return len(json.dumps(item, separators=(',', ':')))
+
+
+def _conditions(expression: str, request: dict) -> List[tuple]:
+    """
+    :return: (attribute, operator, value or (low, high)) of the conditions ANDed by a boto3 built expression
+    """
+    names = request.get('ExpressionAttributeNames', {})
+    values = {name: _scalar(value) for name, value in request.get('ExpressionAttributeValues', {}).items()}
+    conditions = []
+    for match in CONDITION.finditer(expression):
+        if match.group(1):
+            conditions.append((names[match.group(1)], '=', values[match.group(2)]))
+        elif match.group(3):
+            conditions.append((names[match.group(3)], 'between', (values[match.group(4)], values[match.group(5)])))
+        else:
+            conditions.append((names[match.group(6)], 'begins_with', values[match.group(7)]))
+    if not conditions:
+        raise DynamoError('ValidationException', f'Unsupported expression: {expression}')
+    return conditions
+
+
+def _matches(value, conditions: List[tuple]) -> bool:
+    for _, operator, expected in conditions:
+        if value is None:
+            return False
+        if operator == '=' and value != expected:
+            return False
+        if operator == 'between' and not expected[0] <= value <= expected[1]:
+            return False
+        if operator == 'begins_with' and not str(value).startswith(expected):
+            return False
+    return True
+
+
+def _project(item: dict, request: dict) -> dict:
+    """
+    :return: the attributes, or dotted paths into maps, listed by ProjectionExpression
+    """
+    if 'ProjectionExpression' not in request:
+        return item
+    names = request.get('ExpressionAttributeNames', {})
+    projected = {}
+    for path in request['ProjectionExpression'].split(','):
+        parts = [names.get(part, part) for part in path.strip().split('.')]
+        source, target = item, projected
+        for depth, part in enumerate(parts):
+            value = source.get(part)
+            if value is None:
+                break
+            if depth == len(parts) - 1:
+                target[part] = value
+            else:
+                source = value.get('M', {})
+                target = target.setdefault(part, {'M': {}})['M']
+    return projected
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--port', type=int, default=8901)
+    parser.add_argument('--write-capacity', type=float)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeDynamo(args.write_capacity, args.throttle_rate, port=args.port)
+    print(f'Serving DynamoDB at {fake.url}, Ctrl+C to stop')
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
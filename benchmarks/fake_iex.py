@@ -0,0 +1,175 @@
+"""
+Local stand-in of the IEX Cloud endpoints Mercury calls: ref-data/Iex/symbols and stock/<symbol|market>/batch.
+Responses are generated once per (symbol, datapoint) and served with configurable latency, payload size and share of
+429 answers. Point Mercury at it with IEX_BASE_URL=<url>.
+
+    python benchmarks/fake_iex.py [--port 8900] [--symbols 1000] [--latency 0.05] [--throttle-rate 0.05]
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeIex(object):
+    def __init__(self, symbols: int = 1000, payload_bytes: int = 2048, latency: float = 0.05,
+                 latency_jitter: float = 0.0, throttle_rate: float = 0.0, trading_date: str = None,
+                 invalid_datapoints: List[str] = (), host: str = '127.0.0.1', port: int = 0, seed: int = 0):
+        """
+        :param symbols: number of symbols listed by ref-data/Iex/symbols
+        :param payload_bytes: approximate JSON size of one datapoint of one symbol
+        :param latency: seconds every request waits before it is answered
+        :param latency_jitter: up to this many seconds are added to latency at random
+        :param throttle_rate: share of requests answered with 429 Too Many Requests
+        :param trading_date: date of the listed symbols, today by default
+        :param invalid_datapoints: datapoints answered as unknown, to exercise datapoint validation
+        :param port: 0 picks a free port
+        """
+        self.symbols = [f'S{index:05d}' for index in range(symbols)]
+        self.payload_bytes = payload_bytes
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.throttle_rate = throttle_rate
+        self.trading_date = trading_date or str(date.today())
+        self.invalid_datapoints = set(invalid_datapoints)
+        self.stats = {'requests': 0, 'throttled': 0, 'bytes': 0}
+        self._random = random.Random(seed)
+        self._fragments: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self) -> 'FakeIex':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-iex', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'FakeIex':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def reset_stats(self) -> dict:
+        with self._lock:
+            stats, self.stats = self.stats, {'requests': 0, 'throttled': 0, 'bytes': 0}
+        return stats
+
+    def respond(self, path: str, query: Dict[str, List[str]]) -> tuple:
+        """
+        :return: (status, body) of a GET request
+        """
+        with self._lock:
+            self.stats['requests'] += 1
+            throttled = self._random.random() < self.throttle_rate
+            delay = self.latency + self._random.uniform(0, self.latency_jitter)
+        if delay:
+            time.sleep(delay)
+        if throttled:
+            with self._lock:
+                self.stats['throttled'] += 1
+            return 429, b'Too Many Requests'
+
+        parts = path.strip('/').split('/')
+        if parts == ['ref-data', 'Iex', 'symbols']:
+            body = json.dumps([{'symbol': symbol, 'date': self.trading_date, 'isEnabled': True}
+                               for symbol in self.symbols])
+        elif len(parts) == 3 and parts[0] == 'stock' and parts[2] == 'batch':
+            datapoints = [datapoint for datapoint in ','.join(query.get('types', [])).split(',') if datapoint]
+            if parts[1] == 'market':
+                symbols = [symbol for symbol in ','.join(query.get('symbols', [])).split(',') if symbol]
+                body = '{' + ','.join(f'{json.dumps(symbol)}:{self._symbol_body(symbol, datapoints)}'
+                                      for symbol in symbols) + '}'
+            else:
+                body = self._symbol_body(parts[1].upper(), datapoints)
+        else:
+            return 404, b'Not Found'
+
+        body = body.encode()
+        with self._lock:
+            self.stats['bytes'] += len(body)
+        return 200, body
+
+    def _symbol_body(self, symbol: str, datapoints: List[str]) -> str:
+        return '{' + ','.join(f'{json.dumps(datapoint)}:{self._fragment(symbol, datapoint)}'
+                              for datapoint in datapoints if datapoint not in self.invalid_datapoints) + '}'
+
+    def _fragment(self, symbol: str, datapoint: str) -> str:
+        """
+        :return: JSON of a datapoint of a symbol, a record list padded to payload_bytes with some empty values the
+            cleaner has to drop
+        """
+        key = (symbol, datapoint)
+        fragment = self._fragments.get(key)
+        if fragment is None:
+            rnd = random.Random(f'{symbol}/{datapoint}')
+            value = {'symbol': symbol, 'description': '', 'website': None, 'tags': ['', datapoint], 'records': []}
+            size = len(json.dumps(value))
+            while size < self.payload_bytes:
+                record = {'price': round(rnd.random() * 1000, 4), 'size': rnd.randint(1, 10 ** 5),
+                          'id': hashlib.md5(f'{key}/{size}'.encode()).hexdigest(), 'note': ''}
+                value['records'].append(record)
+                size += len(json.dumps(record)) + 2
+            fragment = self._fragments.setdefault(key, json.dumps(value))
+        return fragment
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, Mercury's session reuses its connections
+            protocol_version = 'HTTP/1.1'
+            # headers and body are sent apart, Nagle would hold the body back for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                status, body = fake.respond(url.path, parse_qs(url.query))
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json' if status == 200 else 'text/plain')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--symbols', type=int, default=1000)
+    parser.add_argument('--payload-bytes', type=int, default=2048)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeIex(args.symbols, args.payload_bytes, args.latency, throttle_rate=args.throttle_rate, port=args.port)
+    print(f'Serving {args.symbols} symbols at {fake.url}, Ctrl+C to stop')
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,93 @@
 """
 Contains core constants, datatypes etc. used application wise
 """
+import atexit
+import json
 import logging
 import os
+import queue
+import random
+import threading
 from enum import Enum
-from pythonjsonlogger import jsonlogger
-
-import boto3
+from logging.handlers import QueueHandler, QueueListener
 
 BASE_API_URL: str = 'https://cloud.iexapis.com/v1/'
 API_TOKEN = os.getenv('API_TOKEN')
 MAX_RETRIEVAL_THREADS = 16
 MAX_PERSISTENCE_THREADS = 16
+IEX_POOL_SIZE = int(os.getenv('IEX_POOL_SIZE', MAX_RETRIEVAL_THREADS))
+STREAM_PIPELINE = os.getenv('STREAM_PIPELINE') == 'True'
+DATAPOINT_CACHE_PATH = os.getenv('DATAPOINT_CACHE_PATH', '/tmp/mercury/datapoint-cache.sqlite')
+# seconds each datapoint stays fresh in the datapoint cache, 0 (or not listed) disables caching of the datapoint
+DATAPOINT_TTL_SECONDS = {
+    'company': 7 * 24 * 3600,
+    'financials': 24 * 3600,
+    'book': 0,
+    **json.loads(os.getenv('DATAPOINT_TTL_SECONDS', '{}'))
+}
+# IEX message credits charged per symbol for a datapoint, datapoints not listed cost 1 credit
+DATAPOINT_MESSAGE_WEIGHTS = {
+    'advanced-stats': 3000,
+    'book': 1,
+    'company': 1,
+    'dividends': 10,
+    'financials': 5000,
+    'stats': 5,
+}
+IEX_REQUEST_SECONDS = float(os.getenv('IEX_REQUEST_SECONDS', 1.0))
+IEX_DRY_RUN = os.getenv('IEX_DRY_RUN') == 'True'
+# auto, orjson or json
+JSON_DECODER = os.getenv('JSON_DECODER', 'auto')
+# parse batch responses while they download, symbol by symbol, instead of buffering them whole
+IEX_STREAM_PARSING = os.getenv('IEX_STREAM_PARSING') == 'True'
+IEX_STREAM_CHUNK_SIZE = int(os.getenv('IEX_STREAM_CHUNK_SIZE', 64 * 1024))
+DATAPOINT_VALIDATION_TTL_SECONDS = int(os.getenv('DATAPOINT_VALIDATION_TTL_SECONDS', 3600))
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 4))
 
 AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 AWS_REGION = os.getenv('AWS_REGION')
 AWS_TABLE_NAME = os.getenv('AWS_TABLE_NAME')
 AWS_TABLE_REGION = os.getenv('AWS_TABLE_REGION')
+DYNAMO_READ_CAPACITY_UNITS = 5
+DYNAMO_WRITE_CAPACITY_UNITS = int(os.getenv('DYNAMO_WRITE_CAPACITY_UNITS', 100))
+SCAN_SEGMENTS = int(os.getenv('SCAN_SEGMENTS', MAX_PERSISTENCE_THREADS))
+# bytes of pickled documents the in-memory tier of the document cache holds, a query result can be a whole day
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv('DOCUMENT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+DOCUMENT_CACHE_PATH = os.getenv('DOCUMENT_CACHE_PATH', '/tmp/mercury/document-cache.sqlite')
+# opt-in: once set, unchanged documents are stored as document_ref items, readers other than DynamoStore see no
+# document in them (see DocumentManifest)
+DOCUMENT_MANIFEST_PATH = os.getenv('DOCUMENT_MANIFEST_PATH')
+# compress the document attribute of items once it serializes to this many bytes, 0 to store it as a map
+DOCUMENT_COMPRESSION_MIN_BYTES = int(os.getenv('DOCUMENT_COMPRESSION_MIN_BYTES', 0))
+# documents making items larger than this are offloaded to the blob store (S3 bucket, or local directory for tests);
+# without one, only items over the 400 KB Dynamo limit are dropped, and the store reports an error
+DOCUMENT_OFFLOAD_MIN_BYTES = int(os.getenv('DOCUMENT_OFFLOAD_MIN_BYTES', 350 * 1024))
+DOCUMENT_BLOB_BUCKET = os.getenv('DOCUMENT_BLOB_BUCKET')
+DOCUMENT_BLOB_PREFIX = os.getenv('DOCUMENT_BLOB_PREFIX', 'documents/')
+DOCUMENT_BLOB_PATH = os.getenv('DOCUMENT_BLOB_PATH')
+# emf (metrics as log lines), cloudwatch (batched put_metric_data from a background thread), memory or none
+METRICS_SINK = os.getenv('METRICS_SINK', 'emf')
+METRICS_NAMESPACE = os.getenv('METRICS_NAMESPACE', 'iex')
+# logging: level overriding the one modules ask for (e.g. INFO), share of per-batch records kept and whether
+# records are written by a background thread
+LOG_LEVEL = os.getenv('LOG_LEVEL')
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1'))
+LOG_ASYNC = os.getenv('LOG_ASYNC', 'True') == 'True'
+
+IEX_REQUESTS_PER_SECOND = float(os.getenv('IEX_REQUESTS_PER_SECOND', 100))
 
 if os.getenv('TEST_ENVIRONMENT') == 'True':
     BASE_API_URL: str = 'https://sandbox.iexapis.com/stable/'
     API_TOKEN = os.getenv('API_TEST_TOKEN')
+    IEX_REQUESTS_PER_SECOND = float(os.getenv('IEX_REQUESTS_PER_SECOND', 10))
+
+# point IEX and Dynamo calls elsewhere, e.g. at the local stand-ins of the benchmarks
+BASE_API_URL = os.getenv('IEX_BASE_URL', BASE_API_URL)
+AWS_DYNAMODB_ENDPOINT = os.getenv('AWS_DYNAMODB_ENDPOINT')
+# backoff of IEX requests answered with 429 or failing, doubles with every attempt up to the max
+IEX_RETRY_DELAY_SECONDS = float(os.getenv('IEX_RETRY_DELAY_SECONDS', 5))
+IEX_RETRY_MAX_DELAY_SECONDS = float(os.getenv('IEX_RETRY_MAX_DELAY_SECONDS', 30))
 
 
 class ActionStatus(Enum):
@@ -41,44 +107,152 @@ class AppException(Exception):
         self.Message = message
 
 
-def get_logger(module_name: str, level: int = logging.DEBUG):
-    log_format = '%(asctime)s - %(name)s - %(process)d - [%(levelname)s] - %(message)s'
-    log_date_format = '%d-%b-%y %H:%M:%S'
+class _RecordQueueHandler(QueueHandler):
+    """
+    Leaves formatting to the listener thread: only the message arguments are merged on the calling thread,
+    so the record no longer refers to objects the caller may change afterwards
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # the traceback is rendered while the frames still exist
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
-    clear_handlers(logging.getLogger())
-    logger = logging.getLogger(module_name)
-    logger.setLevel(level)
 
-    logger_type = os.getenv('LOGGER_TYPE')
-    if logger_type == "json":
-        formatter = jsonlogger.JsonFormatter(log_format, datefmt=log_date_format)
-    else:
-        formatter = logging.Formatter(log_format, datefmt=log_date_format)
+_log_handlers: list = None
+_log_listener: QueueListener = None
+_log_lock = threading.Lock()
 
-    if not logger.handlers:
-        stream_handler = logging.StreamHandler()
-        stream_handler.setFormatter(formatter)
-        logger.addHandler(stream_handler)
 
+def configure_logging(stream=None) -> list:
+    """
+    Sets logging up once per process. With LOG_ASYNC the loggers only put records on a queue, a QueueListener
+    thread formats and writes them, so the request threads never wait for the stream or the log file.
+    :param stream: where logs are written, stderr by default
+    :return: handlers get_logger attaches to the loggers
+    """
+    global _log_handlers, _log_listener
+    with _log_lock:
+        if _log_handlers is not None:
+            return _log_handlers
+
+        log_format = '%(asctime)s - %(name)s - %(process)d - [%(levelname)s] - %(message)s'
+        log_date_format = '%d-%b-%y %H:%M:%S'
+        if os.getenv('LOGGER_TYPE') == "json":
+            # imported on demand, text logging does not need it
+            from pythonjsonlogger import jsonlogger
+            formatter = jsonlogger.JsonFormatter(log_format, datefmt=log_date_format)
+        else:
+            formatter = logging.Formatter(log_format, datefmt=log_date_format)
+
+        handlers = [logging.StreamHandler(stream)]
         filename = os.getenv('LOG_FILE')
         if filename:
-            handler = logging.FileHandler(filename)
+            handlers.append(logging.FileHandler(filename))
+        for handler in handlers:
             handler.setFormatter(formatter)
-            logger.addHandler(handler)
 
+        # the runtime's own root handler would write every record a second time
+        clear_handlers(logging.getLogger())
+        if LOG_ASYNC:
+            log_queue = queue.SimpleQueue()
+            _log_listener = QueueListener(log_queue, *handlers)
+            _log_listener.start()
+            atexit.register(_stop_listener, _log_listener)
+            handlers = [_RecordQueueHandler(log_queue)]
+        _log_handlers = handlers
+        return _log_handlers
+
+
+def flush_logs() -> None:
+    """
+    Blocks until every record logged so far is written, call it before the Lambda handler returns
+    """
+    with _log_lock:
+        if _log_listener is not None and _stop_listener(_log_listener):
+            _log_listener.start()
+
+
+def _stop_listener(listener: QueueListener) -> bool:
+    """
+    :return: whether the listener was running, it is stopped once every queued record is written
+    """
+    if listener._thread is None:
+        return False
+    listener.stop()
+    return True
+
+
+def get_logger(module_name: str, level: int = logging.DEBUG):
+    """
+    :param module_name: logger name, __name__ of the calling module
+    :param level: level of the logger, LOG_LEVEL overrides it when set
+    :return: logger writing through the handlers configure_logging set up
+    """
+    handlers = _log_handlers or configure_logging()
+    logger = logging.getLogger(module_name)
+    if LOG_LEVEL:
+        level = logging.getLevelName(LOG_LEVEL.upper())
+    # setLevel clears the level cache of every logger
+    if logger.level != level:
+        logger.setLevel(level)
+    if not logger.handlers:
+        for handler in handlers:
+            logger.addHandler(handler)
     return logger
 
 
+def should_log(logger: logging.Logger, level: int = logging.INFO, sampled: bool = False) -> bool:
+    """
+    Guard for records that are costly to build, check it before formatting the message
+    :param sampled: the record is written once per batch or request, only LOG_SAMPLE_RATE of them are kept
+    """
+    if not logger.isEnabledFor(level):
+        return False
+    return not sampled or LOG_SAMPLE_RATE >= 1 or random.random() < LOG_SAMPLE_RATE
+
+
 def clear_handlers(logger):
     if logger.handlers:
         for handler in logger.handlers:
             logger.removeHandler(handler)
 
 
+_aws_clients: dict = {}
+_aws_clients_lock = threading.Lock()
+
+
+def get_aws_client(service: str, resource: bool = False, **kwargs):
+    """
+    Returns the boto3 client (or resource) of the service, created once per container and reused by all
+    warm invocations; boto3 itself is only imported by the first call.
+    :param service: AWS service name, e.g. dynamodb
+    :param resource: True for a resource, False for a client
+    :param kwargs: passed to boto3 when it is created, e.g. region_name
+    :return: cached client or resource
+    """
+    key = (service, resource, tuple(sorted(kwargs.items())))
+    cached = _aws_clients.get(key)
+    if cached is None:
+        # creating clients on the shared default session is not thread-safe
+        with _aws_clients_lock:
+            cached = _aws_clients.get(key)
+            if cached is None:
+                import boto3
+                factory = boto3.resource if resource else boto3.client
+                cached = _aws_clients[key] = factory(service, **kwargs)
+    return cached
+
+
 def get_dynamodb_resource():
-    return boto3.resource(
+    return get_aws_client(
         'dynamodb',
+        resource=True,
         aws_access_key_id=AWS_ACCESS_KEY_ID,
         aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-        region_name=AWS_REGION
+        region_name=AWS_TABLE_REGION or AWS_REGION,
+        endpoint_url=AWS_DYNAMODB_ENDPOINT
     )
@@ -0,0 +1,255 @@
+"""
+Buffered metrics: data points are recorded in memory on the hot path and handed to a sink in batches,
+either as CloudWatch Embedded Metric Format log lines (no API call at all), through batched put_metric_data
+calls made by a background thread, or to an in-memory list for tests.
+"""
+
+import json
+import queue
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, List
+
+import app
+
+
+class MetricDatum(object):
+    def __init__(self, namespace: str, name: str, value: float, unit: str = 'None',
+                 dimensions: Dict[str, str] = None, timestamp: float = None):
+        self.namespace = namespace
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.dimensions = dimensions or {}
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+
+class MetricsSink(ABC):
+    @abstractmethod
+    def emit(self, data: List[MetricDatum]) -> None:
+        pass
+
+    def close(self) -> None:
+        """
+        Blocks until everything emitted so far is delivered
+        """
+
+
+class InMemorySink(MetricsSink):
+    """
+    Keeps the emitted data points, use in tests
+    """
+    def __init__(self):
+        self.data: List[MetricDatum] = []
+        self._lock = threading.Lock()
+
+    def emit(self, data: List[MetricDatum]) -> None:
+        with self._lock:
+            self.data.extend(data)
+
+    def values(self, name: str) -> List[float]:
+        with self._lock:
+            return [datum.value for datum in self.data if datum.name == name]
+
+
+class EmfSink(MetricsSink):
+    """
+    Prints the data points as Embedded Metric Format documents, CloudWatch Logs turns them into metrics,
+    no API call is made. Data points sharing namespace, name, unit and dimensions go to one document as a
+    list of values.
+    """
+    # EMF limits
+    MAX_METRICS = 100
+    MAX_VALUES = 100
+
+    def __init__(self, stream=None):
+        """
+        :param stream: where documents are written, stdout (the Lambda log) by default
+        """
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def emit(self, data: List[MetricDatum]) -> None:
+        groups: Dict[tuple, Dict[tuple, list]] = {}
+        for datum in data:
+            dimensions = tuple(sorted(datum.dimensions.items()))
+            metrics = groups.setdefault((datum.namespace, dimensions), {})
+            metrics.setdefault((datum.name, datum.unit), []).append(datum.value)
+
+        lines = []
+        for (namespace, dimensions), metrics in groups.items():
+            metrics = list(metrics.items())
+            for start in range(0, len(metrics), self.MAX_METRICS):
+                lines += self._documents(namespace, dict(dimensions), metrics[start:start + self.MAX_METRICS])
+
+        stream = self.stream or sys.stdout
+        with self._lock:
+            for line in lines:
+                stream.write(line + "\n")
+            stream.flush()
+
+    def _documents(self, namespace: str, dimensions: dict, metrics: list) -> List[str]:
+        documents = []
+        rounds = max(len(values) for _, values in metrics)
+        for start in range(0, rounds, self.MAX_VALUES):
+            document = {
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [{
+                        "Namespace": namespace,
+                        "Dimensions": [list(dimensions)],
+                        "Metrics": [{"Name": name, "Unit": unit} for (name, unit), _ in metrics]
+                    }]
+                },
+                **dimensions
+            }
+            for (name, _), values in metrics:
+                chunk = values[start:start + self.MAX_VALUES]
+                if chunk:
+                    document[name] = chunk if len(chunk) > 1 else chunk[0]
+            documents.append(json.dumps(document, separators=(',', ':'), default=float))
+        return documents
+
+
+class CloudWatchSink(MetricsSink):
+    """
+    Sends the data points with put_metric_data, MAX_BATCH per call, from a background thread: emit returns
+    immediately. The client is only created with the first call.
+    """
+    MAX_BATCH = 20
+
+    def __init__(self, client=None):
+        """
+        :param client: boto3 CloudWatch client, created on first use if not given
+        """
+        self.Logger = app.get_logger(__name__)
+        self._client = client
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def emit(self, data: List[MetricDatum]) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._work, name="metrics-cloudwatch", daemon=True)
+                self._worker.start()
+        self._queue.put(data)
+
+    def close(self) -> None:
+        self._queue.join()
+
+    def _work(self) -> None:
+        while True:
+            data = self._queue.get()
+            try:
+                self._send(data)
+            except Exception as e:
+                # metrics must never fail a run
+                self.Logger.warning(f"Failed to publish {len(data)} metric data points: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _send(self, data: List[MetricDatum]) -> None:
+        if self._client is None:
+            self._client = app.get_aws_client('cloudwatch')
+        by_namespace: Dict[str, list] = {}
+        for datum in data:
+            by_namespace.setdefault(datum.namespace, []).append({
+                'MetricName': datum.name,
+                'Dimensions': [{'Name': name, 'Value': value} for name, value in datum.dimensions.items()],
+                'Unit': datum.unit,
+                'Value': datum.value,
+                'Timestamp': datum.timestamp
+            })
+        for namespace, metric_data in by_namespace.items():
+            for start in range(0, len(metric_data), self.MAX_BATCH):
+                self._client.put_metric_data(Namespace=namespace, MetricData=metric_data[start:start + self.MAX_BATCH])
+
+
+class NullSink(MetricsSink):
+    def emit(self, data: List[MetricDatum]) -> None:
+        pass
+
+
+class Metrics(object):
+    """
+    Thread-safe buffer of data points, handed to the sink once max_buffer of them are recorded and on flush()
+    """
+    def __init__(self, sink: MetricsSink, max_buffer: int = 100):
+        self.sink = sink
+        self.max_buffer = max_buffer
+        self._buffer: List[MetricDatum] = []
+        self._lock = threading.Lock()
+
+    def record(self, namespace: str, name: str, value: float, unit: str = 'None',
+               dimensions: Dict[str, str] = None) -> None:
+        with self._lock:
+            self._buffer.append(MetricDatum(namespace, name, value, unit, dimensions))
+            if len(self._buffer) < self.max_buffer:
+                return
+            data, self._buffer = self._buffer, []
+        self.sink.emit(data)
+
+    @contextmanager
+    def timer(self, namespace: str, name: str, dimensions: Dict[str, str] = None):
+        """
+        Records the time spent in the with block, in milliseconds
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(namespace, name, int(round((time.perf_counter() - start_time) * 1000)), 'Milliseconds',
+                        dimensions)
+
+    def flush(self, wait: bool = True) -> None:
+        """
+        Hands the buffered data points to the sink
+        :param wait: block until the sink delivered them, call it so before the Lambda handler returns
+        """
+        with self._lock:
+            data, self._buffer = self._buffer, []
+        if data:
+            self.sink.emit(data)
+        if wait:
+            self.sink.close()
+
+
+SINKS = {
+    'emf': EmfSink,
+    'cloudwatch': CloudWatchSink,
+    'memory': InMemorySink,
+    'none': NullSink,
+}
+
+_metrics: Metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """
+    :return: the process-wide metrics, their sink chosen by METRICS_SINK
+    """
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics(SINKS[app.METRICS_SINK]())
+    return _metrics
+
+
+def configure(sink: MetricsSink) -> Metrics:
+    """
+    Replaces the process-wide metrics, what the previous ones buffered is flushed first
+    :param sink: where data points go from now on
+    :return: the new metrics
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is not None:
+            _metrics.flush()
+        _metrics = Metrics(sink)
+    return _metrics
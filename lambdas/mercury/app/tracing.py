@@ -0,0 +1,145 @@
+"""
+Lightweight tracing: nested spans timed into per-path latency histograms, plus counters, summarized once per run.
+Spans nest per thread; a span opened on a worker thread without an open parent nests under the run span.
+"""
+
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+import app
+
+
+class Histogram(object):
+    """
+    Latency samples of a span path; past max_samples, a uniform reservoir of them is kept for the percentiles
+    """
+    def __init__(self, max_samples: int = 4096):
+        self.max_samples = max_samples
+        self.samples: List[float] = []
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if len(self.samples) < self.max_samples:
+            self.samples.append(value)
+        else:
+            index = random.randrange(self.count)
+            if index < self.max_samples:
+                self.samples[index] = value
+
+    def percentile(self, percent: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        # nearest rank
+        return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total, 1),
+            "p50_ms": round(self.percentile(50), 1),
+            "p95_ms": round(self.percentile(95), 1),
+            "p99_ms": round(self.percentile(99), 1),
+            "max_ms": round(self.max, 1),
+        }
+
+
+class Tracer(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, float] = {}
+        self._run_path = None
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Times the with block into the histogram of its path, e.g. run/batch/http
+        :param name: span type
+        """
+        stack = self._stack()
+        parent = stack[-1] if stack else self._run_path
+        path = f"{parent}/{name}" if parent else name
+        stack.append(path)
+        is_run = parent is None and self._run_path is None
+        if is_run:
+            self._run_path = path
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start_time) * 1000
+            stack.pop()
+            if is_run:
+                self._run_path = None
+            with self._lock:
+                histogram = self._histograms.get(path)
+                if histogram is None:
+                    histogram = self._histograms[path] = Histogram()
+                histogram.add(elapsed)
+
+    def count(self, name: str, value: float = 1) -> None:
+        """
+        Adds value to a counter, e.g. retries, throttles, bytes or items
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def summary(self, reset: bool = False) -> dict:
+        """
+        :param reset: start from scratch afterwards, use at the end of a run
+        :return: latency percentiles per span path and counters
+        """
+        with self._lock:
+            summary = {
+                "Type": "trace_summary",
+                "spans": {path: histogram.summary() for path, histogram in sorted(self._histograms.items())},
+                "counters": dict(sorted(self._counters.items())),
+            }
+            if reset:
+                self._histograms = {}
+                self._counters = {}
+        return summary
+
+    def log_summary(self, logger=None) -> dict:
+        """
+        Logs the summary of the run as a single structured record and resets the tracer
+        :return: the summary
+        """
+        summary = self.summary(reset=True)
+        logger = logger or app.get_logger(__name__)
+        spans = ", ".join(f"{path} p50={stats['p50_ms']} p99={stats['p99_ms']} ms (x{stats['count']})"
+                          for path, stats in summary["spans"].items())
+        logger.info(f"Trace summary: {spans}; counters: {summary['counters']}", extra={"message_info": summary})
+        return summary
+
+    def _stack(self) -> List[str]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def span(name: str):
+    return _tracer.span(name)
+
+
+def count(name: str, value: float = 1) -> None:
+    _tracer.count(name, value)
@@ -1,3 +1,6 @@
+from decimal import Decimal
+from typing import Iterable, List
+
 from app import Results, ActionStatus, AppException
 
 
@@ -14,22 +17,7 @@ class DictUtils:
             assert type(dict_to_clean) is dict
 
             # here comes processing...
-            def recursive_clean(dict_to_process: dict) -> dict:
-                for key in list(dict_to_process.keys()):
-                    value = dict_to_process[key]
-                    # clean if empty string or collection or None
-                    if isinstance(value, (str, dict, list, tuple, type(None))) and not value:
-                        del dict_to_process[key]
-                    elif type(value) is dict:
-                        processed_dict = recursive_clean(value)
-                        if processed_dict:
-                            dict_to_process[key] = processed_dict
-                        else:
-                            del dict_to_process[key]
-
-                return dict_to_process
-
-            cleaned_dict = recursive_clean(dict_to_clean)
+            cleaned_dict = DictUtils.clean_document(dict_to_clean, to_dynamo_types=False)
 
             # now you are ready to ship back...
             output = Results()
@@ -48,3 +36,85 @@ class DictUtils:
             catastrophic_exception = AppException(ex=e, message='Catastrophic failure when trying to clean up dict '
                                                                 'from the Dynamo!')
             raise catastrophic_exception
+
+    @staticmethod
+    def clean_document(document: dict, to_dynamo_types: bool = True) -> dict:
+        """
+        Cleans a dict in a single iterative pass, in place: drops the empty strings, collections and None values of
+        dicts at any depth, lists of dicts included. Dicts left empty are dropped from dicts and lists alike, other
+        list items are never dropped, their positions matter.
+        :param document: dict to clean, it is modified
+        :param to_dynamo_types: also prepare the dict for the DynamoDB: turn tuples into lists and floats into Decimal
+        :return: the same dict
+        """
+        # locals are resolved much faster than globals and builtins in this hot loop
+        decimal, dict_type, list_type, tuple_type, str_type = Decimal, dict, list, tuple, str
+        # no type is None, so floats are kept as they are without the conversion
+        float_type = float if to_dynamo_types else None
+        containers = [document]
+        # containers holding nested dicts or lists, parents before children: walked backwards, dicts emptied by the
+        # cleaning and collections emptied that way are dropped bottom-up
+        parents = []
+        while containers:
+            container = containers.pop()
+            has_nested = False
+            if type(container) is dict_type:
+                empty_keys = []
+                for key, value in container.items():
+                    value_type = type(value)
+                    if value_type is float_type:
+                        container[key] = decimal(repr(value))
+                    elif value_type is dict_type or value_type is list_type or value_type is tuple_type:
+                        if not value:
+                            empty_keys.append(key)
+                            continue
+                        if value_type is tuple_type:
+                            if not to_dynamo_types:
+                                continue
+                            value = container[key] = list_type(value)
+                        has_nested = True
+                        containers.append(value)
+                    elif value is None or (value_type is str_type and not value):
+                        empty_keys.append(key)
+                for key in empty_keys:
+                    del container[key]
+            else:
+                for index, value in enumerate(container):
+                    value_type = type(value)
+                    if value_type is float_type:
+                        container[index] = decimal(repr(value))
+                    elif value_type is dict_type:
+                        has_nested = True
+                        containers.append(value)
+                    elif value_type is list_type:
+                        containers.append(value)
+                    elif value_type is tuple_type and to_dynamo_types:
+                        value = container[index] = list_type(value)
+                        containers.append(value)
+            if has_nested:
+                parents.append(container)
+
+        for container in reversed(parents):
+            if type(container) is dict_type:
+                for key in [key for key, value in container.items()
+                            if (type(value) is dict_type or type(value) is list_type) and not value]:
+                    del container[key]
+            else:
+                container[:] = [value for value in container if type(value) is not dict_type or value]
+        return document
+
+    @staticmethod
+    def clean_documents(documents: Iterable[dict], required_keys: tuple = ()) -> List[dict]:
+        """
+        Cleans a batch of dicts with clean_document, in place
+        :param documents: dicts to clean, anything else is dropped
+        :param required_keys: keys a cleaned dict must still have to be kept
+        :return: cleaned dicts having all the required keys
+        """
+        cleaned = []
+        for document in documents:
+            if type(document) is dict:
+                DictUtils.clean_document(document)
+                if all(key in document for key in required_keys):
+                    cleaned.append(document)
+        return cleaned
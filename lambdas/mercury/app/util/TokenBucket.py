@@ -0,0 +1,61 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: tokens refill at `rate` per second up to `capacity`.
+    Callers reserve tokens up front and sleep outside the lock until their reservation is covered,
+    so concurrent callers are served in arrival order and the bucket may temporarily go into debt.
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        :param rate: tokens added per second, must be greater than 0
+        :param capacity: maximum number of tokens the bucket holds (burst size), defaults to one second worth of rate
+        """
+        if rate <= 0:
+            raise ValueError('rate must be greater than 0.')
+        self._rate = float(rate)
+        self._capacity = float(capacity) if capacity else self._rate
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def set_rate(self, rate: float) -> None:
+        if rate <= 0:
+            raise ValueError('rate must be greater than 0.')
+        with self._lock:
+            self._refill()
+            self._rate = float(rate)
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Takes tokens from the bucket, blocking until they are available
+        :param tokens: number of tokens to take
+        :return: number of seconds the caller waited
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def consume(self, tokens: float) -> None:
+        """
+        Takes (or gives back, if negative) tokens without waiting; use to settle a reservation with the actual cost
+        :param tokens: number of tokens to take
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens - tokens, self._capacity)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
@@ -0,0 +1,74 @@
+"""
+Contains DatapointCache class which keeps IEX datapoints of every symbol for a configurable time
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+import app
+
+# symbols bound to one lookup, stays under the 999 variables older SQLite builds accept per statement
+LOOKUP_CHUNK_SIZE = 500
+
+
+class DatapointCache(object):
+    """
+    Persistent (symbol, datapoint) -> value cache backed by a SQLite file. Every datapoint type has its own TTL,
+    slow-moving blocks such as company can be kept for days while a TTL of 0 disables caching of the datapoint.
+    """
+    def __init__(self, path: str = app.DATAPOINT_CACHE_PATH, ttl_seconds: Dict[str, int] = None):
+        """
+        :param path: SQLite file of the cache
+        :param ttl_seconds: datapoint -> seconds its values stay fresh, datapoints not listed are not cached
+        """
+        self.Logger = app.get_logger(__name__)
+        self.ttl_seconds = app.DATAPOINT_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS datapoints (symbol TEXT, datapoint TEXT, "
+                                     "fetched_at REAL, value BLOB, PRIMARY KEY (symbol, datapoint))")
+
+    def is_cacheable(self, datapoint: str) -> bool:
+        return self.ttl_seconds.get(datapoint, 0) > 0
+
+    def get_fresh(self, datapoint: str, symbols: List[str]) -> dict:
+        """
+        :param datapoint: datapoint name
+        :param symbols: tickers to look up
+        :return: symbol -> cached value, only for the symbols whose value has not expired yet
+        """
+        if not self.is_cacheable(datapoint) or not symbols:
+            return {}
+        oldest_fresh = time.time() - self.ttl_seconds[datapoint]
+        rows = []
+        with self._lock:
+            # point lookups on the (symbol, datapoint) primary key, the cost follows the symbols asked for
+            for i in range(0, len(symbols), LOOKUP_CHUNK_SIZE):
+                chunk = symbols[i:i + LOOKUP_CHUNK_SIZE]
+                rows += self._connection.execute(
+                    f"SELECT symbol, value FROM datapoints WHERE symbol IN ({', '.join('?' * len(chunk))}) "
+                    f"AND datapoint = ? AND fetched_at > ?", (*chunk, datapoint, oldest_fresh)).fetchall()
+        return {symbol: pickle.loads(value) for symbol, value in rows}
+
+    def put(self, data_points_data: dict) -> None:
+        """
+        Caches the cacheable datapoints of a stock/market/batch response
+        :param data_points_data: symbol -> {datapoint -> value}
+        """
+        fetched_at = time.time()
+        rows = [(symbol, datapoint, fetched_at, pickle.dumps(value))
+                for symbol, datapoints in data_points_data.items()
+                for datapoint, value in datapoints.items() if self.is_cacheable(datapoint)]
+        if not rows:
+            return
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO datapoints (symbol, datapoint, fetched_at, value) VALUES (?, ?, ?, ?)",
+                    rows)
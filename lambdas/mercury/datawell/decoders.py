@@ -0,0 +1,186 @@
+"""
+Contains the JSON decoders IEX responses can be parsed with
+"""
+
+import codecs
+import json
+import re
+from json.decoder import WHITESPACE
+from typing import Any, Callable, Dict, Generator, Iterable, Tuple
+
+import app
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib decoder is used without it
+    orjson = None
+
+
+def stdlib_loads(data: bytes) -> Any:
+    """
+    Parses the raw response body with the stdlib decoder, floats are left as float
+    :param data: utf-8 encoded JSON document
+    :return: parsed document
+    """
+    return json.loads(data)
+
+
+def orjson_loads(data: bytes) -> Any:
+    """
+    Parses the raw response body with orjson, floats are left as float
+    :param data: utf-8 encoded JSON document
+    :return: parsed document
+    """
+    return orjson.loads(data)
+
+
+DECODERS: Dict[str, Callable[[bytes], Any]] = {"json": stdlib_loads}
+if orjson is not None:
+    DECODERS["orjson"] = orjson_loads
+
+
+def get_decoder(name: str = app.JSON_DECODER) -> Callable[[bytes], Any]:
+    """
+    :param name: one of DECODERS, "auto" picks the fastest one installed
+    :return: function parsing a JSON document from bytes
+    """
+    if name == "auto":
+        return DECODERS.get("orjson", stdlib_loads)
+    if name not in DECODERS:
+        raise app.AppException(ValueError(name), f"JSON decoder {name} is not available, "
+                                                 f"use one of: auto, {', '.join(DECODERS)}")
+    return DECODERS[name]
+
+
+class _ValueEnd(object):
+    """
+    Finds where a JSON value ends while its text arrives piece by piece. Every character is looked at once, so
+    the value is parsed a single time, when it is complete.
+    """
+    _STRUCTURE = re.compile(r'[{}\[\]"]')
+    _STRING = re.compile(r'["\\]')
+    _SCALAR_END = re.compile(r'[\s,}\]]')
+
+    def __init__(self):
+        self.depth = 0
+        self.kind = None
+        self.in_string = False
+        self.escaped = False
+
+    def find(self, text: str, position: int = 0) -> int:
+        """
+        :param text: next piece of the value, the first one starts with the value itself
+        :param position: where the value starts in text
+        :return: position in text right after the value, -1 if it goes on in the next piece
+        """
+        if self.kind is None and position < len(text):
+            char = text[position]
+            if char in "{[":
+                self.kind, self.depth, position = "container", 1, position + 1
+            elif char == '"':
+                self.kind, self.in_string, position = "string", True, position + 1
+            else:
+                self.kind = "scalar"
+        if self.kind == "scalar":
+            match = self._SCALAR_END.search(text, position)
+            return match.start() if match else -1
+
+        while position < len(text):
+            if self.escaped:
+                self.escaped, position = False, position + 1
+            elif self.in_string:
+                match = self._STRING.search(text, position)
+                if match is None:
+                    return -1
+                position = match.end()
+                if match.group() == "\\":
+                    self.escaped = True
+                else:
+                    self.in_string = False
+                    if self.depth == 0:
+                        return position
+            else:
+                match = self._STRUCTURE.search(text, position)
+                if match is None:
+                    return -1
+                position = match.end()
+                if match.group() == '"':
+                    self.in_string = True
+                elif match.group() in "{[":
+                    self.depth += 1
+                else:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        return position
+        return -1
+
+
+def iter_object_items(chunks: Iterable[bytes]) -> Generator[Tuple[str, Any], None, None]:
+    """
+    Parses a JSON object incrementally and yields every top-level key with its value as soon as the value is
+    complete, so neither the raw document nor all of its values have to be held at once. The text of a value
+    spanning several chunks is collected piece by piece and parsed once, when it is complete, with the stdlib
+    decoder; floats are left as float.
+    :param chunks: utf-8 encoded JSON object, split in pieces of any size
+    :return: generator of (key, value) pairs, raises ValueError if the document is not a complete JSON object
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer, position, finished = "", 0, False
+    # what comes next: "{", "first key", "key", ":", "value", "," or "end"
+    expected = "{"
+    key = None
+
+    while expected != "end":
+        position = WHITESPACE.match(buffer, position).end()
+        needs_data = position == len(buffer)
+        if not needs_data:
+            char = buffer[position]
+            if expected == "{" and char == "{":
+                expected, position = "first key", position + 1
+            elif expected == "first key" and char == "}" or expected == "," and char == "}":
+                expected, position = "end", position + 1
+            elif expected in ("first key", "key") and char == '"':
+                try:
+                    key, position = decoder.raw_decode(buffer, position)
+                    expected = ":"
+                except ValueError:
+                    needs_data = True
+            elif expected == ":" and char == ":":
+                expected, position = "value", position + 1
+            elif expected == "value":
+                value_end = _ValueEnd()
+                pieces = []
+                end = value_end.find(buffer, position)
+                while end < 0 and not finished:
+                    pieces.append(buffer[position:])
+                    chunk = next(chunks, None)
+                    finished = chunk is None
+                    buffer, position = utf8.decode(chunk or b"", final=finished), 0
+                    end = value_end.find(buffer)
+                if end < 0:
+                    # only a number or a literal ends with the document, anything else fails to parse below
+                    end = len(buffer)
+                pieces.append(buffer[position:end])
+                value_text = "".join(pieces)
+                value, value_length = decoder.raw_decode(value_text)
+                if value_length != len(value_text):
+                    raise json.JSONDecodeError("Extra data", value_text, value_length)
+                expected, position = ",", end
+                yield key, value
+            elif expected == "," and char == ",":
+                expected, position = "key", position + 1
+            else:
+                raise json.JSONDecodeError(f"Expecting {expected}", buffer, position)
+
+        if needs_data:
+            if finished:
+                raise json.JSONDecodeError(f"Unexpected end of document, expecting {expected}", buffer, position)
+            chunk = next(chunks, None)
+            if chunk is None:
+                finished = True
+                buffer, position = buffer[position:] + utf8.decode(b"", final=True), 0
+            elif chunk:
+                # only whitespace or a partial key is left over here, the text of values is not copied around
+                buffer, position = buffer[position:] + utf8.decode(chunk), 0
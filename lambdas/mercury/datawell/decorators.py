@@ -1,7 +1,11 @@
+import logging
+import random
 import time
 from functools import wraps
 
 import app
+from app import metrics, tracing
+from app.util.TokenBucket import TokenBucket
 
 
 class retry(object):
@@ -34,6 +38,9 @@ class retry(object):
                 results = output.Results
                 if output.ActionStatus == app.ActionStatus.ERROR \
                         and results in self.retry_on:
+                    tracing.count("retries")
+                    if results == 429:
+                        tracing.count("throttles")
                     exp_delay = self._exponential_delay(attempt, self.delay, self.max_delay)
                     self.Logger.info(f"Retrying after {exp_delay} seconds")
                     time.sleep(exp_delay)
@@ -42,18 +49,47 @@ class retry(object):
 
         return wrapper
 
-    def _exponential_delay(self, multiplier: int, delay: int, max_delay: int) -> int:
-        exp_delay = delay ^ multiplier
-        return exp_delay if not max_delay or exp_delay < max_delay else max_delay
+    def _exponential_delay(self, multiplier: int, delay: int, max_delay: int) -> float:
+        """
+        Exponential backoff with jitter: the delay doubles with every attempt (capped by max_delay) and a random
+        half of it is dropped, so concurrent workers throttled at the same time do not retry in lockstep.
+        """
+        exp_delay = delay * 2 ** (multiplier - 1)
+        exp_delay = exp_delay if not max_delay or exp_delay < max_delay else max_delay
+        return exp_delay / 2 + random.uniform(0, exp_delay / 2)
 
 
-def log_execution_time(logger=None, category="", to_log_arguments=False):
+def rate_limit(bucket: TokenBucket):
+    """
+    Decorator that takes a token from the given bucket before every call, blocking until one is available.
+    Share the bucket between everything calling the same API, including concurrent workers, to stay under its
+    requests-per-second limit instead of reacting to 429s.
+
+    :param TokenBucket bucket: rate limiter shared by all the calls to limit.
+    """
+    def decorator(func):
+        @wraps(func)
+        def rate_limit_wrapper(*args, **kwargs):
+            bucket.acquire()
+            return func(*args, **kwargs)
+        return rate_limit_wrapper
+    return decorator
+
+
+def log_execution_time(logger=None, category="", to_log_arguments=False, sampled=False):
+    """
+    Logs the execution time of the function at INFO level, nothing is measured nor built when INFO is disabled
+
+    :param bool sampled: the function runs once per request or batch, only app.LOG_SAMPLE_RATE of its calls are logged.
+    """
     def decorator(func):
         function_module = func.__module__
         _logger = app.get_logger(function_module) if logger is None else logger
 
         @wraps(func)
         def log_execution_time_wrapper(*args, **kwargs):
+            if not app.should_log(_logger, logging.INFO, sampled):
+                return func(*args, **kwargs)
             start_time = time.perf_counter()
             result = func(*args, **kwargs)
             execution_time = int(round((time.perf_counter() - start_time) * 1000))
@@ -78,31 +114,17 @@ def log_execution_time(logger=None, category="", to_log_arguments=False):
 
 
 def publish_running_time_metric(namespace, module):
-    def decorator(func):
-        import boto3
-        cloud_watch_client = boto3.client('cloudwatch')
+    """
+    Records the running time of the function as the Running time metric of the module, the data point is buffered
+    and published with the others, see app.metrics.
 
+    :param str namespace: CloudWatch namespace of the metric.
+    :param str module: value of the Module Name dimension.
+    """
+    def decorator(func):
         @wraps(func)
         def execution_time_wrapper(*args, **kwargs):
-            start_time = time.perf_counter()
-            result = func(*args, **kwargs)
-            running_time = int(round((time.perf_counter() - start_time) * 1000))
-            cloud_watch_client.put_metric_data(
-                MetricData=[
-                    {
-                        'MetricName': 'Running time',
-                        'Dimensions': [
-                            {
-                                'Name': 'Module Name',
-                                'Value': module
-                            }
-                        ],
-                        'Unit': 'Milliseconds',
-                        'Value': running_time
-                    }
-                ],
-                Namespace=namespace
-            )
-            return result
+            with metrics.get_metrics().timer(namespace, 'Running time', {'Module Name': module}):
+                return func(*args, **kwargs)
         return execution_time_wrapper
     return decorator
@@ -2,32 +2,68 @@
 Contains Iex class which retrieves information from IEX API
 """
 
-import json
-from decimal import Decimal
-from typing import List
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Generator, List
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import SSLError, RequestException
 
 import app
-from datawell.decorators import retry, log_execution_time
+from app import metrics, tracing
+from app.util.TokenBucket import TokenBucket
+from datawell.cache import DatapointCache
+from datawell.decoders import get_decoder, iter_object_items
+from datawell.decorators import retry, log_execution_time, rate_limit
+from datawell.planner import BatchPlan, BatchPlanner, PlannedBatch
+
+# shared by every Iex call, whichever instance or worker thread makes it
+IEX_RATE_LIMITER = TokenBucket(rate=app.IEX_REQUESTS_PER_SECOND)
+# floats stay float here, DynamoStore turns them into Decimal only for the documents it writes
+decode_json = get_decoder()
+# valid datapoint -> monotonic expiry time, kept across warm invocations
+_VALIDATED_DATAPOINTS: Dict[str, float] = {}
+_VALIDATED_DATAPOINTS_LOCK = threading.Lock()
 
 
 class Iex(object):
     SYMBOL_BATCH_SIZE = 100
     DATAPOINT_BATCH_SIZE = 10
 
-    def __init__(self, datapoints: List[str] = None):
+    # connection pooled session shared by all instances and kept alive across warm Lambda invocations
+    _session: requests.Session = None
+    _session_lock = threading.Lock()
+
+    def __init__(self, datapoints: List[str] = None, stream: bool = False, cache: DatapointCache = None,
+                 dry_run: bool = False):
+        """
+        :param datapoints: IEX datapoints to load for every symbol
+        :param stream: if True, datapoints are not loaded upfront; consume iter_symbols_batches() instead
+        :param cache: optional datapoint cache, only datapoints missing from it or expired are loaded from IEX
+        :param dry_run: if True, datapoints are not loaded, the requests plan and its cost are logged instead
+        """
         self.Logger = app.get_logger(__name__)
+        self.cache = cache
+        self.dry_run = dry_run
+        self.planner = BatchPlanner(self.SYMBOL_BATCH_SIZE, self.DATAPOINT_BATCH_SIZE)
+        self.Plan: BatchPlan = None
         self.Symbols = self.get_stocks()
         self.datapoints = self._check_datapoints(datapoints)
-        self.load_symbols_datapoints()
+        if not stream:
+            self.load_symbols_datapoints()
 
     @log_execution_time()
     def _check_datapoints(self, datapoints_to_check: List[str]) -> List[str]:
         """
         This method is used to check whether the desired datapoints are valid and accessible.
-        It makes a test API call for each datapoint in the list.
+        All the datapoints not validated recently are probed by a single combined test API call, only the ones
+        the combined call fails for are then probed one by one, concurrently. Valid datapoints are remembered for
+        DATAPOINT_VALIDATION_TTL_SECONDS, so warm invocations do not probe them again. Failed probes are not
+        remembered, a transient IEX error must not drop a datapoint from later runs.
          If there is no any valid datapoint, then list with "company" only is returned.
 
         :param datapoints_to_check:
@@ -35,14 +71,48 @@ class Iex(object):
         """
         valid_blocks: List[str] = []
         if datapoints_to_check and isinstance(datapoints_to_check, list):
-            for block in datapoints_to_check:
-                result: app.Results = self.load_from_iex("stock/aapl/batch", {"types": block})
-                if result.ActionStatus == app.ActionStatus.SUCCESS:
-                    valid_blocks.append(block)
+            blocks = list(dict.fromkeys(datapoints_to_check))
+            now = time.monotonic()
+            with _VALIDATED_DATAPOINTS_LOCK:
+                validated = {block: True for block in blocks if _VALIDATED_DATAPOINTS.get(block, now) > now}
+
+            validated.update(self._probe_datapoints([block for block in blocks if block not in validated]))
+            valid_blocks = [block for block in blocks if validated[block]]
         if not valid_blocks:
             valid_blocks.append("company")
         return valid_blocks
 
+    def _probe_datapoints(self, blocks: List[str]) -> Dict[str, bool]:
+        """
+        :param blocks: datapoints to probe
+        :return: datapoint -> True if valid
+        """
+        if not blocks:
+            return {}
+        probed = {}
+        result: app.Results = self.load_from_iex("stock/aapl/batch", {"types": ",".join(blocks)})
+        if result.ActionStatus == app.ActionStatus.SUCCESS:
+            if isinstance(result.Results, dict):
+                # blocks missing from the combined answer get a second chance below
+                probed = {block: True for block in blocks if block in result.Results}
+            else:
+                probed = {block: True for block in blocks}
+
+        unresolved = [block for block in blocks if block not in probed] if len(blocks) > 1 else []
+        if unresolved:
+            def probe(block: str) -> bool:
+                single_result = self.load_from_iex("stock/aapl/batch", {"types": block})
+                return single_result.ActionStatus == app.ActionStatus.SUCCESS
+
+            with ThreadPoolExecutor(max_workers=min(len(unresolved), app.MAX_RETRIEVAL_THREADS)) as executor:
+                probed.update(zip(unresolved, executor.map(probe, unresolved)))
+        probed.update({block: False for block in blocks if block not in probed})
+
+        expires_at = time.monotonic() + app.DATAPOINT_VALIDATION_TTL_SECONDS
+        with _VALIDATED_DATAPOINTS_LOCK:
+            _VALIDATED_DATAPOINTS.update({block: expires_at for block, valid in probed.items() if valid})
+        return probed
+
     @log_execution_time()
     def get_stocks(self):
         """
@@ -58,8 +128,52 @@ class Iex(object):
             ex = app.AppException(e, message)
             raise ex
 
-    @log_execution_time()
-    @retry(delay=5, max_delay=30, retry_on=(429, 520, 526))
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        """
+        Returns the keep-alive session used for all IEX calls. It is created once per container, its pool holds
+        up to IEX_POOL_SIZE connections, so concurrent workers reuse open TLS connections instead of
+        handshaking on every request.
+        :return: shared requests.Session
+        """
+        if cls._session is None:
+            with cls._session_lock:
+                if cls._session is None:
+                    session = requests.Session()
+                    # plain http only serves local stand-ins of IEX
+                    for prefix in ("https://", "http://"):
+                        session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=app.IEX_POOL_SIZE,
+                                                          pool_block=True))
+                    session.headers.update({"Accept-Encoding": "gzip", "Connection": "keep-alive"})
+                    cls._session = session
+        return cls._session
+
+    @classmethod
+    def get_connection_stats(cls, since: dict = None) -> dict:
+        """
+        Summarizes how the shared session used its connection pools. The session outlives invocations, so pass a
+        snapshot taken at the start of a run to get the usage of that run alone.
+        :param since: stats returned by an earlier call, leave empty to count since the container started
+        :return: dict with number of requests sent, connections opened and connections reused
+        """
+        stats = {"requests": 0, "opened": 0, "reused": 0}
+        if cls._session is not None:
+            for adapter in cls._session.adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools[key]
+                    stats["requests"] += pool.num_requests
+                    stats["opened"] += pool.num_connections
+        if since:
+            # a pool evicted from the pool manager takes its counters along
+            stats["requests"] = max(stats["requests"] - since["requests"], 0)
+            stats["opened"] = max(stats["opened"] - since["opened"], 0)
+        stats["reused"] = max(stats["requests"] - stats["opened"], 0)
+        return stats
+
+    @log_execution_time(sampled=True)
+    @retry(delay=app.IEX_RETRY_DELAY_SECONDS, max_delay=app.IEX_RETRY_MAX_DELAY_SECONDS, retry_on=(429, 520, 526))
+    @rate_limit(IEX_RATE_LIMITER)
     def load_from_iex(self, uri: str, params: dict = None) -> app.Results:
         """
         Connects to the IEX endpoint and gets the data you requested
@@ -67,27 +181,75 @@ class Iex(object):
         :param params: extra parameters to include to url
         :return: Dict() with the answer from the endpoint
         """
-        self.Logger.info(f"Now retrieving from {app.BASE_API_URL}{uri}")
+        if app.should_log(self.Logger, logging.INFO, sampled=True):
+            self.Logger.info(f"Now retrieving from {app.BASE_API_URL}{uri}")
 
+        results = self._request(uri, params, lambda response: response.content)
+        if results.ActionStatus == app.ActionStatus.SUCCESS:
+            tracing.count("bytes", len(results.Results))
+            results.Results = decode_json(results.Results)
+        return results
+
+    @log_execution_time(sampled=True)
+    @retry(delay=app.IEX_RETRY_DELAY_SECONDS, max_delay=app.IEX_RETRY_MAX_DELAY_SECONDS, retry_on=(429, 520, 526))
+    @rate_limit(IEX_RATE_LIMITER)
+    def stream_from_iex(self, uri: str, params: dict = None,
+                        on_item: Callable[[str, Any], None] = None) -> app.Results:
+        """
+        Same as load_from_iex for endpoints answering with a JSON object, but the response is parsed while it
+        downloads: every top-level key is handed to on_item with its value as soon as the value is parsed.
+        Neither the raw body nor the parsed values are held, a value is released once on_item returns.
+        A retried call hands the items again from the first one.
+        :param uri: service path
+        :param params: extra parameters to include to url
+        :param on_item: called with every top-level key and its value
+        :return: list of the top-level keys of the answer
+        """
+        if app.should_log(self.Logger, logging.INFO, sampled=True):
+            self.Logger.info(f"Now streaming from {app.BASE_API_URL}{uri}")
+
+        def read_items(response: requests.Response) -> List[str]:
+            keys = []
+            chunks = response.iter_content(chunk_size=app.IEX_STREAM_CHUNK_SIZE)
+            for key, value in iter_object_items(self._count_bytes(chunks)):
+                keys.append(key)
+                if on_item is not None:
+                    on_item(key, value)
+            return keys
+
+        return self._request(uri, params, read_items, stream=True)
+
+    def _request(self, uri: str, params: dict, read_body: Callable[[requests.Response], Any],
+                 stream: bool = False) -> app.Results:
+        """
+        Sends a GET request to the IEX endpoint and turns failures into the status codes retry acts upon
+        :param uri: service path
+        :param params: extra parameters to include to url
+        :param read_body: reads the body of a successful response
+        :param stream: if True, the body is downloaded while read_body reads it, within the http span either way
+        :return: Results with what read_body returned, or the error status code
+        """
         request_params = {"token": app.API_TOKEN}
         if params is not None:
             request_params.update(params)
 
         results = app.Results()
         try:
-            response = requests.get(f"{app.BASE_API_URL}{uri}", params=request_params)
-            if response.status_code == 200:
-                iex_data = json.loads(response.content.decode("utf-8"), parse_float=Decimal)
+            with tracing.span("http"):
+                with self.get_session().get(f"{app.BASE_API_URL}{uri}", params=request_params,
+                                            stream=stream) as response:
+                    status_code = response.status_code
+                    body = read_body(response) if status_code == 200 else response.text
+            if status_code == 200:
                 results.ActionStatus = app.ActionStatus.SUCCESS
-                results.Results = iex_data
+                results.Results = body
             else:
-                error = response.status_code
                 self.Logger.error(
-                    f"Encountered an error: {error} ({response.text}) "
+                    f"Encountered an error: {status_code} ({body}) "
                     f"while retrieving {app.BASE_API_URL}{uri}")
                 if params is not None:
                     self.Logger.error(f"Failed parameters: {params}")
-                results.Results = error
+                results.Results = status_code
         except SSLError:
             error = 526
             self.Logger.error(
@@ -105,22 +267,153 @@ class Iex(object):
 
     @log_execution_time()
     def load_symbols_datapoints(self):
-        for datapoints_batch in self._batchify(self.datapoints, self.DATAPOINT_BATCH_SIZE):
-            self._load_symbols_datapoints_info(datapoints_batch)
+        symbols_dict = {symbol["symbol"]: symbol for symbol in self.Symbols}
+        self.Plan = self.planner.plan(self._missing_datapoints(symbols_dict), self.datapoints)
+        plan_lines = self.Plan.describe()
+        for line in plan_lines if self.dry_run else plan_lines[:1]:
+            self.Logger.info(line)
+        if not self.dry_run:
+            self._load_symbols_datapoints_info(symbols_dict, self.Plan)
+
+    def _missing_datapoints(self, symbols_dict: dict) -> Dict[str, List[str]]:
+        """
+        Fills symbols with the cached datapoints which are still fresh and lists the datapoints each symbol
+        still misses. Without a cache, all the symbols miss all the datapoints.
+        :param symbols_dict: symbol name -> symbol dict, updated in place with cached datapoints
+        :return: symbol name -> datapoints which have to be loaded from IEX
+        """
+        missing = {symbol_name: [] for symbol_name in symbols_dict}
+        for datapoint in self.datapoints:
+            fresh = self.cache.get_fresh(datapoint, list(symbols_dict)) if self.cache is not None else {}
+            for symbol_name, symbol in symbols_dict.items():
+                if symbol_name in fresh:
+                    symbol[datapoint] = fresh[symbol_name]
+                else:
+                    missing[symbol_name].append(datapoint)
+        return {symbol_name: datapoints for symbol_name, datapoints in missing.items() if datapoints}
 
-    def _load_symbols_datapoints_info(self, datapoints: List[str]):
+    def _load_batch(self, symbols_dict: dict, batch: PlannedBatch) -> app.Results:
         """
-        Splits Symbols into the 100 item bathes and get IEX data for each batch and defined datapoints.
+        Loads a planned batch. With IEX_STREAM_PARSING, every symbol is merged into symbols_dict by the loading
+        thread as soon as it is parsed from the response, and its cacheable datapoints are cached once the
+        response is complete.
+        :param symbols_dict: symbol name -> symbol dict the batch symbols belong to
+        :param batch: request to execute
+        :return: Results of the request, pass them to _apply_batch_result
+        """
+        tracing.count("symbols", len(batch.symbols))
+        with tracing.span("batch"), \
+                metrics.get_metrics().timer(app.METRICS_NAMESPACE, 'Batch fetch time', {'Module Name': 'load'}):
+            if not app.IEX_STREAM_PARSING:
+                return self.load_symbols_from_iex("stock/market/batch", batch.symbols, batch.datapoints)
+
+            to_cache = {}
+
+            def update_symbol(symbol_name: str, datapoints_data: dict) -> None:
+                self.update_symbols(symbols_dict, {symbol_name: datapoints_data})
+                if self.cache is not None:
+                    to_cache[symbol_name] = {datapoint: value for datapoint, value in datapoints_data.items()
+                                             if self.cache.is_cacheable(datapoint)}
+
+            result = self.stream_symbols_from_iex("stock/market/batch", batch.symbols, batch.datapoints,
+                                                  update_symbol)
+            if result.ActionStatus == app.ActionStatus.SUCCESS and to_cache:
+                self.cache.put(to_cache)
+            return result
+
+    def _apply_batch_result(self, symbols_dict: dict, result: app.Results):
+        # streamed symbols are merged and cached while they are parsed
+        if result.ActionStatus == app.ActionStatus.SUCCESS and not app.IEX_STREAM_PARSING:
+            self.update_symbols(symbols_dict, result.Results)
+            if self.cache is not None:
+                self.cache.put(result.Results)
+
+    def _load_symbols_datapoints_info(self, symbols_dict: dict, plan: BatchPlan):
+        """
+        Gets IEX data for every planned batch of symbols and datapoints.
+        Batches are fetched concurrently by up to MAX_RETRIEVAL_THREADS workers, each request keeps its own
+        retry policy. Results are merged in plan order. With IEX_STREAM_PARSING the workers merge symbols while
+        they parse them instead, in no particular order; every (symbol, datapoint) pair is loaded by one batch
+        only, so the merged data is the same, only the order of the keys of a symbol may differ.
         Updates Symbols with retrieved datapoint data.
-        :param datapoints: list of datapoint names. Note that datapoints count must not exceed 10
+        :param symbols_dict: symbol name -> symbol dict of all Symbols
+        :param plan: requests to execute
         """
-        symbols_dict = {symbol["symbol"]: symbol for symbol in self.Symbols}
-        for symbols_batch in self._batchify(list(symbols_dict.keys()), self.SYMBOL_BATCH_SIZE):
-            result = self.load_symbols_from_iex("stock/market/batch", symbols_batch, datapoints)
-            if result.ActionStatus == app.ActionStatus.SUCCESS:
-                self.update_symbols(symbols_dict, result.Results)
+        if not plan.batches:
+            return
+
+        def load_batch(batch: PlannedBatch) -> app.Results:
+            return self._load_batch(symbols_dict, batch)
+
+        max_workers = min(app.MAX_RETRIEVAL_THREADS, len(plan.batches))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # map() yields results in submission order no matter which batch finishes first
+            for result in executor.map(load_batch, plan.batches):
+                self._apply_batch_result(symbols_dict, result)
         self.Symbols = list(symbols_dict.values())
 
+    def iter_symbols_batches(self, queue_size: int = app.PIPELINE_QUEUE_SIZE) -> Generator[List[dict], None, None]:
+        """
+        Streams symbols enriched with all datapoints, one symbols batch at a time, as soon as the batch is loaded.
+        Batches are loaded by MAX_RETRIEVAL_THREADS workers into a bounded queue: when the consumer falls behind,
+        workers block, so memory is bound by the batch size rather than by the number of symbols.
+        Batches are yielded in completion order, Symbols itself is left untouched.
+        :param queue_size: maximum number of loaded batches waiting for the consumer
+        :return: generator of lists of symbol dicts
+        """
+        batches = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        failed = threading.Event()
+        end_of_stream = object()
+
+        def put(item) -> None:
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def load_batch(symbols_batch: List[dict]) -> None:
+            if stop.is_set() or failed.is_set():
+                return
+            # copies keep the enriched documents out of Symbols, so they are released once consumed
+            symbols_dict = {symbol["symbol"]: dict(symbol) for symbol in symbols_batch}
+            plan = self.planner.plan(self._missing_datapoints(symbols_dict), self.datapoints)
+            for batch in plan.batches:
+                self._apply_batch_result(symbols_dict, self._load_batch(symbols_dict, batch))
+            put(list(symbols_dict.values()))
+
+        def produce() -> None:
+            try:
+                with ThreadPoolExecutor(max_workers=app.MAX_RETRIEVAL_THREADS) as executor:
+                    futures = [executor.submit(load_batch, symbols_batch)
+                               for symbols_batch in self._batchify(self.Symbols, self.SYMBOL_BATCH_SIZE)]
+                    try:
+                        for future in futures:
+                            future.result()
+                    except Exception:
+                        # batches not started yet are skipped, so the error surfaces without waiting for them
+                        failed.set()
+                        raise
+                put(end_of_stream)
+            except Exception as e:
+                put(app.AppException(ex=e, message='Failed while streaming symbols batches!'))
+
+        producer = threading.Thread(target=produce, name="iex-producer", daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is end_of_stream:
+                    break
+                if isinstance(item, app.AppException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            producer.join()
+
     def _batchify(self, lst, batch_size: int):
         for i in range(0, len(lst), batch_size):
             yield lst[i:i + batch_size]
@@ -133,6 +426,21 @@ class Iex(object):
                 symbol[point_name] = point_symbol[point_name]
 
     def load_symbols_from_iex(self, url_path: str, symbols: List[str], datapoints: List[str]):
+        result = self.load_from_iex(url_path, self._symbols_request_params(symbols, datapoints))
+        return result
+
+    def stream_symbols_from_iex(self, url_path: str, symbols: List[str], datapoints: List[str],
+                                on_symbol: Callable[[str, dict], None]):
+        result = self.stream_from_iex(url_path, self._symbols_request_params(symbols, datapoints), on_symbol)
+        return result
+
+    @staticmethod
+    def _count_bytes(chunks):
+        for chunk in chunks:
+            tracing.count("bytes", len(chunk))
+            yield chunk
+
+    def _symbols_request_params(self, symbols: List[str], datapoints: List[str]) -> dict:
         assert len(symbols) <= 100, 'Load from IEX error: symbols count must not exceed 100 per request'
         assert len(datapoints) <= 10, 'Load from IEX error: datapoints count must not exceed 10 per request'
 
@@ -141,5 +449,4 @@ class Iex(object):
             request_params['symbols'] = ','.join(symbols)
         if len(datapoints) > 0:
             request_params['types'] = ','.join(datapoints)
-        result = self.load_from_iex(url_path, request_params)
-        return result
+        return request_params
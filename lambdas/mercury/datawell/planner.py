@@ -0,0 +1,89 @@
+"""
+Contains BatchPlanner class which packs the (symbol, datapoint) pairs to be loaded into IEX batch requests
+"""
+
+import math
+from typing import Dict, List
+
+import app
+
+
+class PlannedBatch(object):
+    """
+    A single stock/market/batch request: every listed datapoint for every listed symbol
+    """
+    def __init__(self, symbols: List[str], datapoints: List[str], credits: int):
+        self.symbols = symbols
+        self.datapoints = datapoints
+        self.credits = credits
+
+
+class BatchPlan(object):
+    def __init__(self, batches: List[PlannedBatch], estimated_seconds: float):
+        self.batches = batches
+        self.credits = sum(batch.credits for batch in batches)
+        self.pairs = sum(len(batch.symbols) * len(batch.datapoints) for batch in batches)
+        self.estimated_seconds = estimated_seconds
+
+    def describe(self) -> List[str]:
+        """
+        :return: human readable plan, a summary line followed by a line per batch
+        """
+        lines = [f"Plan: {len(self.batches)} requests for {self.pairs} (symbol, datapoint) pairs, "
+                 f"~{self.credits} message credits, ~{self.estimated_seconds:.1f} s"]
+        for number, batch in enumerate(self.batches, start=1):
+            lines.append(f"  #{number}: {len(batch.symbols)} symbols x {','.join(batch.datapoints)} "
+                         f"~{batch.credits} credits")
+        return lines
+
+
+class BatchPlanner(object):
+    """
+    Packs the (symbol, datapoint) pairs which have to be loaded into stock/market/batch requests within IEX
+    limits, without requesting a single pair that is not needed, so no message credit is wasted. The datapoints
+    of each symbol are split into chunks in a canonical order, symbols with an identical chunk are pooled and
+    every pool is split into requests of max_symbols. Symbols needing different datapoints never share a request,
+    so this may take more requests than the fewest possible, in exchange for no wasted pairs.
+    """
+    def __init__(self, max_symbols: int = 100, max_datapoints: int = 10,
+                 message_weights: Dict[str, int] = None, request_seconds: float = app.IEX_REQUEST_SECONDS,
+                 workers: int = app.MAX_RETRIEVAL_THREADS):
+        """
+        :param max_symbols: maximum symbols per request
+        :param max_datapoints: maximum datapoints per request
+        :param message_weights: datapoint -> message credits charged per symbol, 1 for datapoints not listed
+        :param request_seconds: expected latency of a single request
+        :param workers: number of requests running concurrently
+        """
+        self.max_symbols = max_symbols
+        self.max_datapoints = max_datapoints
+        self.message_weights = app.DATAPOINT_MESSAGE_WEIGHTS if message_weights is None else message_weights
+        self.request_seconds = request_seconds
+        self.workers = workers
+
+    def plan(self, missing: Dict[str, List[str]], datapoints_order: List[str] = None) -> BatchPlan:
+        """
+        :param missing: symbol -> datapoints to load for it
+        :param datapoints_order: canonical datapoints order, defaults to the order datapoints first appear in
+        :return: plan of requests covering exactly the given pairs
+        """
+        order = {datapoint: index for index, datapoint in enumerate(datapoints_order or [])}
+        for datapoints in missing.values():
+            for datapoint in datapoints:
+                order.setdefault(datapoint, len(order))
+
+        pools: Dict[tuple, List[str]] = {}
+        for symbol, datapoints in missing.items():
+            datapoints = sorted(set(datapoints), key=order.get)
+            for i in range(0, len(datapoints), self.max_datapoints):
+                pools.setdefault(tuple(datapoints[i:i + self.max_datapoints]), []).append(symbol)
+
+        batches = []
+        for datapoints, symbols in pools.items():
+            credits_per_symbol = sum(self.message_weights.get(datapoint, 1) for datapoint in datapoints)
+            for i in range(0, len(symbols), self.max_symbols):
+                symbols_batch = symbols[i:i + self.max_symbols]
+                batches.append(PlannedBatch(symbols_batch, list(datapoints), credits_per_symbol * len(symbols_batch)))
+
+        estimated_seconds = math.ceil(len(batches) / max(self.workers, 1)) * self.request_seconds
+        return BatchPlan(batches, estimated_seconds)
@@ -3,9 +3,13 @@ import os
 from datetime import datetime
 
 import app
-from app import ActionStatus
+from app import ActionStatus, metrics, tracing
+from datawell.cache import DatapointCache
 from datawell.decorators import publish_running_time_metric, log_execution_time
 from datawell.iex import Iex
+from persistence.BlobStore import BlobStore, LocalBlobStore, S3BlobStore
+from persistence.DocumentCodec import DocumentCodec
+from persistence.DocumentManifest import DocumentManifest
 from persistence.DynamoStore import DynamoStore
 
 
@@ -13,25 +17,45 @@ def lambda_handler(event=None, context=None):
     logger = app.get_logger(module_name=__name__, level=logging.INFO)
     try:
         start_time = datetime.now()
-        datasource = _load_iex_data()
-        _store_iex_data(datasource)
+        # the IEX session is reused by warm invocations, only its use by this run is logged
+        connection_snapshot = Iex.get_connection_stats()
+        with tracing.span("run"):
+            if app.IEX_DRY_RUN:
+                Iex(DATAPOINTS, cache=_get_datapoint_cache(), dry_run=True)
+            elif app.STREAM_PIPELINE:
+                _load_and_store_iex_data()
+            else:
+                datasource = _load_iex_data()
+                _store_iex_data(datasource)
 
         # Ok, lets time our run...
         end_time = datetime.now()
         run_time = end_time - start_time
         logger.info('Timing: It took ' + str(run_time) + ' to finish this run')
+        connection_stats = Iex.get_connection_stats(since=connection_snapshot)
+        logger.info(f"Connections: {connection_stats['opened']} opened, {connection_stats['reused']} reused "
+                    f"for {connection_stats['requests']} IEX requests")
+        tracing.get_tracer().log_summary(logger)
+        # buffered metrics and queued log records would be lost once the container freezes
+        metrics.get_metrics().flush()
+        app.flush_logs()
     except app.AppException as e:
         logger.error(e.Message, exc_info=True)
+        tracing.get_tracer().log_summary(logger)
+        metrics.get_metrics().flush()
+        app.flush_logs()
         os._exit(-1)  # please note: python has no encapsulation - you can call private methods! doesnt mean you should
 
 
+DATAPOINTS: list = [
+    "book", "company", "financials"
+]
+
+
 @log_execution_time()
 @publish_running_time_metric('iex', 'load')
 def _load_iex_data():
-    datapoints: list = [
-        "book", "company", "financials"
-    ]
-    return Iex(datapoints)
+    return Iex(DATAPOINTS, cache=_get_datapoint_cache())
 
 
 @log_execution_time()
@@ -39,10 +63,42 @@ def _load_iex_data():
 def _store_iex_data(datasource):
     try:
         default_message = 'Failed to persist documents to the datalake, check underlying modules logs for exceptions'
-        datalake = DynamoStore(app.AWS_TABLE_NAME)
+        datalake = _get_datalake()
         result = datalake.store_documents(documents=datasource.Symbols)
         if result is ActionStatus.ERROR:
             raise app.AppException(message=default_message)
     except app.AppException as e:
         raise app.AppException(ex=e, message=e.Message)
 
+
+@log_execution_time()
+@publish_running_time_metric('iex', 'load_and_store')
+def _load_and_store_iex_data():
+    """
+    Streams every loaded symbols batch straight into the datalake, so IEX fetches and Dynamo writes overlap
+    """
+    try:
+        default_message = 'Failed to persist documents to the datalake, check underlying modules logs for exceptions'
+        datasource = Iex(DATAPOINTS, stream=True, cache=_get_datapoint_cache())
+        datalake = _get_datalake()
+        result = datalake.store_document_batches(datasource.iter_symbols_batches())
+        if result is ActionStatus.ERROR:
+            raise app.AppException(message=default_message)
+    except app.AppException as e:
+        raise app.AppException(ex=e, message=e.Message)
+
+
+def _get_datalake() -> DynamoStore:
+    manifest = DocumentManifest() if app.DOCUMENT_MANIFEST_PATH else None
+    codec = DocumentCodec() if app.DOCUMENT_COMPRESSION_MIN_BYTES > 0 else None
+    return DynamoStore(app.AWS_TABLE_NAME, manifest=manifest, codec=codec, blob_store=_get_blob_store())
+
+
+def _get_blob_store() -> BlobStore:
+    if app.DOCUMENT_BLOB_BUCKET:
+        return S3BlobStore()
+    return LocalBlobStore() if app.DOCUMENT_BLOB_PATH else None
+
+
+def _get_datapoint_cache() -> DatapointCache:
+    return DatapointCache() if app.DATAPOINT_CACHE_PATH else None
@@ -0,0 +1,60 @@
+import os
+import tempfile
+from abc import ABC, abstractmethod
+
+import app
+
+
+class BlobStore(ABC):
+    """
+    Object storage for document bodies too large for a Dynamo item. Implementations must be thread-safe.
+    """
+    @abstractmethod
+    def put(self, key: str, body: bytes) -> None:
+        pass
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        pass
+
+
+class S3BlobStore(BlobStore):
+    def __init__(self, bucket: str = app.DOCUMENT_BLOB_BUCKET, prefix: str = app.DOCUMENT_BLOB_PREFIX):
+        """
+        :param bucket: S3 bucket the bodies are stored in
+        :param prefix: key prefix of the bodies
+        """
+        self.bucket = bucket
+        self.prefix = prefix
+        # boto3 clients, unlike resources, are thread-safe
+        self.client = app.get_aws_client('s3')
+
+    def put(self, key: str, body: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=f"{self.prefix}{key}", Body=body)
+
+    def get(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=f"{self.prefix}{key}")['Body'].read()
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Keeps the bodies as files under a directory, use for tests and local runs
+    """
+    def __init__(self, root: str = app.DOCUMENT_BLOB_PATH):
+        """
+        :param root: directory the bodies are stored in
+        """
+        self.root = root
+
+    def put(self, key: str, body: bytes) -> None:
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written aside and renamed, so a reader never sees a partial body
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(file_descriptor, 'wb') as temp_file:
+            temp_file.write(body)
+        os.replace(temp_path, path)
+
+    def get(self, key: str) -> bytes:
+        with open(os.path.join(self.root, key), 'rb') as body_file:
+            return body_file.read()
@@ -0,0 +1,96 @@
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import app
+
+
+class DocumentCache:
+    """
+    Two-tier read-through cache of Dynamo documents: an in-memory LRU in front of a SQLite file.
+    The LRU holds values pickled and is bounded by their size, a single query result can be a whole market day.
+    The file lives under /tmp by default, so it outlives the LRU and is reused by warm Lambda invocations.
+    Every entry is bound to a date partition, writers invalidate the partitions they touch. Callers get their own
+    copy of a value, so changing it does not change the cache.
+    """
+    def __init__(self, max_bytes: int = app.DOCUMENT_CACHE_MAX_BYTES, path: str = app.DOCUMENT_CACHE_PATH):
+        """
+        :param max_bytes: maximum size of the pickled values kept in memory, larger values are kept on disk only
+        :param path: SQLite file of the on-disk tier, leave empty to keep the cache in memory only
+        """
+        self.Logger = app.get_logger(__name__)
+        self._max_bytes = max_bytes
+        # key -> (partition date, pickled value)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            with self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS documents (key TEXT PRIMARY KEY, date TEXT, value BLOB)")
+                self._connection.execute("CREATE INDEX IF NOT EXISTS documents_date ON documents (date)")
+
+    def get(self, key: str):
+        """
+        :param key: cache key
+        :return: cached value or None if not cached
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                body = self._entries[key][1]
+            elif self._connection is None:
+                return None
+            else:
+                row = self._connection.execute("SELECT date, value FROM documents WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                body = row[1]
+                self._remember(key, row[0], body)
+        # every unpickling makes a new copy
+        return pickle.loads(body)
+
+    def put(self, key: str, partition_date: str, value) -> None:
+        """
+        :param key: cache key
+        :param partition_date: date the value belongs to, as a string
+        :param value: anything picklable
+        """
+        body = pickle.dumps(value)
+        with self._lock:
+            self._remember(key, partition_date, body)
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute("INSERT OR REPLACE INTO documents (key, date, value) VALUES (?, ?, ?)",
+                                             (key, partition_date, body))
+
+    def invalidate(self, partition_date: str) -> None:
+        """
+        Drops every entry of the given date partition from both tiers
+        :param partition_date: date as a string
+        """
+        with self._lock:
+            for key in [key for key, (entry_date, _) in self._entries.items() if entry_date == partition_date]:
+                self._forget(key)
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute("DELETE FROM documents WHERE date = ?", (partition_date,))
+        self.Logger.debug(f"invalidate: dropped cached documents for {partition_date}")
+
+    def _remember(self, key: str, partition_date: str, body: bytes) -> None:
+        self._forget(key)
+        if len(body) > self._max_bytes:
+            return
+        self._entries[key] = (partition_date, body)
+        self._size += len(body)
+        while self._size > self._max_bytes:
+            self._forget(next(iter(self._entries)))
+
+    def _forget(self, key: str) -> None:
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key)[1])
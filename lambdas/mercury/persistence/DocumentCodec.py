@@ -0,0 +1,130 @@
+import json
+import zlib
+from decimal import Decimal
+from typing import List
+
+import app
+
+# Seeds the compressor with keys every IEX symbol document repeats, so even small documents compress well.
+# Items record the encoding they were written with: never change a dictionary in place, add a new encoding.
+ZDICT_V1 = ''.join(f'"{key}":' for key in [
+    'symbol', 'date', 'companyName', 'exchange', 'industry', 'website', 'description', 'CEO', 'securityName',
+    'issueType', 'sector', 'primarySicCode', 'employees', 'tags', 'address', 'address2', 'state', 'city', 'zip',
+    'country', 'phone', 'financials', 'reportDate', 'fiscalDate', 'currency', 'grossProfit', 'costOfRevenue',
+    'operatingRevenue', 'totalRevenue', 'operatingIncome', 'netIncome', 'researchAndDevelopment',
+    'operatingExpense', 'currentAssets', 'totalAssets', 'totalLiabilities', 'currentCash', 'currentDebt',
+    'shortTermDebt', 'longTermDebt', 'totalCash', 'totalDebt', 'shareholderEquity', 'cashChange', 'cashFlow',
+    'book', 'quote', 'bids', 'asks', 'trades', 'systemEvent', 'price', 'size', 'timestamp', 'isISO',
+    'isOddLot', 'isOutsideRegularHours', 'isSinglePriceCross', 'isTradeThroughExempt', 'tradeId',
+    'latestPrice', 'latestSource', 'latestTime', 'latestUpdate', 'latestVolume', 'open', 'close', 'high', 'low',
+    'volume', 'change', 'changePercent', 'marketCap', 'peRatio', 'week52High', 'week52Low', 'ytdChange',
+]).encode('utf-8')
+
+ZLIB_V1 = 'zlib-v1'
+ENCODING_ATTRIBUTE = 'document_encoding'
+BLOB_ATTRIBUTE = 'document_blob'
+
+
+class DocumentCodec:
+    """
+    Stores the document attribute of large items as a zlib compressed binary attribute (document_blob) next to
+    the name of its encoding (document_encoding), keys and the other attributes stay as they are.
+    Decoding is driven by the encoding the item carries, so readers need no configuration.
+    """
+    def __init__(self, min_size: int = app.DOCUMENT_COMPRESSION_MIN_BYTES, level: int = 6):
+        """
+        :param min_size: documents serialized to fewer bytes are stored uncompressed
+        :param level: zlib compression level
+        """
+        self.min_size = min_size
+        self.level = level
+
+    def encode(self, item: dict) -> dict:
+        """
+        :param item: Dynamo item with a cleaned document
+        :return: the same item, its document compressed if it is at least min_size bytes
+        """
+        if 'document' not in item:
+            return item
+        serialized = self.serialize(item['document'])
+        if len(serialized) < self.min_size:
+            return item
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, zlib.MAX_WBITS, 9, zlib.Z_DEFAULT_STRATEGY,
+                                      ZDICT_V1)
+        item[BLOB_ATTRIBUTE] = compressor.compress(serialized) + compressor.flush()
+        item[ENCODING_ATTRIBUTE] = ZLIB_V1
+        del item['document']
+        return item
+
+    @staticmethod
+    def decode(item: dict) -> dict:
+        """
+        :param item: Dynamo item as read
+        :return: the same item with a plain document attribute, numbers as Decimal like boto3 returns them
+        """
+        encoding = item.get(ENCODING_ATTRIBUTE)
+        if encoding is None or BLOB_ATTRIBUTE not in item:
+            # not compressed, or the compressed body is offloaded and still has to be fetched
+            return item
+        del item[ENCODING_ATTRIBUTE]
+        if encoding != ZLIB_V1:
+            raise app.AppException(ValueError(encoding), f"Unknown document encoding {encoding}")
+        blob = item.pop(BLOB_ATTRIBUTE)
+        # boto3 wraps binary attributes into Binary
+        blob = getattr(blob, 'value', blob)
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS, ZDICT_V1)
+        serialized = decompressor.decompress(blob) + decompressor.flush()
+        item['document'] = DocumentCodec.deserialize(serialized)
+        return item
+
+    @staticmethod
+    def serialize(document: dict) -> bytes:
+        """
+        :param document: cleaned document
+        :return: document as compact JSON
+        """
+        return json.dumps(document, separators=(',', ':'), default=_json_number).encode('utf-8')
+
+    @staticmethod
+    def deserialize(serialized: bytes) -> dict:
+        """
+        :param serialized: document as serialized by serialize
+        :return: document, numbers as Decimal like boto3 returns them
+        """
+        return json.loads(serialized, parse_float=Decimal, parse_int=Decimal)
+
+    @staticmethod
+    def decode_all(items: List[dict]) -> List[dict]:
+        for item in items:
+            DocumentCodec.decode(item)
+        return items
+
+    @staticmethod
+    def project(document: dict, paths: List[str]) -> dict:
+        """
+        Applies a projection to a decoded document, as Dynamo would have applied it to a plain one
+        :param document: decoded document
+        :param paths: paths inside the document, dotted (e.g. company.employees)
+        :return: new dict with the projected paths only
+        """
+        projected = {}
+        for path in paths:
+            names = path.split('.')
+            value = document
+            for name in names:
+                if not isinstance(value, dict) or name not in value:
+                    break
+                value = value[name]
+            else:
+                target = projected
+                for name in names[:-1]:
+                    target = target.setdefault(name, {})
+                target[names[-1]] = value
+        return projected
+
+
+def _json_number(value):
+    # cleaned documents hold Decimals converted from IEX floats, they convert back to the same float exactly
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Optional, Tuple
+
+import app
+
+
+class DocumentManifest:
+    """
+    Compact record of the last fully written document per symbol: its content hash and the date it was stored under.
+    Lets DynamoStore store an unchanged document as a small reference to that date instead of rewriting it.
+    Kept in a SQLite file; point DOCUMENT_MANIFEST_PATH to persistent storage (e.g. an EFS mount) to keep it across
+    cold starts, a lost manifest only means the next run writes full documents again.
+
+    Off unless DOCUMENT_MANIFEST_PATH is set, since it changes the items of the table. A referencing item is
+    {symbol, date, document_hash, document_ref} with no document attribute: document_ref is the date of the item
+    holding the document. Only DynamoStore resolves references, other readers of the table see no document, and
+    rewriting or deleting the referenced item changes or breaks every item pointing to it.
+    """
+    def __init__(self, path: str = app.DOCUMENT_MANIFEST_PATH):
+        """
+        :param path: SQLite file of the manifest
+        """
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS manifest (symbol TEXT PRIMARY KEY, hash TEXT, date TEXT)")
+        self._entries = {symbol: (document_hash, document_date) for symbol, document_hash, document_date
+                         in self._connection.execute("SELECT symbol, hash, date FROM manifest")}
+
+    @staticmethod
+    def hash_document(document: dict) -> str:
+        """
+        :param document: cleaned symbol document
+        :return: content hash of the document, its date excluded
+        """
+        content = {key: value for key, value in document.items() if key != 'date'}
+        serialized = json.dumps(content, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+    def get(self, symbol: str) -> Optional[Tuple[str, str]]:
+        """
+        :param symbol: ticker as a string
+        :return: (hash, date) of the last fully written document of the symbol, None if unknown
+        """
+        with self._lock:
+            return self._entries.get(symbol)
+
+    def update(self, entries: dict) -> None:
+        """
+        Records fully written documents, call once they are persisted
+        :param entries: dict of symbol -> (hash, date)
+        """
+        with self._lock:
+            self._entries.update(entries)
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO manifest (symbol, hash, date) VALUES (?, ?, ?)",
+                    [(symbol, document_hash, str(document_date))
+                     for symbol, (document_hash, document_date) in entries.items()])
+
+    def forget(self, symbols: list = None) -> None:
+        """
+        Drops symbols from the manifest, use when their documents are deleted
+        :param symbols: tickers to drop, leave empty to drop all
+        """
+        with self._lock:
+            with self._connection:
+                if symbols is None:
+                    self._entries.clear()
+                    self._connection.execute("DELETE FROM manifest")
+                else:
+                    for symbol in symbols:
+                        self._entries.pop(symbol, None)
+                    self._connection.executemany("DELETE FROM manifest WHERE symbol = ?",
+                                                 [(symbol,) for symbol in symbols])
@@ -1,3 +1,5 @@
+import queue
+import threading
 import time
 import logging
 
@@ -5,6 +7,8 @@ from boto3.exceptions import RetriesExceededError
 from botocore.exceptions import ClientError
 
 import app
+from app import metrics, tracing
+from app.util.TokenBucket import TokenBucket
 
 
 RETRY_EXCEPTIONS = ('ProvisionedThroughputExceededException',
@@ -27,13 +31,84 @@ class RetryConfig:
         self.max_delay = max_delay if max_delay >= 0 else float("inf")
 
 
+class WriteRateController:
+    def __init__(self, provisioned_units: float, target_utilization: float = 0.9, increase_step: float = 1,
+                 decrease_factor: float = 0.5, min_rate: float = 1):
+        """
+        Paces writes to stay just under the provisioned write capacity, shared by all the writer threads.
+        The rate follows AIMD: it grows by increase_step WCU/s after every fully processed batch and is multiplied
+        by decrease_factor whenever Dynamo throttles. Each batch reserves its estimated WCU before being sent,
+        the reservation is then settled with the capacity Dynamo reports as consumed by the table itself, the units its
+        global secondary indexes consume are not counted against provisioned_units.
+        :param provisioned_units: Provisioned write capacity units of the table, its indexes excluded
+        :param target_utilization: Fraction of provisioned_units the rate never exceeds
+        :param increase_step: WCU/s added to the rate after a successful batch
+        :param decrease_factor: Rate multiplier applied on throttling
+        :param min_rate: The rate never goes below this number of WCU/s
+        """
+        self.Logger = app.get_logger(__name__, level=logging.INFO)
+        self._max_rate = max(provisioned_units * target_utilization, min_rate)
+        self._min_rate = min_rate
+        self._increase_step = increase_step
+        self._decrease_factor = decrease_factor
+        self._bucket = TokenBucket(rate=self._max_rate, capacity=self._max_rate)
+        self._units_per_item = 1.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._bucket.rate
+
+    def acquire(self, items_count: int) -> float:
+        """
+        Blocks until the budget allows writing items_count items
+        :return: estimated WCU reserved for the items, pass it to on_success
+        """
+        estimated_units = items_count * self._units_per_item
+        self._bucket.acquire(estimated_units)
+        return estimated_units
+
+    def on_success(self, estimated_units: float, consumed_units: float, items_count: int, throttled: bool) -> None:
+        """
+        Settles the reservation and adjusts the rate
+        :param estimated_units: WCU returned by acquire
+        :param consumed_units: WCU Dynamo reports as consumed
+        :param items_count: Number of items Dynamo processed
+        :param throttled: True when some items came back unprocessed
+        """
+        if consumed_units:
+            self._bucket.consume(consumed_units - estimated_units)
+            if items_count:
+                with self._lock:
+                    # exponentially weighted average, so large documents are budgeted for before they are sent
+                    self._units_per_item = 0.8 * self._units_per_item + 0.2 * consumed_units / items_count
+        if throttled:
+            self.on_throttle()
+        else:
+            with self._lock:
+                self._bucket.set_rate(min(self._max_rate, self._bucket.rate + self._increase_step))
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            rate = max(self._min_rate, self._bucket.rate * self._decrease_factor)
+            self._bucket.set_rate(rate)
+        self.Logger.debug(f"on_throttle: write rate decreased to {rate} WCU/s")
+
+
 class DynamoBatchWriter(object):
-    def __init__(self, table, dynamo_client, flush_amount=25, retries=RetryConfig()):
+    def __init__(self, table, dynamo_client, flush_amount=25, retries=RetryConfig(), max_workers=1,
+                 rate_controller: WriteRateController = None):
         """
         :param table: The name of Dynamo table
-        :param dynamo_client: A botocore client
+        :param dynamo_client: The client of a boto3 DynamoDB resource (resource.meta.client), it takes and returns
+            items as plain Python values and, unlike the resource, is thread-safe
         :param flush_amount: Maximum number of items to keep in buffer before flushing
         :param retries: Retry specific configurations
+        :param max_workers: Number of threads flushing batches concurrently.
+            A value of 1 flushes synchronously from put_item, greater values hand full batches over to workers
+            through a queue of 2 * max_workers batches, put_item blocks while it is full. A retried batch carries
+            its retry attempt counter and backoff with it to whichever worker picks it up
+        :param rate_controller: Optional write budget shared by the workers, or by several writers
         """
         self.Logger = app.get_logger(__name__, level=logging.INFO)
         self._table_name = table
@@ -42,35 +117,87 @@ class DynamoBatchWriter(object):
         self._flush_amount = flush_amount
         self._retries = retries
         self._retry_attempt = 0
+        self._max_workers = max_workers
+        # bounded, so a producer faster than Dynamo is held back instead of piling batches up in memory
+        self._pending_batches = queue.Queue(maxsize=2 * max_workers)
+        self._workers = []
+        self._worker_errors = []
+        self._rate_controller = rate_controller
 
     def put_item(self, Item) -> None:
         put_request = {'PutRequest': {'Item': Item}}
         self._items_buffer.append(put_request)
         if len(self._items_buffer) >= self._flush_amount:
-            self._flush()
+            if self._max_workers > 1:
+                self._submit(self._items_buffer)
+                self._items_buffer = []
+            else:
+                self._flush()
 
-    def _backoff_if_needed(self):
-        if self._retry_attempt > 0 and self._retries.max_delay != 0:
-            delay = min(self._retries.init_delay * 2 ** (self._retry_attempt - 1), self._retries.max_delay)
-            self.Logger.debug(f"_backoff_if_needed: retry attempt - {self._retry_attempt },"
+    def _backoff_if_needed(self, retry_attempt: int = None):
+        retry_attempt = self._retry_attempt if retry_attempt is None else retry_attempt
+        if retry_attempt > 0 and self._retries.max_delay != 0:
+            delay = min(self._retries.init_delay * 2 ** (retry_attempt - 1), self._retries.max_delay)
+            self.Logger.debug(f"_backoff_if_needed: retry attempt - {retry_attempt},"
                               f" delay - {delay} second(s)")
             time.sleep(delay)
 
+    def _send(self, items_to_send) -> list:
+        """
+        Sends one batch_write_item request
+        :param items_to_send: up to flush_amount put requests
+        :return: put requests Dynamo did not process
+        """
+        if self.Logger.isEnabledFor(logging.DEBUG):
+            self.Logger.debug(f"_send: number of items to send - {len(items_to_send)}")
+        with tracing.span("flush"), \
+                metrics.get_metrics().timer(app.METRICS_NAMESPACE, 'Batch write time', {'Module Name': 'store'}):
+            try:
+                unprocessed_items = self._send_batch(items_to_send)
+            except ClientError as err:
+                if err.response['Error']['Code'] in RETRY_EXCEPTIONS:
+                    tracing.count("throttles")
+                raise
+        tracing.count("items_written", len(items_to_send) - len(unprocessed_items))
+        if unprocessed_items:
+            tracing.count("throttles")
+        return unprocessed_items
+
+    def _send_batch(self, items_to_send) -> list:
+        if self._rate_controller is None:
+            response = self._client.batch_write_item(RequestItems={self._table_name: items_to_send})
+        else:
+            estimated_units = self._rate_controller.acquire(len(items_to_send))
+            try:
+                response = self._client.batch_write_item(RequestItems={self._table_name: items_to_send},
+                                                         ReturnConsumedCapacity='INDEXES')
+            except ClientError as err:
+                if err.response['Error']['Code'] in RETRY_EXCEPTIONS:
+                    self._rate_controller.on_throttle()
+                raise
+
+        unprocessed_items = response['UnprocessedItems']
+        unprocessed_items = unprocessed_items.get(self._table_name, []) if unprocessed_items else []
+        if unprocessed_items:
+            self.Logger.debug(f"_send: number of unprocessed items - {len(unprocessed_items)}")
+        if self._rate_controller is not None:
+            # the budget is the table's own capacity, writes to the date-symbol-index consume the index's capacity
+            consumed_units = sum(capacity.get('Table', {}).get('CapacityUnits', 0)
+                                 for capacity in response.get('ConsumedCapacity', []))
+            self._rate_controller.on_success(estimated_units, consumed_units,
+                                             len(items_to_send) - len(unprocessed_items), bool(unprocessed_items))
+        return unprocessed_items
+
     def _flush(self):
         self._backoff_if_needed()
         items_to_send = self._items_buffer[:self._flush_amount]
         self._items_buffer = self._items_buffer[self._flush_amount:]
 
         try:
-            self.Logger.debug(f"_flush: number of items to send - {len(items_to_send)}")
-            response = self._client.batch_write_item(RequestItems={self._table_name: items_to_send})
-            unprocessed_items = response['UnprocessedItems']
-
-            if unprocessed_items and unprocessed_items[self._table_name]:
-                self.Logger.debug(f"_flush: number of unprocessed items - {len(unprocessed_items[self._table_name])}")
-                self._prepare_retry(unprocessed_items[self._table_name])
+            unprocessed_items = self._send(items_to_send)
+            if unprocessed_items:
+                self._prepare_retry(unprocessed_items)
             else:
-                self._items_buffer = []
                 self._retry_attempt = 0
         except ClientError as err:
             if err.response['Error']['Code'] not in RETRY_EXCEPTIONS:
@@ -78,17 +205,86 @@ class DynamoBatchWriter(object):
             self._prepare_retry(items_to_send)
             self._flush()
 
-    def _prepare_retry(self, unprocessed_items):
-        self._retry_attempt = self._retry_attempt + 1
-        if 0 <= self._retries.max_attempts < self._retry_attempt:
+    def _check_retry_attempt(self, retry_attempt: int):
+        if 0 <= self._retries.max_attempts < retry_attempt:
             raise RetriesExceededError(None,
-                                       msg=f"Max Retries Exceeded: retry attempt - {self._retry_attempt},"
+                                       msg=f"Max Retries Exceeded: retry attempt - {retry_attempt},"
                                            f" max retries - {self._retries.max_attempts}")
+
+    def _prepare_retry(self, unprocessed_items):
+        self._retry_attempt = self._retry_attempt + 1
+        self._check_retry_attempt(self._retry_attempt)
         self._items_buffer.extend(unprocessed_items)
 
+    def _submit(self, items_to_send):
+        if not self._workers:
+            for i in range(self._max_workers):
+                worker = threading.Thread(target=self._work, name=f"dynamo-writer-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+        self._pending_batches.put((items_to_send, 0))
+
+    def _work(self):
+        """
+        Worker loop: takes (batch, retry attempt) pairs from the shared queue until it gets None. Unprocessed or
+        throttled items go back to the queue with their retry attempt, so any worker can pick them up and back off
+        accordingly. When the queue is full the worker retries them itself, waiting for room could deadlock it with
+        the producer. Once any worker fails, the remaining batches are drained without being sent.
+        """
+        while True:
+            pending_batch = self._pending_batches.get()
+            try:
+                if pending_batch is None:
+                    return
+                items_to_send, retry_attempt = pending_batch
+                while not self._worker_errors:
+                    self._backoff_if_needed(retry_attempt)
+                    try:
+                        unprocessed_items = self._send(items_to_send)
+                    except ClientError as err:
+                        if err.response['Error']['Code'] not in RETRY_EXCEPTIONS:
+                            raise
+                        unprocessed_items = items_to_send
+                    if not unprocessed_items:
+                        break
+                    retry_attempt += 1
+                    self._check_retry_attempt(retry_attempt)
+                    try:
+                        self._pending_batches.put_nowait((unprocessed_items, retry_attempt))
+                        break
+                    except queue.Full:
+                        items_to_send = unprocessed_items
+            except Exception as e:
+                self._worker_errors.append(e)
+            finally:
+                self._pending_batches.task_done()
+
+    def _close_workers(self):
+        if self._items_buffer:
+            self._submit(self._items_buffer)
+            self._items_buffer = []
+        if not self._workers:
+            return
+        self._pending_batches.join()
+        for _ in self._workers:
+            self._pending_batches.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        if self._worker_errors:
+            raise self._worker_errors[0]
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, tb):
-        while self._items_buffer:
-            self._flush()
+        try:
+            if self._max_workers > 1:
+                self._close_workers()
+            while self._items_buffer:
+                self._flush()
+        except Exception as e:
+            # an exception raised in the with-block is the one to report
+            if exc_type is None:
+                raise
+            self.Logger.error(f"__exit__: failed to write the remaining items - {e}")
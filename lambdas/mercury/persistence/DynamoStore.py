@@ -1,75 +1,390 @@
-from datetime import datetime
-from typing import Generator
+import hashlib
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Generator, Iterable, List, Tuple
 
 from boto3.exceptions import RetriesExceededError
 from botocore.exceptions import ClientError
 import app
+from app import tracing
+from app.util.DictUtils import DictUtils
 from datawell.decorators import log_execution_time
-from persistence.DynamoBatchWriter import DynamoBatchWriter, RetryConfig
+from persistence.BlobStore import BlobStore
+from persistence.DocumentCache import DocumentCache
+from persistence.DocumentCodec import BLOB_ATTRIBUTE, ENCODING_ATTRIBUTE, DocumentCodec
+from persistence.DocumentManifest import DocumentManifest
+from persistence.DynamoBatchWriter import DynamoBatchWriter, RetryConfig, WriteRateController
 from datetime import date
 from app import Results, ActionStatus, AppException
-import boto3
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Attr, Key
+from boto3.dynamodb.types import Binary
+
+DATE_INDEX_NAME = 'date-symbol-index'
+BATCH_GET_SIZE = 100
+POINTER_ATTRIBUTE = 'document_pointer'
+POINTER_HASH_ATTRIBUTE = 'document_pointer_hash'
+# hard limit of a Dynamo item, names and values included
+DYNAMO_MAX_ITEM_BYTES = 400 * 1024
+# tables known to exist, so the check is made once per container
+_EXISTING_TABLES = set()
 
 
 class DynamoStore:
-    def __init__(self, table_name: str):
+    def __init__(self, table_name: str, cache: DocumentCache = None, manifest: DocumentManifest = None,
+                 codec: DocumentCodec = None, blob_store: BlobStore = None):
+        """
+        :param table_name: name of the Dynamo table
+        :param cache: optional read-through cache for lookups of dates before today, invalidated by the dates this
+            store writes; empty results are not cached
+        :param manifest: optional manifest of the last written documents, unchanged documents are then stored as
+            references to the date their content was last written under
+        :param codec: optional codec compressing large documents on write, compressed documents are decoded on
+            read whether it is given or not
+        :param blob_store: optional store the bodies of items over DOCUMENT_OFFLOAD_MIN_BYTES are written to,
+            the item keeps a pointer to it; without it only items over the Dynamo limit are not written, and the
+            store reports an error. Needed to read them back.
+        """
         self.Logger = app.get_logger(__name__)
-        self.dynamoDb = boto3.resource("dynamodb")
+        self.cache = cache
+        self.manifest = manifest
+        self.codec = codec
+        self.blob_store = blob_store
+        self.StoreStats = {"written": 0, "skipped": 0, "offloaded": 0, "oversized": 0}
+        # one resource per container, shared by all the stores and warm invocations
+        self.dynamoDb = app.get_dynamodb_resource()
         self.table = self.dynamoDb.Table(app.AWS_TABLE_NAME)
 
-    @log_execution_time(category="store")
     def store_documents(self, documents: list) -> ActionStatus:
         """
         Persists list of dict() provided into the Dynamo table of the repo
         :param documents:
         :return: ActionStatus with SUCCESS when stored successfully, ERROR if failed, AppException if AWS Error: No access etc
                 """
+        return self.store_document_batches([documents])
+
+    @log_execution_time(category="store")
+    def store_document_batches(self, document_batches: Iterable[list]) -> ActionStatus:
+        """
+        Persists batches of dict() into the Dynamo table as they arrive. Each batch is cleaned right before it is handed
+        to the writer, so pass a generator (e.g. Iex.iter_symbols_batches) to overlap loading and storing.
+        :param document_batches: iterable of lists of symbol dicts
+        :return: ActionStatus with SUCCESS when stored successfully, ERROR if failed or documents too large for Dynamo
+            were dropped, AppException if AWS Error: No access etc
+        """
+        written_dates = set()
+        manifest_updates = {}
+        self.StoreStats = {"written": 0, "skipped": 0, "offloaded": 0, "oversized": 0}
         try:
-            cleaned_documents = self.cleanup_symbol_documents(documents)
-            client = self.get_dynamodb_resouce()
+            # the writer's workers share it: resources are not thread-safe, the client of the resource is
+            client = self.dynamoDb.meta.client
+            self._ensure_table()
 
-            # if table does not exist, create it
-            try:
-                self.table.creation_date_time
-            except :
-                   self.create_table()
-
-            with DynamoBatchWriter(table=app.AWS_TABLE_NAME, dynamo_client=client, retries=RetryConfig(10)) as batch:
-                for document in cleaned_documents:
-                    batch.put_item(
-                        Item={
-                            'symbol': document['symbol'],
-                            'date': document['date'],
-                            'document': document
-                        }
-                    )
+            rate_controller = WriteRateController(app.DYNAMO_WRITE_CAPACITY_UNITS)
+            with DynamoBatchWriter(table=app.AWS_TABLE_NAME, dynamo_client=client, retries=RetryConfig(10),
+                                   max_workers=app.MAX_PERSISTENCE_THREADS, rate_controller=rate_controller) as batch:
+                for documents in document_batches:
+                    for document in self.cleanup_symbol_documents(documents):
+                        written_dates.add(document['date'])
+                        item = self._build_item(document, manifest_updates)
+                        item = self._offload_if_oversized(self.codec.encode(item) if self.codec is not None else item,
+                                                          manifest_updates)
+                        if item is not None:
+                            batch.put_item(Item=item)
+            if self.manifest is not None:
+                self.manifest.update(manifest_updates)
+            self.Logger.info(f"Stored {self.StoreStats['written']} documents "
+                             f"({self.StoreStats['offloaded']} offloaded to the blob store), "
+                             f"skipped {self.StoreStats['skipped']} unchanged documents")
+            if self.StoreStats['oversized']:
+                self.Logger.error(f"Dropped {self.StoreStats['oversized']} documents over the Dynamo item size limit, "
+                                  f"configure a blob store to keep them")
+                return ActionStatus.ERROR
             return ActionStatus.SUCCESS
         except (ClientError, RetriesExceededError):
             return ActionStatus.ERROR
         except Exception as e:
             ex = AppException(ex=e, message='Failed to store documents to DynamoDB.')
             raise ex
+        finally:
+            if self.cache is not None:
+                for written_date in written_dates:
+                    self.cache.invalidate(str(written_date))
+
+    def _build_item(self, document: dict, manifest_updates: dict) -> dict:
+        """
+        Builds the Dynamo item for a cleaned document. If the manifest says the symbol's content has not changed
+        since it was last written, the item only references the date of that write.
+        :param document: cleaned symbol document
+        :param manifest_updates: collects (hash, date) of fully written documents to be recorded in the manifest
+        :return: Dynamo item
+        """
+        item = {
+            'symbol': document['symbol'],
+            'date': document['date']
+        }
+        if self.manifest is None:
+            item['document'] = document
+            self.StoreStats["written"] += 1
+            return item
+
+        document_hash = DocumentManifest.hash_document(document)
+        last_written = self.manifest.get(document['symbol'])
+        item['document_hash'] = document_hash
+        if last_written and last_written[0] == document_hash and last_written[1] != str(document['date']):
+            item['document_ref'] = last_written[1]
+            self.StoreStats["skipped"] += 1
+        else:
+            item['document'] = document
+            manifest_updates[document['symbol']] = (document_hash, document['date'])
+            self.StoreStats["written"] += 1
+        return item
+
+    def _offload_if_oversized(self, item: dict, manifest_updates: dict):
+        """
+        Moves the body of an item close to the Dynamo size limit to the blob store, the item keeps a pointer to it
+        and the hash of its content. Without a blob store the item is written as is, unless it is over the limit:
+        then it is dropped, so it does not fail its whole batch.
+        :param item: Dynamo item, its document possibly compressed
+        :param manifest_updates: a dropped document is removed from it
+        :return: item to write, None to drop it
+        """
+        item_size = estimate_item_size(item)
+        if item_size < app.DOCUMENT_OFFLOAD_MIN_BYTES:
+            return item
+        if self.blob_store is None:
+            if item_size <= DYNAMO_MAX_ITEM_BYTES:
+                return item
+            self.Logger.error(f"{item['symbol']} on {item['date']} is too large for a Dynamo item, dropped")
+            manifest_updates.pop(item['symbol'], None)
+            self.StoreStats["written"] -= 1
+            self.StoreStats["oversized"] += 1
+            return None
+
+        # a compressed body is offloaded as is, its encoding stays in the item
+        body = item.pop(BLOB_ATTRIBUTE) if BLOB_ATTRIBUTE in item else DocumentCodec.serialize(item.pop('document'))
+        body_hash = hashlib.sha256(body).hexdigest()
+        pointer = f"{item['symbol']}/{item['date']}/{body_hash}"
+        self.blob_store.put(pointer, body)
+        item[POINTER_ATTRIBUTE] = pointer
+        item[POINTER_HASH_ATTRIBUTE] = body_hash
+        self.StoreStats["offloaded"] += 1
+        return item
+
+    def _resolve_pointers(self, items: list) -> list:
+        """
+        Fetches the offloaded bodies of items from the blob store, concurrently, and puts the documents back
+        :param items: items as read from Dynamo
+        :return: the same items, pointers resolved in place
+        """
+        pointed = [item for item in items if POINTER_ATTRIBUTE in item]
+        if not pointed:
+            return items
+        if self.blob_store is None:
+            self.Logger.warning(f"{len(pointed)} documents are offloaded to a blob store, none is configured")
+            return items
+
+        with ThreadPoolExecutor(max_workers=min(len(pointed), app.MAX_PERSISTENCE_THREADS)) as executor:
+            bodies = list(executor.map(lambda item: self.blob_store.get(item[POINTER_ATTRIBUTE]), pointed))
+        for item, body in zip(pointed, bodies):
+            if hashlib.sha256(body).hexdigest() != item[POINTER_HASH_ATTRIBUTE]:
+                raise AppException(message=f"Offloaded document {item[POINTER_ATTRIBUTE]} does not match its hash")
+            del item[POINTER_ATTRIBUTE], item[POINTER_HASH_ATTRIBUTE]
+            if ENCODING_ATTRIBUTE in item:
+                item[BLOB_ATTRIBUTE] = body
+                DocumentCodec.decode(item)
+            else:
+                item['document'] = DocumentCodec.deserialize(body)
+        return items
+
+    def _resolve_documents(self, items: list) -> list:
+        return self._resolve_references(self._resolve_pointers(items))
+
+    def _resolve_references(self, items: list) -> list:
+        """
+        Replaces references to unchanged documents written under an earlier date with the documents themselves
+        :param items: items as read from Dynamo
+        :return: the same items, references resolved in place
+        """
+        references = list({(item['symbol'], item['document_ref']) for item in items if 'document_ref' in item})
+        if not references:
+            return items
+        referenced_items = self._get_items(references, RetryConfig(10))
+        for item in items:
+            if 'document_ref' not in item:
+                continue
+            referenced_item = referenced_items.get((item['symbol'], item['document_ref']))
+            if referenced_item is None or 'document' not in referenced_item:
+                self.Logger.warning(f"{item['symbol']} on {item['date']} references missing {item['document_ref']}")
+                continue
+            item['document'] = dict(referenced_item['document'], date=item['date'])
+        return items
 
     @log_execution_time()
-    def get_filtered_documents(self, symbol_to_find: str = None, target_date: datetime.date = None):
+    def get_filtered_documents(self, symbol_to_find: str = None, target_date: datetime.date = None,
+                               end_date: datetime.date = None, date_prefix: str = None):
         """
         Returns a list of documents matching given ticker and/or date
         :param symbol_to_find: ticker as a string
         :param target_date: desired date as a datetime.date, leave empty to get for all available dates
+        :param end_date: last date (inclusive) to get documents for a range of dates starting at target_date
+        :param date_prefix: dates prefix as a string (e.g. 2020-06), used when target_date is not given
         :return: a list of dicts() each containing data available for a stock for a given period of time
         """
         output = Results()
         try:
-            criteria = SymbolFilterCriteria(symbol_to_find, target_date)
-            output.Results = criteria.query(self.table)
+            cache_key = None
+            if self.cache is not None and target_date and not end_date and is_settled_date(target_date):
+                cache_key = f"query:{symbol_to_find or '*'}:{target_date}"
+                cached_documents = self.cache.get(cache_key)
+                if cached_documents is not None:
+                    output.Results = cached_documents
+                    output.ActionStatus = ActionStatus.SUCCESS
+                    return output
+
+            criteria = SymbolFilterCriteria(symbol_to_find, target_date, end_date=end_date, date_prefix=date_prefix)
+            output.Results = self._resolve_documents(criteria.query(self.table))
             output.ActionStatus = ActionStatus.SUCCESS
+            if cache_key and output.Results:
+                self.cache.put(cache_key, str(target_date), output.Results)
             return output
         except Exception as e:
             catastrophic_exception = AppException(ex=e, message='Catastrophic failure when trying to query symbols '
                                                                 'for the Dynamo!')
             raise catastrophic_exception
 
+    @log_execution_time()
+    def get_documents(self, keys: List[Tuple[str, date]], retries: RetryConfig = RetryConfig(10)) -> Results:
+        """
+        Point lookup of specific documents. Keys are split into BatchGetItem calls of up to 100 keys which run
+        concurrently on up to MAX_PERSISTENCE_THREADS workers, unprocessed keys are retried with exponential backoff
+        :param keys: list of (symbol, date) tuples, date either as a datetime.date or a string
+        :param retries: retry configuration for unprocessed keys
+        :return: dict of found documents keyed by (symbol, date string) inside Results
+        """
+        output = Results()
+        try:
+            assert type(keys) is list
+            unique_keys = list(dict.fromkeys((symbol, str(key_date)) for symbol, key_date in keys))
+            documents = self._get_items(unique_keys, retries)
+            self._resolve_references(list(documents.values()))
+            output.ActionStatus = ActionStatus.SUCCESS
+            output.Results = documents
+        except AssertionError:
+            output.Results = "You have to pass a list of (symbol, date) tuples to the method!"
+        except Exception as e:
+            raise AppException(ex=e, message='Catastrophic failure when trying to get documents from the Dynamo!')
+        return output
+
+    def _get_items(self, keys: List[Tuple[str, str]], retries: RetryConfig) -> dict:
+        """
+        :param keys: list of unique (symbol, date string) tuples
+        :param retries: retry configuration for unprocessed keys
+        :return: dict of found items keyed by (symbol, date string)
+        """
+        items = {}
+        if self.cache is not None:
+            for key in keys:
+                cached_item = self.cache.get(f"item:{key[0]}:{key[1]}")
+                if cached_item is not None:
+                    items[key] = cached_item
+            keys = [key for key in keys if key not in items]
+
+        chunks = [keys[i:i + BATCH_GET_SIZE] for i in range(0, len(keys), BATCH_GET_SIZE)]
+        if chunks:
+            with ThreadPoolExecutor(max_workers=min(len(chunks), app.MAX_PERSISTENCE_THREADS)) as executor:
+                for chunk_items in executor.map(lambda chunk: self._batch_get(chunk, retries), chunks):
+                    for item in self._resolve_pointers(chunk_items):
+                        items[(item["symbol"], item["date"])] = item
+                        if self.cache is not None and is_settled_date(item["date"]):
+                            self.cache.put(f"item:{item['symbol']}:{item['date']}", item["date"], item)
+        return items
+
+    def _batch_get(self, keys: List[Tuple[str, str]], retries: RetryConfig) -> list:
+        """
+        Gets up to 100 items by their keys, retrying unprocessed keys until all of them are processed
+        :param keys: list of (symbol, date string) tuples
+        :param retries: retry configuration
+        :return: list of found items
+        """
+        items = []
+        request_items = {
+            app.AWS_TABLE_NAME: {"Keys": [{"symbol": symbol, "date": key_date} for symbol, key_date in keys]}
+        }
+        retry_attempt = 0
+        # runs on worker threads: resources are not thread-safe, the client of the resource is
+        client = self.dynamoDb.meta.client
+        while request_items:
+            response = client.batch_get_item(RequestItems=request_items)
+            items += DocumentCodec.decode_all(response["Responses"].get(app.AWS_TABLE_NAME, []))
+            request_items = response.get("UnprocessedKeys")
+            if request_items:
+                retry_attempt += 1
+                if 0 <= retries.max_attempts < retry_attempt:
+                    raise RetriesExceededError(None, msg=f"Max Retries Exceeded: retry attempt - {retry_attempt},"
+                                                         f" max retries - {retries.max_attempts}")
+                delay = min(retries.init_delay * 2 ** (retry_attempt - 1), retries.max_delay)
+                self.Logger.debug(f"_batch_get: {len(request_items[app.AWS_TABLE_NAME]['Keys'])} unprocessed keys,"
+                                  f" retry in {delay} second(s)")
+                time.sleep(delay)
+        return items
+
+    def iter_filtered_documents(self, symbol_to_find: str = None, target_date: datetime.date = None,
+                                projection: List[str] = None, end_date: datetime.date = None,
+                                date_prefix: str = None) -> Generator[dict, None, None]:
+        """
+        Same as get_filtered_documents, but yields documents one by one while fetching them page by page,
+        so arbitrarily large result sets can be processed in constant memory
+        :param symbol_to_find: ticker as a string
+        :param target_date: desired date as a datetime.date, leave empty to get for all available dates
+        :param projection: attribute names or dotted paths (e.g. document.company) to return, leave empty for all
+        :param end_date: last date (inclusive) to get documents for a range of dates starting at target_date
+        :param date_prefix: dates prefix as a string (e.g. 2020-06), used when target_date is not given
+        :return: generator of dicts each containing data available for a stock for a given period of time
+        """
+        try:
+            document_paths = None
+            if projection:
+                # the keys are needed to resolve references and offloaded documents
+                projection = list(dict.fromkeys(["symbol", "date"] + projection))
+            if projection and any(path.split(".")[0] == "document" for path in projection):
+                # unchanged documents are stored as references, large ones compressed or offloaded, so their paths
+                # can't be projected by Dynamo: whole documents are read and projected once decoded
+                document_paths = [path.partition(".")[2] for path in projection if path.split(".")[0] == "document"]
+                projection = projection + ["document_ref", BLOB_ATTRIBUTE, ENCODING_ATTRIBUTE, POINTER_ATTRIBUTE,
+                                           POINTER_HASH_ATTRIBUTE]
+            criteria = SymbolFilterCriteria(symbol_to_find, target_date, end_date=end_date, date_prefix=date_prefix)
+            for page in criteria.query_by_page(self.table, projection):
+                stored_whole = [any(name in item for name in ("document_ref", ENCODING_ATTRIBUTE, POINTER_ATTRIBUTE))
+                                for item in page["Items"]]
+                for item, was_stored_whole in zip(self._resolve_documents(DocumentCodec.decode_all(page["Items"])),
+                                                  stored_whole):
+                    if was_stored_whole and document_paths and all(document_paths) and 'document' in item:
+                        item['document'] = DocumentCodec.project(item['document'], document_paths)
+                    yield item
+        except ClientError as e:
+            raise AppException(ex=e, message='Catastrophic failure when trying to query symbols for the Dynamo!')
+
+    def scan_documents(self, total_segments: int = app.SCAN_SEGMENTS, limit: int = None,
+                       projection: List[str] = None) -> Generator[dict, None, None]:
+        """
+        Exports the entire table item by item, use for backtesting dumps which do not fit into memory
+        :param total_segments: number of segments scanned concurrently
+        :param limit: maximum number of items to return, leave empty to read the entire table
+        :param projection: attribute names or dotted paths to return, leave empty for all
+        :return: generator of items in no particular order
+        """
+        items = []
+        for item in SymbolFilterCriteria.parallel_scan(self.table, total_segments, limit, projection):
+            items.append(item)
+            if len(items) == BATCH_GET_SIZE:
+                yield from self._resolve_documents(items)
+                items = []
+        yield from self._resolve_documents(items)
+
     @log_execution_time()
     def clean_table(self, symbols_to_remove: list) -> Results:
         """
@@ -84,11 +399,15 @@ class DynamoStore:
             if symbols_to_remove:
                 self.Logger.info(f"Deleting {symbols_to_remove}")
                 total_deleted_items = self._delete_symbols(symbols_to_remove)
+                if self.manifest is not None:
+                    self.manifest.forget([symbol.get("symbol") for symbol in symbols_to_remove if symbol.get("symbol")])
                 output.ActionStatus = ActionStatus.SUCCESS
                 output.Results = total_deleted_items
             else:
                 self.Logger.info('Nothing is specified to delete, so deleting the entire table')
                 self._recreate_table()
+                if self.manifest is not None:
+                    self.manifest.forget()
                 output.ActionStatus = ActionStatus.SUCCESS
                 output.Results = -1
         except AssertionError:
@@ -173,7 +492,7 @@ class DynamoStore:
             ],
             GlobalSecondaryIndexes=[
                 {
-                    'IndexName': 'date-symbol-index',
+                    'IndexName': DATE_INDEX_NAME,
                     'KeySchema': [
                         {
                             'AttributeName': 'date',
@@ -188,137 +507,302 @@ class DynamoStore:
                         'ProjectionType': 'ALL',
                     },
                     'ProvisionedThroughput': {
-                        'ReadCapacityUnits': 5,
-                        'WriteCapacityUnits': 100,
+                        'ReadCapacityUnits': app.DYNAMO_READ_CAPACITY_UNITS,
+                        'WriteCapacityUnits': app.DYNAMO_WRITE_CAPACITY_UNITS,
                     }
                 },
             ],
             BillingMode='PROVISIONED',
             ProvisionedThroughput={
-                'ReadCapacityUnits': 5,
-                'WriteCapacityUnits': 100,
+                'ReadCapacityUnits': app.DYNAMO_READ_CAPACITY_UNITS,
+                'WriteCapacityUnits': app.DYNAMO_WRITE_CAPACITY_UNITS,
             },
         )
         self.Logger.info('Wait until the table exists.')
         self.table.meta.client.get_waiter('table_exists').wait(TableName=app.AWS_TABLE_NAME)
+        _EXISTING_TABLES.add(app.AWS_TABLE_NAME)
+
+    def _ensure_table(self) -> None:
+        """
+        Creates the table if it does not exist. Checked once per container, warm invocations skip the
+        DescribeTable call.
+        """
+        if app.AWS_TABLE_NAME in _EXISTING_TABLES:
+            return
+        try:
+            self.table.creation_date_time
+            _EXISTING_TABLES.add(app.AWS_TABLE_NAME)
+        except ClientError:
+            self.create_table()
   
     def _recreate_table(self) -> None:
         """
         Use this method to clean the table quickly. It drops and creates a new table with the same schema.
         """
         self.Logger.info('Delete the table')
+        _EXISTING_TABLES.discard(app.AWS_TABLE_NAME)
         self.table.delete()
         self.Logger.info('Wait until the table is deleted')
         self.table.meta.client.get_waiter('table_not_exists').wait(TableName=app.AWS_TABLE_NAME)
         self.create_table()
 
 
-    def remove_empty_strings(self, dict_to_clean: dict) -> Results:
-        """
-        Removes all the empty key+value pairs from the dict you give it; use to clean up dicts before persisting them to the DynamoDB
-        :param dict_to_clean: as dict()
-        :return: only non-empty key+value pairs from the source dict as dict() inside Results
-        """
-        try:
-            # start with your guard clauses - thats a standard situation you have to handle in your error handling
-            assert type(dict_to_clean) is dict
-
-            # here comes processing...
-            def recursive_clean(dict_to_process: dict) -> dict:
-                for key in list(dict_to_process.keys()):
-                    value = dict_to_process[key]
-                    # clean if empty string or collection or None
-                    if isinstance(value, (str, dict, list, tuple, type(None))) and not value:
-                        del dict_to_process[key]
-                    elif type(value) is dict:
-                        processed_dict = recursive_clean(value)
-                        if processed_dict:
-                            dict_to_process[key] = processed_dict
-                        else:
-                            del dict_to_process[key]
-
-                return dict_to_process
-
-            cleaned_dict = recursive_clean(dict_to_clean)
-
-            # now you are ready to ship back...
-            output = Results()
-            output.ActionStatus = ActionStatus.SUCCESS
-            output.Results = cleaned_dict
-            return output
-
-        # here we have exceptions we KNOW we can encounter...
-        except AssertionError:
-            output = Results()
-            output.Results = "You have to pass dict to this method!"
-            return output
-
-        # and this analog of *nix panic(*message)...
-        except Exception as e:
-            catastrophic_exception = AppException(ex=e, message='Catastrophic failure when trying to clean up dict '
-                                                                'from the Dynamo!')
-            raise catastrophic_exception
-
     @log_execution_time()
     def get_dynamodb_resouce(self):
-        return boto3.resource(
-            'dynamodb',
-            aws_access_key_id=app.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=app.AWS_SECRET_ACCESS_KEY,
-            region_name=app.AWS_TABLE_REGION
-        )
-
-    def validate_symbol_document(self, document):
-        return document is not None and ('symbol' in document) and ('date' in document)
+        return self.dynamoDb
 
     def cleanup_symbol_documents(self, documents):
         """
-                1. Removes all the empty key+value pairs from documents
+                1. Removes all the empty key+value pairs from documents and turns floats into Decimal, in place
                 2. Deletes documents without 'symbol' and 'date' key from the list.
                 :param documents: list of symbol dicts
                 :returns: cleaned up list of symbol dicts
                 """
-        non_empty_docs_result = [self.remove_empty_strings(doc).Results for doc in documents]
-        cleaned_up = [doc for doc in non_empty_docs_result if self.validate_symbol_document(doc)]
-        return cleaned_up
+        with tracing.span("clean"):
+            cleaned = DictUtils.clean_documents(documents, required_keys=('symbol', 'date'))
+        tracing.count("items_cleaned", len(cleaned))
+        return cleaned
+
+
+def is_settled_date(partition_date) -> bool:
+    """
+    Dates before today are no longer written to, so their documents can be cached. Today's partition is still being
+    written, possibly by other containers whose writes do not invalidate this container's cache.
+    :param partition_date: date as a datetime.date or a string
+    :return: True if the partition is settled
+    """
+    return str(partition_date) < str(date.today())
+
+
+def estimate_item_size(item: dict) -> int:
+    """
+    Approximates the size Dynamo accounts for an item, as its documentation describes it: names and strings count
+    their UTF-8 length, numbers a byte per two significant digits plus one, maps and lists 3 bytes plus a byte per
+    element on top of their elements
+    :param item: Dynamo item
+    :return: size in bytes
+    """
+    return sum(len(name.encode('utf-8')) + _attribute_value_size(value) for name, value in item.items())
+
+
+def _attribute_value_size(value) -> int:
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, Binary):
+        return len(value.value)
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, Decimal)):
+        number = Decimal(str(value)) if isinstance(value, float) else Decimal(value)
+        if not number.is_finite():
+            return len(str(number))
+        # leading and trailing zeros are not stored
+        significant_digits = len(number.normalize().as_tuple().digits)
+        return (significant_digits + 1) // 2 + 1
+    if isinstance(value, dict):
+        return 3 + sum(len(str(key).encode('utf-8')) + _attribute_value_size(element) + 1
+                       for key, element in value.items())
+    if isinstance(value, (list, tuple)):
+        return 3 + sum(_attribute_value_size(element) + 1 for element in value)
+    if isinstance(value, (set, frozenset)):
+        return sum(_attribute_value_size(element) for element in value)
+    return len(str(value).encode('utf-8'))
 
 
 class SymbolFilterCriteria:
     """
     Represents criteria which is used to query data from Dynamo table by the following keys - symbol and date.
-    If keys are not specified is scans the entire table.
+    Symbol lookups query the table itself, date-only lookups query the date-symbol-index, one query per day,
+    since date is the hash key of the index. If keys are not specified is scans the entire table,
+    by scan_segments parallel segments.
     """
-    def __init__(self, symbol_to_find: str = None, target_date: date = None):
-        self.criteria_expression = self._build_criteria_expression(symbol_to_find, target_date)
+    def __init__(self, symbol_to_find: str = None, target_date: date = None, scan_segments: int = app.SCAN_SEGMENTS,
+                 scan_limit: int = None, end_date: date = None, date_prefix: str = None):
+        """
+        :param symbol_to_find: ticker as a string
+        :param target_date: desired date as a datetime.date, or the first date of the range if end_date is given
+        :param scan_segments: number of segments scanned concurrently when no keys are specified
+        :param scan_limit: maximum number of items a scan returns, leave empty to read the entire table
+        :param end_date: last date (inclusive) of the range starting at target_date, which is then required
+        :param date_prefix: desired dates prefix as a string, e.g. 2020-06 for the entire June 2020
+        """
+        self.queries: List[dict] = self._build_queries(symbol_to_find, target_date, end_date, date_prefix)
+        self.scan_filter = None
+        if not self.queries and date_prefix:
+            # a prefix shorter than a year can't be expanded to dates, so the index is of no use here
+            self.scan_filter = Attr("date").begins_with(date_prefix)
+        self.scan_segments = scan_segments
+        self.scan_limit = scan_limit
 
-    def _build_criteria_expression(self, symbol_to_find: str = None, target_date: date = None):
-        criteria_expression = None
+    def _build_queries(self, symbol_to_find: str = None, target_date: date = None, end_date: date = None,
+                       date_prefix: str = None) -> List[dict]:
+        """
+        Plans the queries needed to fetch the items matching the criteria
+        :return: list of query parameters, empty if the table has to be scanned. Raises ValueError for a range
+            without its first date or ending before it, and for a date prefix no date starts with
+        """
+        if end_date and not target_date:
+            raise ValueError(f"end_date {end_date} is given without the target_date the range starts at")
+        if end_date and end_date < target_date:
+            raise ValueError(f"end_date {end_date} is before target_date {target_date}")
         if symbol_to_find:
             criteria_expression = Key("symbol").eq(symbol_to_find)
-        if target_date:
-            date_query = Key("date").eq(str(target_date))
-            criteria_expression = criteria_expression & date_query if criteria_expression else date_query
-        return criteria_expression
+            if target_date and end_date:
+                criteria_expression &= Key("date").between(str(target_date), str(end_date))
+            elif target_date:
+                criteria_expression &= Key("date").eq(str(target_date))
+            elif date_prefix:
+                criteria_expression &= Key("date").begins_with(date_prefix)
+            return [{"KeyConditionExpression": criteria_expression}]
+
+        if target_date and end_date:
+            dates = [target_date + timedelta(days=i) for i in range((end_date - target_date).days + 1)]
+        elif target_date:
+            dates = [target_date]
+        elif date_prefix and len(date_prefix) >= 4 and date_prefix[:4].isdigit():
+            year = int(date_prefix[:4])
+            first_day = date(year, 1, 1)
+            dates = [first_day + timedelta(days=i) for i in range((date(year + 1, 1, 1) - first_day).days)]
+            dates = [day for day in dates if str(day).startswith(date_prefix)]
+            if not dates:
+                raise ValueError(f"No date starts with the date prefix {date_prefix}")
+        else:
+            return []
+        return [{"IndexName": DATE_INDEX_NAME, "KeyConditionExpression": Key("date").eq(str(day))} for day in dates]
 
     @log_execution_time()
     def query(self, table) -> list:
         """
         :param table: DynamoDB table to apply this criteria to
-        :returns: list of items filtered by criteria or the entire table data if the criteria keys were not specified
+        :returns: list of items filtered by criteria or the entire table data if the criteria keys were not specified,
+            compressed documents decoded
         """
+        if not self.queries and not self.scan_filter and self.scan_segments > 1:
+            return list(self.parallel_scan(table, self.scan_segments, self.scan_limit))
+
         items = []
-        query_params: dict = {}
-        if self.criteria_expression:
-            query_params["KeyConditionExpression"] = self.criteria_expression
+        for page in self.query_by_page(table):
+            items += DocumentCodec.decode_all(page["Items"])
+            if self.scan_limit and not self.queries and len(items) >= self.scan_limit:
+                return items[:self.scan_limit]
+        return items
+
+    def query_by_page(self, table, projection: List[str] = None) -> Generator[dict, None, None]:
+        """
+        Lazily queries (or scans, if keys were not specified) the table, a page is requested only when the previous
+        one has been consumed.
+        :param table: DynamoDB table to apply this criteria to
+        :param projection: attribute names or dotted paths (e.g. document.company) to return, leave empty for all
+        :return: an iterable of pages as returned by Dynamo, compressed documents are left to the caller to decode
+        """
+        if not self.queries:
+            scan_params: dict = self._projection_params(projection) if projection else {}
+            if self.scan_filter:
+                scan_params["FilterExpression"] = self.scan_filter
+            yield from self._paginate(table.scan, scan_params)
+            return
+
+        for query in self.queries:
+            query_params: dict = self._projection_params(projection) if projection else {}
+            query_params.update(query)
+            yield from self._paginate(table.query, query_params)
+
+    @staticmethod
+    def _paginate(operation, params: dict) -> Generator[dict, None, None]:
         while True:
-            response = \
-                table.query(**query_params) \
-                if "KeyConditionExpression" in query_params.keys() \
-                else table.scan(**query_params)
-            items += response["Items"]
+            response = operation(**params)
+
+            yield response
+
             last_evaluated_key = response.get("LastEvaluatedKey")
-            if last_evaluated_key:
-                query_params["ExclusiveStartKey"] = last_evaluated_key
-            else:
-                break
-        return items
+            if not last_evaluated_key:
+                return
+            params["ExclusiveStartKey"] = last_evaluated_key
+
+    @staticmethod
+    def _projection_params(projection: List[str]) -> dict:
+        """
+        Builds ProjectionExpression with a placeholder for every attribute name, since names like date are reserved
+        :param projection: attribute names or dotted paths
+        :return: ProjectionExpression and ExpressionAttributeNames parameters
+        """
+        placeholders: dict = {}
+        paths = []
+        for path in projection:
+            parts = []
+            for name in path.split("."):
+                if name not in placeholders:
+                    placeholders[name] = f"#p{len(placeholders)}"
+                parts.append(placeholders[name])
+            paths.append(".".join(parts))
+        return {
+            "ProjectionExpression": ", ".join(paths),
+            "ExpressionAttributeNames": {placeholder: name for name, placeholder in placeholders.items()}
+        }
+
+    @staticmethod
+    def parallel_scan(table, total_segments: int, limit: int = None,
+                      projection: List[str] = None) -> Generator[dict, None, None]:
+        """
+        Reads the entire table by total_segments Segment scans running on up to MAX_PERSISTENCE_THREADS workers.
+        Items are yielded as soon as their page arrives, in no particular order. Workers share the thread-safe
+        client of the table and block on a bounded queue when the consumer falls behind.
+        :param table: DynamoDB table to scan
+        :param total_segments: number of segments to split the table into
+        :param limit: stop after yielding this number of items, leave empty to read the entire table
+        :param projection: attribute names or dotted paths to return, leave empty for all
+        :return: generator of items
+        """
+        client = table.meta.client
+        pages = queue.Queue(maxsize=total_segments * 2)
+        stop = threading.Event()
+        segment_done = object()
+
+        def put(page) -> None:
+            while not stop.is_set():
+                try:
+                    pages.put(page, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def scan_segment(segment: int) -> None:
+            try:
+                scan_params = {"TableName": table.name, "Segment": segment, "TotalSegments": total_segments}
+                if projection:
+                    scan_params.update(SymbolFilterCriteria._projection_params(projection))
+                while not stop.is_set():
+                    response = client.scan(**scan_params)
+                    put(response["Items"])
+                    last_evaluated_key = response.get("LastEvaluatedKey")
+                    if not last_evaluated_key:
+                        break
+                    scan_params["ExclusiveStartKey"] = last_evaluated_key
+                put(segment_done)
+            except Exception as e:
+                put(e)
+
+        executor = ThreadPoolExecutor(max_workers=min(total_segments, app.MAX_PERSISTENCE_THREADS))
+        for segment in range(total_segments):
+            executor.submit(scan_segment, segment)
+        try:
+            items_count = 0
+            segments_done = 0
+            while segments_done < total_segments:
+                page = pages.get()
+                if page is segment_done:
+                    segments_done += 1
+                    continue
+                if isinstance(page, Exception):
+                    raise page
+                for item in page:
+                    # the client of a resource table already turns wire format attributes into Python values
+                    yield DocumentCodec.decode(item)
+                    items_count += 1
+                    if limit and items_count >= limit:
+                        return
+        finally:
+            stop.set()
+            executor.shutdown(wait=True)
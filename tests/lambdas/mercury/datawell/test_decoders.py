@@ -0,0 +1,85 @@
+import json
+import time
+
+import pytest
+
+import app
+from datawell import decoders
+
+PAYLOAD = b'{"AAPL": {"quote": {"latestPrice": 318.25, "volume": 1000, "name": "Apple \\u00e9"}}}'
+
+
+@pytest.mark.parametrize("name", sorted(decoders.DECODERS))
+def test_decoders_parse_bytes_with_plain_floats(name):
+    # WHEN
+    parsed = decoders.get_decoder(name)(PAYLOAD)
+
+    # THEN
+    assert parsed == {"AAPL": {"quote": {"latestPrice": 318.25, "volume": 1000, "name": "Apple é"}}}
+    assert type(parsed["AAPL"]["quote"]["latestPrice"]) is float
+
+
+def test_auto_decoder_prefers_orjson():
+    # GIVEN
+    pytest.importorskip("orjson")
+
+    # THEN
+    assert decoders.get_decoder("auto") is decoders.orjson_loads
+
+
+def test_auto_decoder_falls_back_to_stdlib_without_orjson(monkeypatch):
+    # GIVEN
+    monkeypatch.setattr(decoders, "DECODERS", {"json": decoders.stdlib_loads})
+
+    # THEN
+    assert decoders.get_decoder("auto") is decoders.stdlib_loads
+    with pytest.raises(app.AppException):
+        decoders.get_decoder("orjson")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 16, 1024])
+def test_iter_object_items_yields_each_key_once_complete(chunk_size):
+    # GIVEN
+    chunks = [PAYLOAD[i:i + chunk_size] for i in range(0, len(PAYLOAD), chunk_size)]
+    payload = b'{"MSFT": 12' + b', "AAPL": {"logo": null} }'
+
+    # WHEN
+    items = list(decoders.iter_object_items(chunks))
+    numbers = list(decoders.iter_object_items(payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)))
+
+    # THEN
+    assert items == [("AAPL", {"quote": {"latestPrice": 318.25, "volume": 1000, "name": "Apple é"}})]
+    assert numbers == [("MSFT", 12), ("AAPL", {"logo": None})]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7])
+def test_iter_object_items_finds_the_end_of_nested_values_and_strings(chunk_size):
+    # GIVEN
+    payload = b'{"A": {"x": ["}", "\\"]", {"y": [1, [2]]}]}, "B": "a\\\\", "C": [], "D": true, "E": -1.5e3}'
+    chunks = [payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)]
+
+    # WHEN
+    items = list(decoders.iter_object_items(chunks))
+
+    # THEN
+    assert items == list(json.loads(payload).items())
+
+
+def test_iter_object_items_parses_large_values_in_linear_time():
+    # GIVEN
+    value = {f"k{i}": [i, str(i), {"n": None}] for i in range(20000)}
+    payload = json.dumps({"A": value, "B": value}).encode()
+
+    # WHEN
+    started = time.perf_counter()
+    items = list(decoders.iter_object_items(payload[i:i + 64] for i in range(0, len(payload), 64)))
+
+    # THEN
+    assert items == [("A", value), ("B", value)]
+    assert time.perf_counter() - started < 5
+
+
+@pytest.mark.parametrize("payload", [b'[1, 2]', b'{"AAPL": {}', b'{"AAPL" {}}', b'{"AAPL": {}, }'])
+def test_iter_object_items_rejects_invalid_documents(payload):
+    with pytest.raises(ValueError):
+        list(decoders.iter_object_items([payload]))
@@ -0,0 +1,50 @@
+import logging
+from unittest.mock import MagicMock
+
+import pytest
+
+import app
+from app.util.TokenBucket import TokenBucket
+from datawell.decorators import log_execution_time, rate_limit, retry
+
+
+@pytest.mark.parametrize("attempt, expected_delay", [
+    (1, 5), (2, 10), (3, 20), (4, 30), (10, 30)
+])
+def test_exponential_delay_doubles_with_jitter(attempt, expected_delay):
+    # WHEN
+    delays = [retry()._exponential_delay(attempt, 5, 30) for _ in range(50)]
+
+    # THEN
+    assert all(expected_delay / 2 <= delay <= expected_delay for delay in delays)
+
+
+def test_rate_limit_takes_a_token_per_call():
+    # GIVEN
+    bucket = MagicMock(spec=TokenBucket)
+    func = rate_limit(bucket)(MagicMock(return_value=42))
+
+    # WHEN
+    results = [func() for _ in range(3)]
+
+    # THEN
+    assert results == [42, 42, 42]
+    assert bucket.acquire.call_count == 3
+
+
+@pytest.mark.parametrize("level, sample_rate, expected_records", [
+    (logging.INFO, 1, 3), (logging.WARNING, 1, 0), (logging.INFO, 0, 0)
+])
+def test_log_execution_time_is_guarded_and_sampled(monkeypatch, level, sample_rate, expected_records):
+    # GIVEN
+    monkeypatch.setattr(app, "LOG_SAMPLE_RATE", sample_rate)
+    logger = MagicMock(spec=logging.Logger)
+    logger.isEnabledFor.side_effect = lambda record_level: record_level >= level
+    func = log_execution_time(logger, sampled=True)(MagicMock(return_value=42, __name__="load"))
+
+    # WHEN
+    results = [func() for _ in range(3)]
+
+    # THEN
+    assert results == [42, 42, 42]
+    assert logger.info.call_count == expected_records
@@ -11,7 +11,7 @@ def test_request_error(mocker, monkeypatch, exception):
     # GIVEN
     monkeypatch.setattr('datawell.decorators.retry.__init__.__defaults__', (2, 0, 0, ()))
     mock_delay = mocker.patch('datawell.decorators.retry._exponential_delay', return_value=0)
-    mocker.patch('requests.get', side_effect=exception)
+    mocker.patch('requests.Session.get', side_effect=exception)
 
     from datawell.iex import Iex
     mocker.patch.object(Iex, 'get_stocks', side_effect=None)
@@ -24,4 +24,34 @@ def test_request_error(mocker, monkeypatch, exception):
     mock_delay.assert_has_calls([
         call(1, 5, 30),
         call(2, 5, 30)
-    ])
\ No newline at end of file
+    ])
+
+
+def test_session_is_shared(monkeypatch):
+    # GIVEN
+    from datawell.iex import Iex
+    monkeypatch.setattr(Iex, '_session', None)
+
+    # WHEN
+    session = Iex.get_session()
+
+    # THEN
+    assert Iex.get_session() is session
+    assert session.headers['Accept-Encoding'] == 'gzip'
+    assert Iex.get_connection_stats() == {'requests': 0, 'opened': 0, 'reused': 0}
+
+
+def test_connection_stats_since_snapshot(mocker, monkeypatch):
+    # GIVEN
+    from datawell.iex import Iex
+    monkeypatch.setattr(Iex, '_session', None)
+    pool = mocker.Mock(num_requests=10, num_connections=2)
+    Iex.get_session().adapters['https://'].poolmanager.pools['iex'] = pool
+    snapshot = Iex.get_connection_stats()
+
+    # WHEN
+    pool.num_requests, pool.num_connections = 15, 3
+
+    # THEN
+    assert snapshot == {'requests': 10, 'opened': 2, 'reused': 8}
+    assert Iex.get_connection_stats(since=snapshot) == {'requests': 5, 'opened': 1, 'reused': 4}
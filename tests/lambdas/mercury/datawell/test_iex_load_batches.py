@@ -0,0 +1,134 @@
+import json
+import random
+import time
+
+import pytest
+
+import app
+
+
+def _symbols(count: int) -> list:
+    return [{"symbol": f"S{i:04d}"} for i in range(count)]
+
+
+def test_load_symbols_datapoints_merges_all_batches(mocker):
+    # GIVEN
+    from datawell.iex import Iex
+    mocker.patch.object(Iex, 'get_stocks', return_value=_symbols(450))
+    mocker.patch.object(Iex, '_check_datapoints', return_value=["company"])
+
+    def fake_batch(url_path, symbols, datapoints):
+        time.sleep(random.uniform(0, 0.01))
+        results = app.Results()
+        results.ActionStatus = app.ActionStatus.SUCCESS
+        results.Results = {symbol: {"company": {"name": symbol.lower()}} for symbol in symbols}
+        return results
+
+    mock_load = mocker.patch.object(Iex, 'load_symbols_from_iex', side_effect=fake_batch)
+
+    # WHEN
+    iex = Iex(["company"])
+
+    # THEN
+    assert mock_load.call_count == 5
+    assert [symbol["symbol"] for symbol in iex.Symbols] == [f"S{i:04d}" for i in range(450)]
+    assert all(symbol["company"]["name"] == symbol["symbol"].lower() for symbol in iex.Symbols)
+
+
+def test_load_symbols_datapoints_skips_failed_batches(mocker):
+    # GIVEN
+    from datawell.iex import Iex
+    mocker.patch.object(Iex, 'get_stocks', return_value=_symbols(200))
+    mocker.patch.object(Iex, '_check_datapoints', return_value=["company"])
+
+    def fake_batch(url_path, symbols, datapoints):
+        results = app.Results()
+        if symbols[0] == "S0000":
+            results.Results = 429
+        else:
+            results.ActionStatus = app.ActionStatus.SUCCESS
+            results.Results = {symbol: {"company": {}} for symbol in symbols}
+        return results
+
+    mocker.patch.object(Iex, 'load_symbols_from_iex', side_effect=fake_batch)
+
+    # WHEN
+    iex = Iex(["company"])
+
+    # THEN
+    assert len(iex.Symbols) == 200
+    assert not any("company" in symbol for symbol in iex.Symbols[:100])
+    assert all("company" in symbol for symbol in iex.Symbols[100:])
+
+
+def test_iter_symbols_batches_streams_every_batch(mocker):
+    # GIVEN
+    from datawell.iex import Iex
+    mocker.patch.object(Iex, 'get_stocks', return_value=_symbols(250))
+    mocker.patch.object(Iex, '_check_datapoints', return_value=["company"])
+
+    def fake_batch(url_path, symbols, datapoints):
+        results = app.Results()
+        results.ActionStatus = app.ActionStatus.SUCCESS
+        results.Results = {symbol: {"company": {"name": symbol}} for symbol in symbols}
+        return results
+
+    mocker.patch.object(Iex, 'load_symbols_from_iex', side_effect=fake_batch)
+    iex = Iex(["company"], stream=True)
+
+    # WHEN
+    batches = list(iex.iter_symbols_batches(queue_size=1))
+
+    # THEN
+    assert sorted(len(batch) for batch in batches) == [50, 100, 100]
+    streamed = sorted(symbol["symbol"] for batch in batches for symbol in batch)
+    assert streamed == [f"S{i:04d}" for i in range(250)]
+    assert all(symbol["company"]["name"] == symbol["symbol"] for batch in batches for symbol in batch)
+    assert not any("company" in symbol for symbol in iex.Symbols)
+
+
+def test_iter_symbols_batches_raises_on_failed_batch(mocker):
+    # GIVEN
+    from datawell.iex import Iex
+    mocker.patch.object(Iex, 'get_stocks', return_value=_symbols(250))
+    mocker.patch.object(Iex, '_check_datapoints', return_value=["company"])
+    mocker.patch.object(Iex, 'load_symbols_from_iex', side_effect=ValueError)
+    iex = Iex(["company"], stream=True)
+
+    # WHEN / THEN
+    with pytest.raises(app.AppException):
+        list(iex.iter_symbols_batches())
+
+
+def test_stream_parsing_merges_symbols_while_downloading(mocker, monkeypatch):
+    # GIVEN
+    from datawell.iex import Iex
+    monkeypatch.setattr(app, 'IEX_STREAM_PARSING', True)
+    mocker.patch.object(Iex, 'get_stocks', return_value=_symbols(150))
+    mocker.patch.object(Iex, '_check_datapoints', return_value=["company"])
+    merged = []
+    update_symbols = Iex.update_symbols
+
+    def fake_update_symbols(self, symbols_dict, data_points_data):
+        merged.extend(data_points_data)
+        update_symbols(self, symbols_dict, data_points_data)
+
+    mocker.patch.object(Iex, 'update_symbols', autospec=True, side_effect=fake_update_symbols)
+
+    def fake_get(url, params=None, stream=False):
+        assert stream
+        body = json.dumps({symbol: {"company": {"name": symbol.lower()}}
+                           for symbol in params["symbols"].split(",")}).encode()
+        response = mocker.MagicMock(status_code=200)
+        response.__enter__.return_value = response
+        response.iter_content.return_value = (body[i:i + 100] for i in range(0, len(body), 100))
+        return response
+
+    mocker.patch('requests.Session.get', side_effect=fake_get)
+
+    # WHEN
+    iex = Iex(["company"])
+
+    # THEN
+    assert sorted(merged) == [f"S{i:04d}" for i in range(150)]
+    assert all(symbol["company"]["name"] == symbol["symbol"].lower() for symbol in iex.Symbols)
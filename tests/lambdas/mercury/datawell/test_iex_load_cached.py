@@ -0,0 +1,86 @@
+import app
+
+
+def _fake_batch(calls: list):
+    def fake_batch(url_path, symbols, datapoints):
+        calls.append((tuple(symbols), tuple(datapoints)))
+        results = app.Results()
+        results.ActionStatus = app.ActionStatus.SUCCESS
+        results.Results = {symbol: {datapoint: {"from": "iex"} for datapoint in datapoints} for symbol in symbols}
+        return results
+    return fake_batch
+
+
+def test_cache_keeps_datapoints_until_ttl(tmp_path):
+    # GIVEN
+    from datawell.cache import DatapointCache
+    cache = DatapointCache(str(tmp_path / "cache.sqlite"), ttl_seconds={"company": 3600, "book": 0})
+
+    # WHEN
+    cache.put({"AAPL": {"company": {"name": "Apple"}, "book": {"bids": []}}})
+
+    # THEN
+    assert cache.get_fresh("company", ["AAPL", "MSFT"]) == {"AAPL": {"name": "Apple"}}
+    assert cache.get_fresh("book", ["AAPL"]) == {}
+    cache.ttl_seconds["company"] = -1
+    assert cache.get_fresh("company", ["AAPL"]) == {}
+
+
+def test_cache_looks_up_symbols_in_chunks(tmp_path):
+    # GIVEN
+    from datawell.cache import LOOKUP_CHUNK_SIZE, DatapointCache
+    cache = DatapointCache(str(tmp_path / "cache.sqlite"), ttl_seconds={"company": 3600})
+    symbols = [f"S{i:04d}" for i in range(2 * LOOKUP_CHUNK_SIZE + 1)]
+    cache.put({symbol: {"company": {"name": symbol}} for symbol in symbols[::2]})
+
+    # WHEN
+    fresh = cache.get_fresh("company", symbols[1:])
+
+    # THEN
+    assert fresh == {symbol: {"name": symbol} for symbol in symbols[2::2]}
+
+
+def test_load_symbols_datapoints_requests_only_stale_pairs(mocker, tmp_path):
+    # GIVEN
+    from datawell.cache import DatapointCache
+    from datawell.iex import Iex
+    cache = DatapointCache(str(tmp_path / "cache.sqlite"), ttl_seconds={"company": 3600, "book": 0})
+    cache.put({"AAPL": {"company": {"from": "cache"}}})
+    mocker.patch.object(Iex, 'get_stocks', return_value=[{"symbol": "AAPL"}, {"symbol": "MSFT"}])
+    mocker.patch.object(Iex, '_check_datapoints', return_value=["company", "book"])
+    calls = []
+    mocker.patch.object(Iex, 'load_symbols_from_iex', side_effect=_fake_batch(calls))
+
+    # WHEN
+    iex = Iex(["company", "book"], cache=cache)
+
+    # THEN
+    assert sorted(calls) == [(("AAPL",), ("book",)), (("MSFT",), ("company", "book"))]
+    assert iex.Symbols == [
+        {"symbol": "AAPL", "company": {"from": "cache"}, "book": {"from": "iex"}},
+        {"symbol": "MSFT", "company": {"from": "iex"}, "book": {"from": "iex"}},
+    ]
+    assert cache.get_fresh("company", ["MSFT"]) == {"MSFT": {"from": "iex"}}
+
+
+def test_stream_parsing_caches_cacheable_datapoints(mocker, monkeypatch, tmp_path):
+    # GIVEN
+    from datawell.cache import DatapointCache
+    from datawell.iex import Iex
+    monkeypatch.setattr(app, 'IEX_STREAM_PARSING', True)
+    cache = DatapointCache(str(tmp_path / "cache.sqlite"), ttl_seconds={"company": 3600, "book": 0})
+    mocker.patch.object(Iex, 'get_stocks', return_value=[{"symbol": "AAPL"}])
+    mocker.patch.object(Iex, '_check_datapoints', return_value=["company", "book"])
+    response = mocker.MagicMock(status_code=200)
+    response.__enter__.return_value = response
+    response.iter_content.return_value = [b'{"AAPL": {"company": {"name": "Apple"}, ', b'"book": {"bids": []}}}']
+    mocker.patch('requests.Session.get', return_value=response)
+    stream_from_iex = mocker.spy(Iex, 'stream_from_iex')
+
+    # WHEN
+    iex = Iex(["company", "book"], cache=cache)
+
+    # THEN
+    assert stream_from_iex.spy_return.Results == ["AAPL"]
+    assert iex.Symbols == [{"symbol": "AAPL", "company": {"name": "Apple"}, "book": {"bids": []}}]
+    assert cache.get_fresh("company", ["AAPL"]) == {"AAPL": {"name": "Apple"}}
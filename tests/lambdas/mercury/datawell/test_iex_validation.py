@@ -0,0 +1,100 @@
+import app
+
+
+def _results(status: app.ActionStatus, payload=None) -> app.Results:
+    results = app.Results()
+    results.ActionStatus = status
+    results.Results = payload
+    return results
+
+
+def _fake_load_from_iex(calls: list, valid: set):
+    def fake_load_from_iex(uri, params=None):
+        types = params["types"].split(",")
+        calls.append(params["types"])
+        if not set(types) & valid:
+            return _results(app.ActionStatus.ERROR)
+        return _results(app.ActionStatus.SUCCESS, {block: {} for block in types if block in valid})
+    return fake_load_from_iex
+
+
+def _patch_iex(mocker, monkeypatch, valid: set) -> list:
+    from datawell import iex
+    monkeypatch.setattr(iex, "_VALIDATED_DATAPOINTS", {})
+    mocker.patch.object(iex.Iex, "get_stocks", return_value=[])
+    mocker.patch.object(iex.Iex, "load_symbols_datapoints")
+    calls = []
+    mocker.patch.object(iex.Iex, "load_from_iex", side_effect=_fake_load_from_iex(calls, valid))
+    return calls
+
+
+def test_check_datapoints_probes_all_at_once(mocker, monkeypatch):
+    # GIVEN
+    calls = _patch_iex(mocker, monkeypatch, {"company", "book"})
+    from datawell.iex import Iex
+
+    # WHEN
+    datapoints = Iex(["company", "book"]).datapoints
+
+    # THEN
+    assert datapoints == ["company", "book"]
+    assert calls == ["company,book"]
+
+
+def test_check_datapoints_reprobes_missing_ones_separately(mocker, monkeypatch):
+    # GIVEN
+    calls = _patch_iex(mocker, monkeypatch, {"company", "book"})
+    from datawell.iex import Iex
+
+    # WHEN
+    datapoints = Iex(["book", "invalid", "company", "other"]).datapoints
+
+    # THEN
+    assert datapoints == ["book", "company"]
+    assert calls[0] == "book,invalid,company,other"
+    assert sorted(calls[1:]) == ["invalid", "other"]
+
+
+def test_check_datapoints_remembers_valid_ones_only(mocker, monkeypatch):
+    # GIVEN
+    calls = _patch_iex(mocker, monkeypatch, {"company"})
+    from datawell.iex import Iex
+    Iex(["company", "invalid"])
+    calls.clear()
+
+    # WHEN
+    datapoints = Iex(["invalid", "company"]).datapoints
+
+    # THEN
+    assert datapoints == ["company"]
+    assert calls == ["invalid"]
+
+
+def test_check_datapoints_probes_failed_ones_again(mocker, monkeypatch):
+    # GIVEN
+    calls = _patch_iex(mocker, monkeypatch, set())
+    from datawell.iex import Iex
+    assert Iex(["book"]).datapoints == ["company"]
+    mocker.patch.object(Iex, "load_from_iex", side_effect=_fake_load_from_iex(calls, {"book"}))
+
+    # WHEN
+    datapoints = Iex(["book"]).datapoints
+
+    # THEN
+    assert datapoints == ["book"]
+    assert calls == ["book", "book"]
+
+
+def test_check_datapoints_probes_again_after_ttl(mocker, monkeypatch):
+    # GIVEN
+    calls = _patch_iex(mocker, monkeypatch, {"company"})
+    from datawell.iex import Iex
+    monkeypatch.setattr(app, "DATAPOINT_VALIDATION_TTL_SECONDS", -1)
+    Iex(["company"])
+
+    # WHEN
+    datapoints = Iex(["company"]).datapoints
+
+    # THEN
+    assert datapoints == ["company"]
+    assert calls == ["company", "company"]
@@ -0,0 +1,57 @@
+from datawell.planner import BatchPlanner
+
+
+def test_plan_splits_into_iex_limits():
+    # GIVEN
+    planner = BatchPlanner(max_symbols=100, max_datapoints=10, message_weights={}, request_seconds=1, workers=2)
+    datapoints = [f"d{i}" for i in range(12)]
+    missing = {f"S{i:03d}": datapoints for i in range(250)}
+
+    # WHEN
+    plan = planner.plan(missing, datapoints)
+
+    # THEN
+    assert len(plan.batches) == 6
+    assert all(len(batch.symbols) <= 100 and len(batch.datapoints) <= 10 for batch in plan.batches)
+    assert plan.pairs == 250 * 12
+    assert plan.credits == 250 * 12
+    assert plan.estimated_seconds == 3
+
+
+def test_plan_requests_only_needed_pairs_and_pools_symbols():
+    # GIVEN
+    planner = BatchPlanner(message_weights={"financials": 5000})
+    missing = {
+        "AAPL": ["book"],
+        "MSFT": ["company", "book"],
+        "IBM": ["book", "company"],
+        "TSLA": ["financials"],
+    }
+
+    # WHEN
+    plan = planner.plan(missing, ["company", "book", "financials"])
+
+    # THEN
+    requests = sorted((tuple(batch.datapoints), tuple(batch.symbols)) for batch in plan.batches)
+    assert requests == [
+        (("book",), ("AAPL",)),
+        (("company", "book"), ("MSFT", "IBM")),
+        (("financials",), ("TSLA",)),
+    ]
+    assert plan.credits == 1 + 2 * 2 + 5000
+    assert plan.describe()[0].startswith("Plan: 3 requests for 6 (symbol, datapoint) pairs, ~5005 message credits")
+
+
+def test_dry_run_does_not_load_datapoints(mocker):
+    # GIVEN
+    from datawell.iex import Iex
+    mocker.patch.object(Iex, 'get_stocks', return_value=[{"symbol": "AAPL"}])
+    mocker.patch.object(Iex, '_check_datapoints', return_value=["company"])
+    mock_load = mocker.patch.object(Iex, 'load_symbols_from_iex')
+
+    # WHEN
+    iex = Iex(["company"], dry_run=True)
+
+    # THEN
+    mock_load.assert_not_called()
+    assert len(iex.Plan.batches) == 1
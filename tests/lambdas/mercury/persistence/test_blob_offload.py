@@ -0,0 +1,99 @@
+import hashlib
+from datetime import date
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import pytest
+
+import app
+from persistence.BlobStore import LocalBlobStore
+from persistence.DocumentCodec import DocumentCodec
+from app import ActionStatus
+from persistence.DynamoStore import DynamoStore, POINTER_ATTRIBUTE, estimate_item_size
+
+TABLE_NAME = "test-table"
+LARGE_DOCUMENT = {"symbol": "AAPL", "date": "2020-06-01", "book": {"trades": [
+    {"price": 1.5, "size": 10, "tradeId": hashlib.sha256(str(i).encode()).hexdigest()} for i in range(50)]}}
+SMALL_DOCUMENT = {"symbol": "MSFT", "date": "2020-06-01", "x": 1}
+
+
+@pytest.fixture
+def store(mocker, monkeypatch, tmp_path):
+    monkeypatch.setattr(app, 'AWS_TABLE_NAME', TABLE_NAME)
+    monkeypatch.setattr(app, 'DOCUMENT_OFFLOAD_MIN_BYTES', 500)
+    mocker.patch('app.get_dynamodb_resource', return_value=MagicMock())
+    return DynamoStore(TABLE_NAME, blob_store=LocalBlobStore(str(tmp_path / "blobs")))
+
+
+def _written_items(store, mocker, documents, expected_status=ActionStatus.SUCCESS) -> list:
+    writer = mocker.patch('persistence.DynamoStore.DynamoBatchWriter').return_value.__enter__.return_value
+    assert store.store_documents(documents) is expected_status
+    return [call.kwargs["Item"] for call in writer.put_item.call_args_list]
+
+
+@pytest.mark.parametrize("codec", [None, DocumentCodec(min_size=0)])
+def test_oversized_documents_are_offloaded_and_resolved(store, mocker, codec):
+    # GIVEN
+    store.codec = codec
+    items = _written_items(store, mocker, [dict(LARGE_DOCUMENT), dict(SMALL_DOCUMENT)])
+    store.table.query.return_value = {"Items": [dict(item) for item in items]}
+
+    # WHEN
+    documents = store.get_filtered_documents(target_date=date(2020, 6, 1)).Results
+
+    # THEN
+    assert POINTER_ATTRIBUTE in items[0] and "document" not in items[0]
+    assert POINTER_ATTRIBUTE not in items[1]
+    assert store.StoreStats["offloaded"] == 1
+    assert [document["document"]["symbol"] for document in documents] == ["AAPL", "MSFT"]
+    assert documents[0]["document"]["book"]["trades"][0]["price"] == Decimal("1.5")
+    assert all(POINTER_ATTRIBUTE not in document for document in documents)
+
+
+def test_large_documents_are_written_as_is_without_blob_store(store, mocker):
+    # GIVEN
+    store.blob_store = None
+
+    # WHEN
+    items = _written_items(store, mocker, [dict(LARGE_DOCUMENT), dict(SMALL_DOCUMENT)])
+
+    # THEN
+    assert [item["symbol"] for item in items] == ["AAPL", "MSFT"]
+    assert store.StoreStats["oversized"] == 0
+
+
+def test_documents_over_dynamo_limit_are_dropped_without_blob_store(store, mocker, monkeypatch):
+    # GIVEN
+    store.blob_store = None
+    monkeypatch.setattr('persistence.DynamoStore.DYNAMO_MAX_ITEM_BYTES', 1000)
+
+    # WHEN
+    items = _written_items(store, mocker, [dict(LARGE_DOCUMENT), dict(SMALL_DOCUMENT)], ActionStatus.ERROR)
+
+    # THEN
+    assert [item["symbol"] for item in items] == ["MSFT"]
+    assert store.StoreStats["oversized"] == 1
+    assert store.StoreStats["written"] == 1
+
+
+def test_tampered_offloaded_document_is_rejected(store, mocker):
+    # GIVEN
+    items = _written_items(store, mocker, [dict(LARGE_DOCUMENT)])
+    store.blob_store.put(items[0][POINTER_ATTRIBUTE], b"{}")
+    store.table.query.return_value = {"Items": items}
+
+    # WHEN / THEN
+    with pytest.raises(app.AppException):
+        store.get_filtered_documents("AAPL", date(2020, 6, 1))
+
+
+def test_item_size_is_estimated_as_dynamo_counts_it():
+    # GIVEN
+    item = {"symbol": "AAPL", "document": {"name": "Société", "price": Decimal("123.4500"), "tags": ["a", None]}}
+
+    # WHEN
+    size = estimate_item_size(item)
+
+    # THEN
+    # names and strings by UTF-8 length, numbers by significant digits, map and list overheads
+    assert size == (6 + 4) + (8 + 3 + (4 + 9 + 1) + (5 + 4 + 1) + (4 + 3 + (1 + 1) + (1 + 1) + 1))
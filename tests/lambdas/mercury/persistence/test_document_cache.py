@@ -0,0 +1,78 @@
+import pickle
+from decimal import Decimal
+
+from persistence.DocumentCache import DocumentCache
+
+
+def test_put_and_get_from_memory_and_disk(tmp_path):
+    # GIVEN
+    path = str(tmp_path / "cache.sqlite")
+    cache = DocumentCache(path=path)
+    documents = [{"symbol": "AAPL", "date": "2020-06-01", "price": Decimal("1.5")}]
+
+    # WHEN
+    cache.put("query:AAPL:2020-06-01", "2020-06-01", documents)
+
+    # THEN
+    assert cache.get("query:AAPL:2020-06-01") == documents
+    assert DocumentCache(path=path).get("query:AAPL:2020-06-01") == documents
+    assert cache.get("query:MSFT:2020-06-01") is None
+
+
+def test_memory_tier_is_bounded_by_size():
+    # GIVEN
+    cache = DocumentCache(max_bytes=2 * len(pickle.dumps("a" * 100)), path=None)
+
+    # WHEN
+    cache.put("a", "2020-06-01", "a" * 100)
+    cache.put("b", "2020-06-01", "b" * 100)
+    cache.get("a")
+    cache.put("c", "2020-06-01", "c" * 100)
+
+    # THEN
+    assert cache.get("a") == "a" * 100
+    assert cache.get("b") is None
+    assert cache.get("c") == "c" * 100
+
+
+def test_values_larger_than_memory_tier_are_kept_on_disk_only(tmp_path):
+    # GIVEN
+    cache = DocumentCache(max_bytes=100, path=str(tmp_path / "cache.sqlite"))
+    cache.put("small", "2020-06-01", "s")
+
+    # WHEN
+    cache.put("large", "2020-06-01", "l" * 1000)
+
+    # THEN
+    assert cache.get("large") == "l" * 1000
+    assert list(cache._entries) == ["small"]
+
+
+def test_invalidate_drops_partition_from_both_tiers(tmp_path):
+    # GIVEN
+    path = str(tmp_path / "cache.sqlite")
+    cache = DocumentCache(path=path)
+    cache.put("query:*:2020-06-01", "2020-06-01", [1])
+    cache.put("query:*:2020-06-02", "2020-06-02", [2])
+
+    # WHEN
+    cache.invalidate("2020-06-02")
+
+    # THEN
+    assert cache.get("query:*:2020-06-01") == [1]
+    assert cache.get("query:*:2020-06-02") is None
+    assert DocumentCache(path=path).get("query:*:2020-06-02") is None
+
+
+def test_get_returns_a_copy():
+    # GIVEN
+    cache = DocumentCache(path=None)
+    documents = [{"symbol": "AAPL"}]
+    cache.put("query:AAPL:2020-06-01", "2020-06-01", documents)
+
+    # WHEN
+    documents[0]["symbol"] = "MSFT"
+    cache.get("query:AAPL:2020-06-01")[0]["symbol"] = "IBM"
+
+    # THEN
+    assert cache.get("query:AAPL:2020-06-01") == [{"symbol": "AAPL"}]
@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+import pytest
+from boto3.dynamodb.types import Binary
+
+import app
+from persistence.DocumentCodec import BLOB_ATTRIBUTE, ENCODING_ATTRIBUTE, DocumentCodec
+
+DOCUMENT = {
+    "symbol": "AAPL", "date": "2020-06-01",
+    "company": {"companyName": "Apple Inc.", "employees": Decimal(137000), "tags": ["Technology"]},
+    "financials": {"financials": [{"reportDate": "2020-03-31", "totalRevenue": Decimal(58313000000),
+                                   "grossProfit": Decimal("22370000000.5")}] * 20},
+}
+
+
+def test_encode_compresses_large_documents_and_decode_restores_them():
+    # GIVEN
+    item = {"symbol": "AAPL", "date": "2020-06-01", "document": DOCUMENT}
+
+    # WHEN
+    encoded = DocumentCodec(min_size=100).encode(dict(item))
+    # boto3 returns binary attributes wrapped in Binary
+    encoded[BLOB_ATTRIBUTE] = Binary(encoded[BLOB_ATTRIBUTE])
+    decoded = DocumentCodec.decode(dict(encoded))
+
+    # THEN
+    assert "document" not in encoded
+    assert encoded[ENCODING_ATTRIBUTE] == "zlib-v1"
+    assert len(encoded[BLOB_ATTRIBUTE].value) < 600
+    assert decoded == item
+
+
+def test_encode_leaves_small_documents_and_references_alone():
+    # GIVEN
+    codec = DocumentCodec(min_size=10 ** 6)
+    small = {"symbol": "AAPL", "date": "2020-06-01", "document": DOCUMENT}
+    reference = {"symbol": "AAPL", "date": "2020-06-01", "document_ref": "2020-05-29"}
+
+    # THEN
+    assert codec.encode(dict(small)) == small
+    assert codec.encode(dict(reference)) == reference
+    assert DocumentCodec.decode(dict(small)) == small
+
+
+def test_decode_rejects_unknown_encodings():
+    with pytest.raises(app.AppException):
+        DocumentCodec.decode({"symbol": "AAPL", ENCODING_ATTRIBUTE: "zstd-v9", BLOB_ATTRIBUTE: b""})
+
+
+def test_project_keeps_requested_paths():
+    # WHEN
+    projected = DocumentCodec.project(DOCUMENT, ["company.employees", "symbol", "quote.latestPrice"])
+
+    # THEN
+    assert projected == {"company": {"employees": Decimal(137000)}, "symbol": "AAPL"}
@@ -0,0 +1,28 @@
+from decimal import Decimal
+
+from persistence.DocumentManifest import DocumentManifest
+
+
+def test_hash_ignores_date_and_key_order():
+    # GIVEN
+    document = {"symbol": "AAPL", "date": "2020-06-01", "company": {"name": "Apple", "employees": Decimal(1)}}
+    next_day = {"company": {"employees": Decimal(1), "name": "Apple"}, "date": "2020-06-02", "symbol": "AAPL"}
+
+    # WHEN / THEN
+    assert DocumentManifest.hash_document(document) == DocumentManifest.hash_document(next_day)
+    assert DocumentManifest.hash_document(document) != DocumentManifest.hash_document(dict(document, symbol="MSFT"))
+
+
+def test_update_persists_entries(tmp_path):
+    # GIVEN
+    path = str(tmp_path / "manifest.sqlite")
+    manifest = DocumentManifest(path)
+
+    # WHEN
+    manifest.update({"AAPL": ("hash1", "2020-06-01"), "MSFT": ("hash2", "2020-06-01")})
+    manifest.forget(["MSFT"])
+
+    # THEN
+    reopened = DocumentManifest(path)
+    assert reopened.get("AAPL") == ("hash1", "2020-06-01")
+    assert reopened.get("MSFT") is None
@@ -0,0 +1,154 @@
+import threading
+
+import pytest
+from boto3.exceptions import RetriesExceededError
+from botocore.exceptions import ClientError
+
+from persistence.DynamoBatchWriter import DynamoBatchWriter, RetryConfig, WriteRateController
+
+TABLE_NAME = "test-table"
+
+
+class FakeDynamoClient:
+    """Records every put request it receives, leaves the first item of every unprocessed_every-th call unprocessed"""
+    def __init__(self, unprocessed_every: int = 0, error_code: str = None):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.stored = []
+        self.unprocessed_every = unprocessed_every
+        self.error_code = error_code
+
+    def batch_write_item(self, RequestItems):
+        items = RequestItems[TABLE_NAME]
+        with self.lock:
+            self.calls += 1
+            if self.error_code:
+                raise ClientError({'Error': {'Code': self.error_code}}, 'BatchWriteItem')
+            if self.unprocessed_every and self.calls % self.unprocessed_every == 0:
+                self.stored.extend(items[1:])
+                return {'UnprocessedItems': {TABLE_NAME: items[:1]}}
+            self.stored.extend(items)
+        return {'UnprocessedItems': {}}
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_put_item_stores_every_item(max_workers):
+    # GIVEN
+    client = FakeDynamoClient(unprocessed_every=3)
+    retries = RetryConfig(max_attempts=-1, max_delay=0)
+
+    # WHEN
+    with DynamoBatchWriter(TABLE_NAME, client, retries=retries, max_workers=max_workers) as batch:
+        for i in range(1010):
+            batch.put_item(Item={'symbol': f"S{i}"})
+
+    # THEN
+    stored = sorted(request['PutRequest']['Item']['symbol'] for request in client.stored)
+    assert stored == sorted(f"S{i}" for i in range(1010))
+
+
+def test_parallel_writer_raises_when_retries_exceeded():
+    # GIVEN
+    client = FakeDynamoClient(error_code='ProvisionedThroughputExceededException')
+    retries = RetryConfig(max_attempts=2, max_delay=0)
+
+    # WHEN / THEN
+    with pytest.raises(RetriesExceededError):
+        with DynamoBatchWriter(TABLE_NAME, client, retries=retries, max_workers=4) as batch:
+            for i in range(100):
+                batch.put_item(Item={'symbol': f"S{i}"})
+
+
+def test_parallel_writer_raises_not_retryable_errors():
+    # GIVEN
+    client = FakeDynamoClient(error_code='ValidationException')
+
+    # WHEN / THEN
+    with pytest.raises(ClientError):
+        with DynamoBatchWriter(TABLE_NAME, client, max_workers=4) as batch:
+            for i in range(100):
+                batch.put_item(Item={'symbol': f"S{i}"})
+
+
+def test_rate_controller_is_aimd():
+    # GIVEN
+    controller = WriteRateController(provisioned_units=100, target_utilization=0.9, increase_step=1,
+                                     decrease_factor=0.5)
+
+    # WHEN / THEN
+    assert controller.rate == 90
+    controller.on_throttle()
+    assert controller.rate == 45
+    controller.on_success(estimated_units=25, consumed_units=25, items_count=25, throttled=False)
+    assert controller.rate == 46
+    controller.on_success(estimated_units=25, consumed_units=20, items_count=20, throttled=True)
+    assert controller.rate == 23
+
+
+def test_writer_reports_consumed_capacity_to_controller(mocker):
+    # GIVEN
+    client = mocker.MagicMock()
+    client.batch_write_item.return_value = {
+        'UnprocessedItems': {},
+        'ConsumedCapacity': [{'TableName': TABLE_NAME, 'CapacityUnits': 100.0, 'Table': {'CapacityUnits': 50.0},
+                              'GlobalSecondaryIndexes': {'date-symbol-index': {'CapacityUnits': 50.0}}}]
+    }
+    controller = WriteRateController(provisioned_units=1000)
+    on_success = mocker.spy(controller, 'on_success')
+
+    # WHEN
+    with DynamoBatchWriter(TABLE_NAME, client, rate_controller=controller) as batch:
+        for i in range(25):
+            batch.put_item(Item={'symbol': f"S{i}"})
+
+    # THEN
+    assert client.batch_write_item.call_args.kwargs['ReturnConsumedCapacity'] == 'INDEXES'
+    on_success.assert_called_once_with(25.0, 50.0, 25, False)
+
+
+def test_parallel_writer_blocks_producer_when_queue_is_full():
+    # GIVEN
+    release = threading.Event()
+    client = FakeDynamoClient()
+    batch_write_item = client.batch_write_item
+    client.batch_write_item = lambda RequestItems: release.wait() and batch_write_item(RequestItems)
+    batch = DynamoBatchWriter(TABLE_NAME, client, flush_amount=1, max_workers=2)
+    producer = threading.Thread(target=lambda: [batch.put_item(Item={'symbol': f"S{i}"}) for i in range(10)])
+
+    # WHEN
+    producer.start()
+    producer.join(timeout=0.5)
+
+    # THEN
+    assert producer.is_alive()
+    assert batch._pending_batches.qsize() == 4
+    release.set()
+    producer.join()
+    batch.__exit__(None, None, None)
+    assert len(client.stored) == 10
+
+
+def test_retried_batch_keeps_its_retry_attempt_across_workers():
+    # GIVEN
+    client = FakeDynamoClient(error_code='ProvisionedThroughputExceededException')
+    retries = RetryConfig(max_attempts=2, max_delay=0)
+
+    # WHEN
+    with pytest.raises(RetriesExceededError):
+        with DynamoBatchWriter(TABLE_NAME, client, retries=retries, max_workers=4) as batch:
+            batch.put_item(Item={'symbol': "S0"})
+
+    # THEN
+    assert client.calls == 3
+
+
+def test_parallel_writer_does_not_hide_the_error_of_the_with_block():
+    # GIVEN
+    client = FakeDynamoClient(error_code='ValidationException')
+
+    # WHEN / THEN
+    with pytest.raises(KeyError):
+        with DynamoBatchWriter(TABLE_NAME, client, max_workers=4) as batch:
+            for i in range(100):
+                batch.put_item(Item={'symbol': f"S{i}"})
+            raise KeyError("symbol")
@@ -0,0 +1,234 @@
+from datetime import date
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import pytest
+
+import app
+from persistence.DynamoBatchWriter import RetryConfig
+from persistence.DocumentCache import DocumentCache
+from persistence.DocumentCodec import DocumentCodec
+from persistence.DocumentManifest import DocumentManifest
+from persistence.DynamoStore import DynamoStore, SymbolFilterCriteria
+
+TABLE_NAME = "test-table"
+
+
+@pytest.fixture
+def store(mocker, monkeypatch):
+    monkeypatch.setattr(app, 'AWS_TABLE_NAME', TABLE_NAME)
+    mocker.patch('app.get_dynamodb_resource', return_value=MagicMock())
+    mocker.patch('time.sleep')
+    return DynamoStore(TABLE_NAME)
+
+
+def _batch_get_item(unprocessed_first_call: bool):
+    calls = []
+
+    def batch_get_item(RequestItems):
+        keys = RequestItems[TABLE_NAME]["Keys"]
+        calls.append(len(keys))
+        if unprocessed_first_call and len(calls) == 1:
+            return {"Responses": {TABLE_NAME: [dict(key) for key in keys[:10]]},
+                    "UnprocessedKeys": {TABLE_NAME: {"Keys": keys[10:]}}}
+        return {"Responses": {TABLE_NAME: [dict(key) for key in keys]}, "UnprocessedKeys": {}}
+
+    return batch_get_item, calls
+
+
+def test_get_documents_chunks_keys_and_retries_unprocessed(store):
+    # GIVEN
+    batch_get_item, calls = _batch_get_item(unprocessed_first_call=True)
+    store.dynamoDb.meta.client.batch_get_item.side_effect = batch_get_item
+    keys = [(f"S{i:03d}", date(2020, 6, 1)) for i in range(250)] + [("S000", "2020-06-01")]
+
+    # WHEN
+    result = store.get_documents(keys)
+
+    # THEN
+    assert result.ActionStatus == app.ActionStatus.SUCCESS
+    assert sorted(result.Results.keys()) == [(f"S{i:03d}", "2020-06-01") for i in range(250)]
+    assert result.Results[("S007", "2020-06-01")] == {"symbol": "S007", "date": "2020-06-01"}
+    assert sum(calls) == 250 + 90
+    assert max(calls) == 100
+
+
+def test_get_documents_raises_when_retries_exceeded(store):
+    # GIVEN
+    store.dynamoDb.meta.client.batch_get_item.side_effect = lambda RequestItems: {
+        "Responses": {}, "UnprocessedKeys": RequestItems}
+
+    # WHEN / THEN
+    with pytest.raises(app.AppException):
+        store.get_documents([("AAPL", "2020-06-01")], retries=RetryConfig(max_attempts=2))
+
+
+def test_get_documents_with_invalid_arg(store):
+    # WHEN
+    result = store.get_documents("AAPL")
+
+    # THEN
+    assert result.ActionStatus == app.ActionStatus.ERROR
+
+
+def test_get_filtered_documents_reads_through_cache(store, mocker):
+    # GIVEN
+    store.cache = DocumentCache(path=None)
+    query = mocker.patch.object(SymbolFilterCriteria, 'query', return_value=[{"symbol": "AAPL"}])
+
+    # WHEN
+    first = store.get_filtered_documents("AAPL", date(2020, 6, 1))
+    second = store.get_filtered_documents("AAPL", date(2020, 6, 1))
+
+    # THEN
+    assert first.Results == second.Results == [{"symbol": "AAPL"}]
+    query.assert_called_once()
+
+
+def test_get_filtered_documents_does_not_cache_today_or_empty_results(store, mocker):
+    # GIVEN
+    store.cache = DocumentCache(path=None)
+    query = mocker.patch.object(SymbolFilterCriteria, 'query', side_effect=lambda table: [])
+
+    # WHEN
+    store.get_filtered_documents("AAPL", date(2020, 6, 1))
+    store.get_filtered_documents("AAPL", date(2020, 6, 1))
+    query.side_effect = lambda table: [{"symbol": "AAPL"}]
+    store.get_filtered_documents("AAPL", date.today())
+    store.get_filtered_documents("AAPL", date.today())
+
+    # THEN
+    assert query.call_count == 4
+
+
+def test_store_documents_invalidates_written_dates(store, mocker):
+    # GIVEN
+    store.cache = DocumentCache(path=None)
+    store.cache.put("query:*:2020-06-01", "2020-06-01", [])
+    store.cache.put("query:*:2020-05-29", "2020-05-29", [])
+    writer_class = mocker.patch('persistence.DynamoStore.DynamoBatchWriter')
+
+    # WHEN
+    store.store_documents([{"symbol": "AAPL", "date": "2020-06-01"}])
+
+    # THEN
+    assert writer_class.call_args.kwargs["dynamo_client"] is store.dynamoDb.meta.client
+    assert store.cache.get("query:*:2020-06-01") is None
+    assert store.cache.get("query:*:2020-05-29") == []
+
+
+def test_store_documents_references_unchanged_documents(store, mocker, tmp_path):
+    # GIVEN
+    store.manifest = DocumentManifest(str(tmp_path / "manifest.sqlite"))
+    store.manifest.update({"AAPL": (DocumentManifest.hash_document({"symbol": "AAPL", "x": 1}), "2020-05-29")})
+    writer = mocker.patch('persistence.DynamoStore.DynamoBatchWriter').return_value.__enter__.return_value
+
+    # WHEN
+    store.store_documents([{"symbol": "AAPL", "date": "2020-06-01", "x": 1},
+                           {"symbol": "MSFT", "date": "2020-06-01", "x": 1}])
+
+    # THEN
+    items = [call.kwargs["Item"] for call in writer.put_item.call_args_list]
+    assert items[0]["document_ref"] == "2020-05-29"
+    assert "document" not in items[0]
+    assert items[1]["document"] == {"symbol": "MSFT", "date": "2020-06-01", "x": 1}
+    assert (store.StoreStats["written"], store.StoreStats["skipped"]) == (1, 1)
+    assert store.manifest.get("MSFT") == (items[1]["document_hash"], "2020-06-01")
+
+
+def test_get_filtered_documents_resolves_references(store, mocker):
+    # GIVEN
+    mocker.patch.object(SymbolFilterCriteria, 'query', return_value=[
+        {"symbol": "AAPL", "date": "2020-06-01", "document_ref": "2020-05-29"}
+    ])
+    store.dynamoDb.meta.client.batch_get_item.return_value = {"Responses": {TABLE_NAME: [
+        {"symbol": "AAPL", "date": "2020-05-29", "document": {"symbol": "AAPL", "date": "2020-05-29", "x": 1}}
+    ]}}
+
+    # WHEN
+    result = store.get_filtered_documents(target_date=date(2020, 6, 1))
+
+    # THEN
+    assert result.Results[0]["document"] == {"symbol": "AAPL", "date": "2020-06-01", "x": 1}
+
+
+def test_cleanup_symbol_documents_turns_floats_into_decimal(store):
+    # GIVEN
+    documents = [{"symbol": "AAPL", "date": "2020-06-01", "price": 318.25, "name": "",
+                  "financials": [{"revenue": 1.1, "ratios": (0.1, 2)}]},
+                 {"symbol": "", "date": "2020-06-01"}, None]
+
+    # WHEN
+    cleaned = store.cleanup_symbol_documents(documents)
+
+    # THEN
+    assert cleaned == [{"symbol": "AAPL", "date": "2020-06-01", "price": Decimal("318.25"),
+                        "financials": [{"revenue": Decimal("1.1"), "ratios": [Decimal("0.1"), 2]}]}]
+    assert type(cleaned[0]["financials"][0]["revenue"]) is Decimal
+
+
+def test_store_documents_compresses_and_query_decodes(store, mocker):
+    # GIVEN
+    store.codec = DocumentCodec(min_size=0)
+    writer = mocker.patch('persistence.DynamoStore.DynamoBatchWriter').return_value.__enter__.return_value
+    store.store_documents([{"symbol": "AAPL", "date": "2020-06-01", "price": 318.25}])
+    item = writer.put_item.call_args.kwargs["Item"]
+    store.table.query.return_value = {"Items": [dict(item)]}
+
+    # WHEN
+    result = store.get_filtered_documents("AAPL", date(2020, 6, 1))
+
+    # THEN
+    assert "document" not in item
+    assert result.Results == [{"symbol": "AAPL", "date": "2020-06-01",
+                               "document": {"symbol": "AAPL", "date": "2020-06-01", "price": Decimal("318.25")}}]
+
+
+def test_iter_filtered_documents_projects_compressed_documents(store):
+    # GIVEN
+    item = DocumentCodec(min_size=0).encode({"symbol": "AAPL", "date": "2020-06-01",
+                                             "document": {"company": {"employees": 1, "name": "Apple"}, "x": 2}})
+    store.table.query.return_value = {"Items": [item]}
+
+    # WHEN
+    documents = list(store.iter_filtered_documents("AAPL", date(2020, 6, 1), projection=["document.company.name"]))
+
+    # THEN
+    assert documents == [{"symbol": "AAPL", "date": "2020-06-01", "document": {"company": {"name": "Apple"}}}]
+    projection_names = store.table.query.call_args.kwargs["ExpressionAttributeNames"].values()
+    assert {"document_blob", "document_encoding"} <= set(projection_names)
+
+
+def test_iter_filtered_documents_projects_referenced_documents(store):
+    # GIVEN
+    store.table.query.return_value = {"Items": [{"symbol": "AAPL", "date": "2020-06-01", "document_ref": "2020-05-29"}]}
+    store.dynamoDb.meta.client.batch_get_item.return_value = {"Responses": {TABLE_NAME: [
+        {"symbol": "AAPL", "date": "2020-05-29", "document": {"company": {"name": "Apple"}, "x": 1}}
+    ]}}
+
+    # WHEN
+    documents = list(store.iter_filtered_documents(symbol_to_find="AAPL", projection=["document.company"]))
+
+    # THEN
+    assert documents[0]["document"] == {"company": {"name": "Apple"}}
+    projection_names = store.table.query.call_args.kwargs["ExpressionAttributeNames"].values()
+    assert {"symbol", "date", "document_ref"} <= set(projection_names)
+
+
+def test_table_existence_is_checked_once_per_container(mocker, monkeypatch):
+    # GIVEN
+    from persistence import DynamoStore as dynamo_store_module
+    monkeypatch.setattr(app, 'AWS_TABLE_NAME', TABLE_NAME)
+    monkeypatch.setattr(dynamo_store_module, '_EXISTING_TABLES', set())
+    resource = mocker.patch('app.get_dynamodb_resource', return_value=MagicMock()).return_value
+    table = resource.Table.return_value
+    creation_date_time = mocker.PropertyMock(return_value="2020-06-01")
+    type(table).creation_date_time = creation_date_time
+
+    # WHEN
+    DynamoStore(TABLE_NAME)._ensure_table()
+    DynamoStore(TABLE_NAME)._ensure_table()
+
+    # THEN
+    assert resource.Table.call_count == 2
+    creation_date_time.assert_called_once()
@@ -0,0 +1,165 @@
+from datetime import date
+from unittest.mock import MagicMock
+
+import pytest
+
+from persistence.DynamoStore import DATE_INDEX_NAME, SymbolFilterCriteria
+
+
+def _fake_table(items_count: int, page_size: int = 7) -> MagicMock:
+    """A table whose client serves Segment scans of items_count items split into pages of page_size, the client of a
+    resource table deserializes items as boto3 does"""
+    items = [{"symbol": f"S{i:04d}", "date": "2020-06-01"} for i in range(items_count)]
+
+    def scan(TableName, Segment, TotalSegments, ExclusiveStartKey=None):
+        segment_items = items[Segment::TotalSegments]
+        start = ExclusiveStartKey["page"] if ExclusiveStartKey else 0
+        page = segment_items[start:start + page_size]
+        response = {"Items": [dict(item) for item in page]}
+        if start + page_size < len(segment_items):
+            response["LastEvaluatedKey"] = {"page": start + page_size}
+        return response
+
+    table = MagicMock()
+    table.name = "test-table"
+    table.meta.client.scan.side_effect = scan
+    return table
+
+
+@pytest.mark.parametrize("segments", [1, 4, 16])
+def test_query_without_keys_scans_all_segments(segments):
+    # GIVEN
+    table = _fake_table(100)
+    criteria = SymbolFilterCriteria(scan_segments=segments)
+
+    # WHEN
+    items = criteria.query(table) if segments > 1 else list(criteria.parallel_scan(table, segments))
+
+    # THEN
+    assert sorted(item["symbol"] for item in items) == [f"S{i:04d}" for i in range(100)]
+    assert {call.kwargs["TotalSegments"] for call in table.meta.client.scan.call_args_list} == {segments}
+
+
+def test_parallel_scan_stops_at_limit():
+    # GIVEN
+    table = _fake_table(1000)
+
+    # WHEN
+    items = list(SymbolFilterCriteria.parallel_scan(table, total_segments=4, limit=10))
+
+    # THEN
+    assert len(items) == 10
+
+
+def test_parallel_scan_raises_segment_errors():
+    # GIVEN
+    table = _fake_table(100)
+    table.meta.client.scan.side_effect = RuntimeError("boom")
+
+    # WHEN / THEN
+    with pytest.raises(RuntimeError):
+        list(SymbolFilterCriteria.parallel_scan(table, total_segments=4))
+
+
+def test_query_by_page_is_lazy_and_projects_attributes():
+    # GIVEN
+    table = MagicMock()
+    table.query.side_effect = [
+        {"Items": [{"symbol": "AAPL", "date": "2020-06-01"}], "LastEvaluatedKey": {"symbol": "AAPL"}},
+        {"Items": [{"symbol": "AAPL", "date": "2020-06-02"}]},
+    ]
+    criteria = SymbolFilterCriteria("AAPL")
+
+    # WHEN
+    pages = criteria.query_by_page(table, projection=["symbol", "date", "document.company"])
+    first_page = next(pages)
+
+    # THEN
+    assert table.query.call_count == 1
+    assert first_page["Items"] == [{"symbol": "AAPL", "date": "2020-06-01"}]
+    params = table.query.call_args.kwargs
+    assert params["ProjectionExpression"] == "#p0, #p1, #p2.#p3"
+    assert params["ExpressionAttributeNames"] == {"#p0": "symbol", "#p1": "date", "#p2": "document", "#p3": "company"}
+    assert len(list(pages)) == 1
+    assert table.query.call_args.kwargs["ExclusiveStartKey"] == {"symbol": "AAPL"}
+
+
+def _key_condition(query: dict) -> tuple:
+    """Flattens a single key condition into (operator, attribute name, values)"""
+    expression = query["KeyConditionExpression"].get_expression()
+    name, *values = expression["values"]
+    return expression["operator"], name.name, values
+
+
+def test_date_only_lookup_uses_date_index():
+    # WHEN
+    criteria = SymbolFilterCriteria(target_date=date(2020, 6, 1))
+
+    # THEN
+    assert len(criteria.queries) == 1
+    assert criteria.queries[0]["IndexName"] == DATE_INDEX_NAME
+    assert _key_condition(criteria.queries[0]) == ("=", "date", ["2020-06-01"])
+
+
+def test_date_only_range_queries_index_for_every_day():
+    # WHEN
+    criteria = SymbolFilterCriteria(target_date=date(2020, 2, 27), end_date=date(2020, 3, 2))
+
+    # THEN
+    assert all(query["IndexName"] == DATE_INDEX_NAME for query in criteria.queries)
+    assert [_key_condition(query)[2][0] for query in criteria.queries] == \
+        ["2020-02-27", "2020-02-28", "2020-02-29", "2020-03-01", "2020-03-02"]
+
+
+def test_date_only_prefix_is_expanded_to_days():
+    # WHEN
+    criteria = SymbolFilterCriteria(date_prefix="2020-02")
+
+    # THEN
+    assert len(criteria.queries) == 29
+    assert criteria.scan_filter is None
+
+
+@pytest.mark.parametrize("criteria", [
+    {"date_prefix": "2020-13"},
+    {"end_date": date(2020, 6, 30)},
+    {"symbol_to_find": "AAPL", "end_date": date(2020, 6, 30)},
+    {"target_date": date(2020, 6, 30), "end_date": date(2020, 6, 1)},
+])
+def test_criteria_matching_no_date_are_rejected(criteria):
+    with pytest.raises(ValueError):
+        SymbolFilterCriteria(**criteria)
+
+
+def test_short_date_prefix_falls_back_to_filtered_scan():
+    # GIVEN
+    table = MagicMock()
+    table.scan.return_value = {"Items": []}
+    criteria = SymbolFilterCriteria(date_prefix="20")
+
+    # WHEN
+    criteria.query(table)
+
+    # THEN
+    assert criteria.queries == []
+    assert "FilterExpression" in table.scan.call_args.kwargs
+    table.query.assert_not_called()
+
+
+@pytest.mark.parametrize("kwargs, expected_operator, expected_values", [
+    ({"target_date": date(2020, 6, 1)}, "=", ["2020-06-01"]),
+    ({"target_date": date(2020, 6, 1), "end_date": date(2020, 6, 30)}, "BETWEEN", ["2020-06-01", "2020-06-30"]),
+    ({"date_prefix": "2020-06"}, "begins_with", ["2020-06"]),
+])
+def test_symbol_lookup_queries_table(kwargs, expected_operator, expected_values):
+    # WHEN
+    criteria = SymbolFilterCriteria("AAPL", **kwargs)
+
+    # THEN
+    assert len(criteria.queries) == 1
+    assert "IndexName" not in criteria.queries[0]
+    symbol_condition, date_condition = criteria.queries[0]["KeyConditionExpression"].get_expression()["values"]
+    assert symbol_condition.get_expression()["values"][1] == "AAPL"
+    date_expression = date_condition.get_expression()
+    assert date_expression["operator"] == expected_operator
+    assert list(date_expression["values"][1:]) == expected_values
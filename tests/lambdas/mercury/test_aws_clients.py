@@ -0,0 +1,50 @@
+import threading
+
+import app
+
+
+def test_get_aws_client_creates_each_client_once(mocker, monkeypatch):
+    # GIVEN
+    monkeypatch.setattr(app, "_aws_clients", {})
+    boto3_client = mocker.patch('boto3.client', side_effect=lambda service, **kwargs: object())
+    clients = []
+
+    # WHEN
+    threads = [threading.Thread(target=lambda: clients.append(app.get_aws_client('s3'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    other = app.get_aws_client('s3', region_name='eu-west-1')
+
+    # THEN
+    assert len(set(map(id, clients))) == 1
+    assert other is not clients[0]
+    assert boto3_client.call_count == 2
+
+
+def test_get_dynamodb_resource_is_reused(mocker, monkeypatch):
+    # GIVEN
+    monkeypatch.setattr(app, "_aws_clients", {})
+    boto3_resource = mocker.patch('boto3.resource', side_effect=lambda service, **kwargs: object())
+
+    # WHEN
+    first = app.get_dynamodb_resource()
+    second = app.get_dynamodb_resource()
+
+    # THEN
+    assert first is second
+    boto3_resource.assert_called_once()
+
+
+def test_get_dynamodb_resource_uses_the_configured_endpoint(mocker, monkeypatch):
+    # GIVEN
+    monkeypatch.setattr(app, "_aws_clients", {})
+    monkeypatch.setattr(app, "AWS_DYNAMODB_ENDPOINT", "http://127.0.0.1:8901")
+    boto3_resource = mocker.patch('boto3.resource')
+
+    # WHEN
+    app.get_dynamodb_resource()
+
+    # THEN
+    assert boto3_resource.call_args.kwargs["endpoint_url"] == "http://127.0.0.1:8901"
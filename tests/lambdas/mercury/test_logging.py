@@ -0,0 +1,94 @@
+import io
+import logging
+import threading
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def fresh_logging(monkeypatch):
+    """
+    Logging configured from scratch into a buffer, the listener is stopped afterwards
+    """
+    monkeypatch.setattr(app, "_log_handlers", None)
+    monkeypatch.setattr(app, "_log_listener", None)
+    monkeypatch.setattr(app, "LOG_ASYNC", True)
+    monkeypatch.setattr(app, "LOG_LEVEL", None)
+    stream = io.StringIO()
+    app.configure_logging(stream)
+    yield stream
+    app._log_listener.stop()
+
+
+def test_records_are_written_by_the_listener_thread(fresh_logging):
+    # GIVEN
+    logger = app.get_logger("test_logging.listener")
+    logger.handlers = []
+    logger = app.get_logger("test_logging.listener")
+    writers = []
+    original_emit = app._log_listener.handlers[0].emit
+    app._log_listener.handlers[0].emit = lambda record: writers.append(threading.current_thread()) or \
+        original_emit(record)
+
+    # WHEN
+    logger.info("loaded %d symbols", 3)
+    app.flush_logs()
+
+    # THEN
+    assert "loaded 3 symbols" in fresh_logging.getvalue()
+    assert writers and threading.current_thread() not in writers
+
+
+def test_logging_is_configured_once(fresh_logging, mocker):
+    # GIVEN
+    clear_handlers = mocker.patch("app.clear_handlers")
+    logger = app.get_logger("test_logging.once")
+    logger.handlers = []
+
+    # WHEN
+    first = app.get_logger("test_logging.once")
+    second = app.get_logger("test_logging.once", level=logging.INFO)
+
+    # THEN
+    assert first is second
+    assert len(second.handlers) == 1
+    assert second.level == logging.INFO
+    clear_handlers.assert_not_called()
+
+
+def test_exceptions_are_rendered_on_the_calling_thread(fresh_logging):
+    # GIVEN
+    logger = app.get_logger("test_logging.exception")
+    logger.handlers = []
+    logger = app.get_logger("test_logging.exception")
+
+    # WHEN
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.error("failed", exc_info=True)
+    app.flush_logs()
+
+    # THEN
+    assert "ValueError: boom" in fresh_logging.getvalue()
+
+
+@pytest.mark.parametrize("level, sample_rate, sampled, expected", [
+    (logging.INFO, 1, True, True),
+    (logging.WARNING, 1, False, False),
+    (logging.INFO, 0, True, False),
+    (logging.INFO, 0, False, True),
+])
+def test_should_log(monkeypatch, level, sample_rate, sampled, expected):
+    # GIVEN
+    monkeypatch.setattr(app, "LOG_SAMPLE_RATE", sample_rate)
+    logger = logging.getLogger("test_logging.should_log")
+    logger.setLevel(level)
+
+    # WHEN
+    result = app.should_log(logger, logging.INFO, sampled)
+
+    # THEN
+    assert result == expected
@@ -0,0 +1,78 @@
+import io
+import json
+from unittest.mock import MagicMock
+
+from app import metrics
+
+
+def test_metrics_are_buffered_until_flushed():
+    # GIVEN
+    sink = metrics.InMemorySink()
+    buffered = metrics.Metrics(sink, max_buffer=3)
+
+    # WHEN
+    buffered.record("iex", "Batch fetch time", 10, "Milliseconds")
+    buffered.record("iex", "Batch fetch time", 20, "Milliseconds")
+    before_flush = sink.values("Batch fetch time")
+    buffered.flush()
+
+    # THEN
+    assert before_flush == []
+    assert sink.values("Batch fetch time") == [10, 20]
+
+
+def test_emf_sink_groups_values_per_metric():
+    # GIVEN
+    stream = io.StringIO()
+    buffered = metrics.Metrics(metrics.EmfSink(stream))
+
+    # WHEN
+    for value in (1, 2, 3):
+        buffered.record("iex", "Batch write time", value, "Milliseconds", {"Module Name": "store"})
+    buffered.record("iex", "Running time", 7, "Milliseconds", {"Module Name": "store"})
+    buffered.flush()
+
+    # THEN
+    documents = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert len(documents) == 1
+    assert documents[0]["Batch write time"] == [1, 2, 3]
+    assert documents[0]["Running time"] == 7
+    assert documents[0]["Module Name"] == "store"
+    assert documents[0]["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["Module Name"]]
+
+
+def test_cloudwatch_sink_sends_batches_in_background():
+    # GIVEN
+    client = MagicMock()
+    buffered = metrics.Metrics(metrics.CloudWatchSink(client), max_buffer=1000)
+
+    # WHEN
+    for value in range(45):
+        buffered.record("iex", "Batch fetch time", value, "Milliseconds")
+    buffered.flush(wait=True)
+
+    # THEN
+    assert [len(call.kwargs["MetricData"]) for call in client.put_metric_data.call_args_list] == [20, 20, 5]
+
+
+def test_publish_running_time_metric_records_without_api_calls(mocker, monkeypatch):
+    # GIVEN
+    from datawell.decorators import publish_running_time_metric
+    monkeypatch.setattr(metrics, "_metrics", None)
+    boto3_client = mocker.patch('boto3.client')
+    sink = metrics.InMemorySink()
+    metrics.configure(sink)
+
+    @publish_running_time_metric('iex', 'load')
+    def load():
+        return 42
+
+    # WHEN
+    result = load()
+    metrics.get_metrics().flush()
+
+    # THEN
+    assert result == 42
+    assert len(sink.values("Running time")) == 1
+    assert sink.data[0].dimensions == {"Module Name": "load"}
+    boto3_client.assert_not_called()
@@ -0,0 +1,63 @@
+import logging
+import threading
+
+from app.tracing import Histogram, Tracer
+
+
+def test_histogram_percentiles():
+    # GIVEN
+    histogram = Histogram()
+
+    # WHEN
+    for value in range(1, 101):
+        histogram.add(value)
+
+    # THEN
+    summary = histogram.summary()
+    assert (summary["p50_ms"], summary["p95_ms"], summary["p99_ms"], summary["max_ms"]) == (50, 95, 99, 100)
+    assert summary["count"] == 100
+
+
+def test_spans_nest_per_thread_under_the_run():
+    # GIVEN
+    tracer = Tracer()
+
+    def batch():
+        with tracer.span("batch"):
+            with tracer.span("http"):
+                tracer.count("bytes", 10)
+
+    # WHEN
+    with tracer.span("run"):
+        workers = [threading.Thread(target=batch) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        with tracer.span("clean"):
+            pass
+
+    # THEN
+    summary = tracer.summary()
+    assert {path: stats["count"] for path, stats in summary["spans"].items()} == {
+        "run": 1, "run/batch": 4, "run/batch/http": 4, "run/clean": 1}
+    assert summary["counters"] == {"bytes": 40}
+
+
+def test_log_summary_emits_one_record_and_resets(caplog):
+    # GIVEN
+    tracer = Tracer()
+    with tracer.span("run"):
+        tracer.count("retries")
+    logger = logging.getLogger("test_tracing")
+    logger.propagate = True
+
+    # WHEN
+    with caplog.at_level(logging.INFO, logger="test_tracing"):
+        summary = tracer.log_summary(logger)
+
+    # THEN
+    assert len(caplog.records) == 1
+    assert caplog.records[0].message_info == summary
+    assert summary["counters"] == {"retries": 1}
+    assert tracer.summary()["spans"] == {}
@@ -0,0 +1,60 @@
+from decimal import Decimal
+
+import app
+from app.util.DictUtils import DictUtils
+
+
+def test_clean_document_descends_into_lists_in_place():
+    # ARRANGE:
+    document = {
+        "symbol": "AAPL",
+        "financials": {"financials": [{"revenue": 1.5, "notes": "", "ratios": {"pe": None}}, {"notes": ""},
+                                      {"cash": 2}]},
+        "news": [{"headline": ""}, {}],
+        "tags": ("", "tech"),
+        "empty": {"nested": {"key": [], "other": ()}},
+        "zero": 0,
+        "flag": False,
+    }
+
+    # ACT:
+    cleaned = DictUtils.clean_document(document)
+
+    # ASSERT:
+    assert cleaned is document
+    assert cleaned == {
+        "symbol": "AAPL",
+        "financials": {"financials": [{"revenue": Decimal("1.5")}, {"cash": 2}]},
+        "tags": ["", "tech"],
+        "zero": 0,
+        "flag": False,
+    }
+
+
+def test_clean_documents_keeps_documents_with_required_keys():
+    # ARRANGE:
+    documents = [{"symbol": "AAPL", "date": "2020-06-01"}, {"symbol": "", "date": "2020-06-01"}, None, "AAPL"]
+
+    # ACT:
+    cleaned = DictUtils.clean_documents(documents, required_keys=("symbol", "date"))
+
+    # ASSERT:
+    assert cleaned == [{"symbol": "AAPL", "date": "2020-06-01"}]
+
+
+def test_remove_empty_strings_still_returns_results():
+    # ACT:
+    results = DictUtils.remove_empty_strings({"a": "", "b": {"c": None}, "d": 1})
+
+    # ASSERT:
+    assert results.ActionStatus == app.ActionStatus.SUCCESS
+    assert results.Results == {"d": 1}
+
+
+def test_remove_empty_strings_keeps_floats_and_tuples():
+    # ACT:
+    results = DictUtils.remove_empty_strings({"price": 1.5, "tags": ("", "tech"), "empty": (), "news": [{"a": ""}]})
+
+    # ASSERT:
+    assert results.Results == {"price": 1.5, "tags": ("", "tech")}
+    assert type(results.Results["price"]) is float
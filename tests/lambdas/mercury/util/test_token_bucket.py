@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from app.util.TokenBucket import TokenBucket
+
+
+def test_acquire_within_capacity_does_not_wait():
+    # ARRANGE:
+    bucket = TokenBucket(rate=10, capacity=5)
+
+    # ACT:
+    waits = [bucket.acquire() for _ in range(5)]
+
+    # ASSERT:
+    assert waits == [0, 0, 0, 0, 0]
+
+
+def test_acquire_over_capacity_waits_for_refill(mocker):
+    # ARRANGE:
+    mock_sleep = mocker.patch('time.sleep')
+    bucket = TokenBucket(rate=10, capacity=5)
+    bucket.acquire(5)
+
+    # ACT:
+    wait = bucket.acquire(2)
+
+    # ASSERT:
+    assert wait == pytest.approx(0.2, abs=0.01)
+    mock_sleep.assert_called_once()
+
+
+def test_consume_settles_reservation():
+    # ARRANGE:
+    bucket = TokenBucket(rate=1000, capacity=10)
+    bucket.acquire(10)
+    time.sleep(0.001)
+
+    # ACT:
+    bucket.consume(-10)
+
+    # ASSERT:
+    assert bucket.acquire(9) == 0
+
+
+def test_invalid_rate():
+    # ACT / ASSERT:
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)